@@ -1,38 +1,160 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.db.models import Q
+from django.template.response import TemplateResponse
+from django.utils import timezone
 from apps.users.models import CustomUser
 from .models import (
     TechniqueModel, EngineModel, TransmissionModel, DriveAxleModel, 
     SteeringAxleModel, ServiceType, FailureNode, RecoveryMethod,
-    Machine, Maintenance, Complaint
+    Machine, Maintenance, Complaint, Task, Attachment, ArchivedMaintenance, ArchivedComplaint,
+    SlaAlert, DataQualityFinding, UsageForecast, BatchRun, SparePart, SparePartUsage, MachineReassignment,
+    DataPack,
 )
+from .datapack import delete_pack
+from .paginators import EstimatedCountPaginator
+from .reassignment import reassign_machines
+from .services import filter_serial_prefix
+
+
+class AutocompleteListFilter(admin.RelatedFieldListFilter):
+    """
+    Фильтр по внешнему ключу с поиском через admin:autocomplete.
+
+    В отличие от RelatedFieldListFilter не выгружает всю связанную таблицу
+    в боковую панель: в шаблон попадает только выбранное значение.
+    """
+    template = 'admin/service/autocomplete_filter.html'
+
+    def field_choices(self, field, request, model_admin):
+        if not self.lookup_val:
+            return []
+        try:
+            selected = field.remote_field.model._default_manager.filter(pk=self.lookup_val)
+            return [(obj.pk, str(obj)) for obj in selected]
+        except (ValueError, TypeError):
+            return []
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        self.clear_query_string = changelist.get_query_string(remove=[self.lookup_kwarg, self.lookup_kwarg_isnull])
+        self.app_label = self.field.model._meta.app_label
+        self.model_name = self.field.model._meta.model_name
+        self.field_name = self.field.name
+        return super().choices(changelist)
+
+
+class ScalableChangeListMixin:
+    """Общие настройки списков для больших таблиц: оценка COUNT и виджеты select2 для фильтров."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+    @property
+    def media(self):
+        return super().media + AutocompleteSelect(None, self.admin_site).media
+
+
+class CatalogAdmin(admin.ModelAdmin):
+    search_fields = ('name',)
+
 
 # --- Справочники ---
-admin.site.register(TechniqueModel)
-admin.site.register(EngineModel)
-admin.site.register(TransmissionModel)
-admin.site.register(DriveAxleModel)
-admin.site.register(SteeringAxleModel)
-admin.site.register(ServiceType)
-admin.site.register(FailureNode)
-admin.site.register(RecoveryMethod)
+admin.site.register(TechniqueModel, CatalogAdmin)
+admin.site.register(EngineModel, CatalogAdmin)
+admin.site.register(TransmissionModel, CatalogAdmin)
+admin.site.register(DriveAxleModel, CatalogAdmin)
+admin.site.register(SteeringAxleModel, CatalogAdmin)
+admin.site.register(ServiceType, CatalogAdmin)
+admin.site.register(FailureNode, CatalogAdmin)
+admin.site.register(RecoveryMethod, CatalogAdmin)
+
+
+@admin.register(SparePart)
+class SparePartAdmin(CatalogAdmin):
+    list_display = ('name', 'aliases')
+    search_fields = ('name', 'aliases')
 
 # --- Основные сущности ---
 
+class ReassignMachinesForm(forms.Form):
+    client = forms.ModelChoiceField(
+        CustomUser.objects.filter(role=CustomUser.CLIENT), required=False, label='Новый клиент'
+    )
+    service_company = forms.ModelChoiceField(
+        CustomUser.objects.filter(role=CustomUser.SERVICE), required=False, label='Новая сервисная компания'
+    )
+
+    def __init__(self, *args, admin_site, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Автодополнение админки по полям машины (роль ограничивает CustomUserAdmin.get_search_results)
+        for name, field in self.fields.items():
+            field.widget = AutocompleteSelect(Machine._meta.get_field(name), admin_site)
+            field.widget.choices = field.choices
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('client') and not cleaned_data.get('service_company'):
+            raise forms.ValidationError('Укажите нового клиента или новую сервисную компанию.')
+        return cleaned_data
+
+
 @admin.register(Machine)
-class MachineAdmin(admin.ModelAdmin):
+class MachineAdmin(ScalableChangeListMixin, admin.ModelAdmin):
     list_display = ('serial_number', 'technique_model', 'engine_model', 'client', 'service_company', 'formatted_date_shipment')
     list_display_links = ('serial_number',)
+    list_select_related = ('technique_model', 'engine_model', 'client', 'service_company')
     list_filter = (
         'technique_model', 
         'engine_model', 
         'transmission_model', 
         'drive_axle_model', 
         'steering_axle_model',
-        'client',
-        'service_company'
+        ('client', AutocompleteListFilter),
+        ('service_company', AutocompleteListFilter),
+    )
+    autocomplete_fields = (
+        'technique_model', 'engine_model', 'transmission_model',
+        'drive_axle_model', 'steering_axle_model', 'client', 'service_company',
     )
     
     search_fields = ('serial_number',)
+    search_help_text = 'Поиск по началу заводского номера'
+    actions = ['reassign']
+
+    def get_search_results(self, request, queryset, search_term):
+        return filter_serial_prefix(queryset, search_term), False
+
+    @admin.action(description='Передать другому клиенту или сервисной компании', permissions=['change'])
+    def reassign(self, request, queryset):
+        """Массовая передача выбранных машин: пачки UPDATE вместо сохранения формы каждой машины."""
+        form = ReassignMachinesForm(request.POST if 'apply' in request.POST else None, admin_site=self.admin_site)
+        if form.is_valid():
+            _, moved, batches = reassign_machines(
+                queryset.values_list('pk', flat=True),
+                client=form.cleaned_data['client'],
+                service_company=form.cleaned_data['service_company'],
+                user=request.user,
+                source=MachineReassignment.ADMIN,
+            )
+            self.message_user(request, f'Передано машин: {moved} (пачек: {batches}).', messages.SUCCESS)
+            return None
+        select_across = request.POST.get('select_across') == '1'
+        return TemplateResponse(request, 'admin/service/machine/reassign.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Передача машин',
+            'form': form,
+            'media': self.media + form.media,
+            'count': queryset.count(),
+            'select_across': select_across,
+            'selected': [] if select_across else request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        })
     
     def formatted_date_shipment(self, obj):
         return obj.date_shipment.strftime('%d-%m-%Y') if obj.date_shipment else '-'
@@ -49,10 +171,24 @@ class MachineAdmin(admin.ModelAdmin):
 
 
 @admin.register(Maintenance)
-class MaintenanceAdmin(admin.ModelAdmin):
+class MaintenanceAdmin(ScalableChangeListMixin, admin.ModelAdmin):
     list_display = ('machine', 'service_type', 'formatted_event_date', 'operating_hours', 'service_company', 'formatted_order_date')
-    list_filter = ('service_type', 'machine', 'service_company')
+    list_select_related = ('machine', 'service_type', 'service_company')
+    list_filter = (
+        'service_type',
+        ('machine', AutocompleteListFilter),
+        ('service_company', AutocompleteListFilter),
+    )
+    autocomplete_fields = ('machine', 'service_type', 'service_company')
     search_fields = ('order_number', 'machine__serial_number') 
+    search_help_text = 'Поиск по началу заводского номера или точному № заказ-наряда'
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        machines = filter_serial_prefix(Machine.objects.all(), search_term).values('pk')
+        return queryset.filter(Q(machine__in=machines) | Q(order_number=search_term)), False
     
     
     def formatted_event_date(self, obj):
@@ -67,10 +203,23 @@ class MaintenanceAdmin(admin.ModelAdmin):
 
 
 @admin.register(Complaint)
-class ComplaintAdmin(admin.ModelAdmin):
+class ComplaintAdmin(ScalableChangeListMixin, admin.ModelAdmin):
     list_display = ('machine', 'failure_node', 'formatted_failure_date', 'formatted_recovery_date', 'downtime', 'service_company')
-    list_filter = ('failure_node', 'recovery_method', 'service_company')
+    list_select_related = ('machine', 'failure_node', 'service_company')
+    list_filter = (
+        'failure_node',
+        'recovery_method',
+        ('service_company', AutocompleteListFilter),
+    )
+    autocomplete_fields = ('machine', 'failure_node', 'recovery_method', 'service_company')
     search_fields = ('machine__serial_number',)
+    search_help_text = 'Поиск по началу заводского номера'
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        machines = filter_serial_prefix(Machine.objects.all(), search_term).values('pk')
+        return queryset.filter(machine__in=machines), False
     
     def formatted_failure_date(self, obj):
         return obj.failure_date.strftime('%d-%m-%Y') if obj.failure_date else '-'
@@ -81,3 +230,167 @@ class ComplaintAdmin(admin.ModelAdmin):
         return obj.recovery_date.strftime('%d-%m-%Y') if obj.recovery_date else '-'
     formatted_recovery_date.short_description = 'Дата восстановления'
     formatted_recovery_date.admin_order_field = 'recovery_date'
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'run_at', 'created_at', 'finished_at')
+    list_filter = ('status', 'name')
+    search_fields = ('dedup_key',)
+    readonly_fields = ('locked_by', 'locked_at', 'last_error', 'created_at', 'finished_at')
+    actions = ['retry_tasks']
+
+    @admin.action(description='Повторить выбранные задачи')
+    def retry_tasks(self, request, queryset):
+        updated = queryset.exclude(status=Task.RUNNING).update(
+            status=Task.PENDING, attempts=0, run_at=timezone.now(), locked_by='', finished_at=None
+        )
+        self.message_user(request, f'Поставлено в очередь: {updated}')
+
+
+@admin.register(Attachment)
+class AttachmentAdmin(admin.ModelAdmin):
+    list_display = ('id', 'original_name', 'size', 'preview_status', 'complaint', 'maintenance', 'created_at')
+    list_filter = ('preview_status',)
+    search_fields = ('original_name', 'sha256')
+    raw_id_fields = ('complaint', 'maintenance', 'uploaded_by')
+    readonly_fields = ('file', 'sha256', 'size', 'content_type', 'created_at')
+
+
+class ArchiveAdmin(admin.ModelAdmin):
+    """Архив только для просмотра: записи попадают туда командой archive_records."""
+    list_select_related = ('machine',)
+    raw_id_fields = ('machine',)
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedMaintenance)
+class ArchivedMaintenanceAdmin(ArchiveAdmin):
+    list_display = ('id', 'machine', 'event_date', 'order_number', 'archived_at')
+    date_hierarchy = 'event_date'
+
+
+@admin.register(ArchivedComplaint)
+class ArchivedComplaintAdmin(ArchiveAdmin):
+    list_display = ('id', 'machine', 'failure_date', 'recovery_date', 'archived_at')
+    date_hierarchy = 'failure_date'
+
+
+@admin.register(SlaAlert)
+class SlaAlertAdmin(admin.ModelAdmin):
+    """Нарушения открывает и закрывает проверка порогов (задача evaluate_sla)."""
+    list_display = ('service_company', 'metric', 'value', 'threshold', 'created_at', 'resolved_at')
+    list_filter = ('metric', ('resolved_at', admin.EmptyFieldListFilter))
+    list_select_related = ('service_company',)
+    readonly_fields = ('service_company', 'metric', 'value', 'threshold', 'created_at', 'resolved_at')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(DataQualityFinding)
+class DataQualityFindingAdmin(ScalableChangeListMixin, admin.ModelAdmin):
+    """Находки заменяет команда scan_data_quality; исправляются сами ТО и рекламации."""
+    list_display = ('machine', 'kind', 'record_type', 'object_id', 'record_date', 'details')
+    list_filter = ('kind', 'record_type')
+    list_select_related = ('machine',)
+    date_hierarchy = 'record_date'
+    raw_id_fields = ('machine',)
+    search_fields = ('machine__serial_number',)
+    search_help_text = 'Поиск по началу заводского номера'
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        machines = filter_serial_prefix(Machine.objects.all(), search_term).values('pk')
+        return queryset.filter(machine__in=machines), False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(UsageForecast)
+class UsageForecastAdmin(ScalableChangeListMixin, admin.ModelAdmin):
+    """Темпы пересчитывает команда fit_usage_forecasts."""
+    list_display = ('machine', 'rate', 'readings', 'last_reading_date', 'last_reading_hours', 'projected_hours', 'fitted_at')
+    list_select_related = ('machine',)
+    list_filter = ('machine__technique_model',)
+    raw_id_fields = ('machine',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(BatchRun)
+class BatchRunAdmin(admin.ModelAdmin):
+    list_display = ('name', 'started_at', 'finished_at', 'stats')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SparePartUsage)
+class SparePartUsageAdmin(ScalableChangeListMixin, admin.ModelAdmin):
+    """Журнал ведется по тексту рекламаций; нераспознанные фрагменты - кандидаты в справочник запчастей."""
+    list_display = ('complaint_id', 'raw', 'part', 'quantity', 'failure_date', 'service_company')
+    list_filter = (('part', admin.EmptyFieldListFilter), ('part', AutocompleteListFilter))
+    list_select_related = ('part', 'service_company')
+    search_fields = ('raw',)
+    date_hierarchy = 'failure_date'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(MachineReassignment)
+class MachineReassignmentAdmin(admin.ModelAdmin):
+    """Журнал массовых передач машин: запись на пачку с прежними владельцами."""
+    list_display = ('operation', 'created_at', 'user', 'source', 'client', 'service_company', 'machines')
+    list_filter = ('source',)
+    list_select_related = ('user', 'client', 'service_company')
+    search_fields = ('operation',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DataPack)
+class DataPackAdmin(admin.ModelAdmin):
+    """Пакеты данных для работы без связи; собираются фоновой задачей, вручную не меняются."""
+    list_display = ('scope_key', 'user', 'version_key', 'size', 'built_at', 'requested_at')
+    list_select_related = ('user',)
+    search_fields = ('scope_key',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def delete_model(self, request, obj):
+        delete_pack(obj)
+
+    def delete_queryset(self, request, queryset):
+        for pack in queryset:
+            delete_pack(pack)
@@ -0,0 +1,132 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField, Exists, OuterRef, Value
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import versioning
+from .models import ArchivedComplaint, ArchivedMaintenance, Attachment, Complaint, Maintenance
+
+# Горячая модель -> (архивная модель, поле даты, по которому идет архивация, метка версии данных)
+TIERS = {
+    Maintenance: (ArchivedMaintenance, 'event_date', versioning.MAINTENANCE),
+    Complaint: (ArchivedComplaint, 'failure_date', versioning.COMPLAINT),
+}
+
+# Параметры фильтров с датами (начало, конец): запрос доходит до архива, если диапазон начинается раньше
+# горизонта или не ограничен снизу при заданном конце. Дата восстановления не раньше даты отказа,
+# поэтому ее границы тоже указывают на архив.
+DATE_PARAMS = {
+    Maintenance: (('event_date_after', 'event_date_before'),),
+    Complaint: (('failure_date_after', 'failure_date_before'), ('recovery_date_after', 'recovery_date_before')),
+}
+
+_archiving = ContextVar('archiving', default=False)
+
+
+@contextmanager
+def archiving():
+    """Перенос в архив: удаление из горячей таблицы не считается удалением записи (см. signals.py)."""
+    token = _archiving.set(True)
+    try:
+        yield
+    finally:
+        _archiving.reset(token)
+
+
+def is_archiving():
+    return _archiving.get()
+
+
+def get_archive_cutoff(today=None):
+    """Первый день самого раннего года, который остается в горячих таблицах."""
+    today = today or timezone.localdate()
+    return date(today.year - settings.ARCHIVE_KEEP_YEARS, 1, 1)
+
+
+def _parse_date(value):
+    try:
+        return parse_date(value or '')
+    except ValueError:
+        return None
+
+
+def reaches_archive(model, params):
+    """Запрошенный диапазон дат начинается раньше горизонта архивации или не ограничен снизу."""
+    cutoff = get_archive_cutoff()
+    for after, before in DATE_PARAMS[model]:
+        start, end = _parse_date(params.get(after)), _parse_date(params.get(before))
+        if start is not None and start < cutoff:
+            return True
+        if start is None and end is not None:
+            return True
+    return False
+
+
+def has_archived_maintenance(machine, event_date, service_type):
+    """
+    Такое ТО (машина + дата + вид) уже есть в архиве. Ограничение unique_maintenance_event действует
+    только в горячей таблице, поэтому формы и API проверяют архив сами.
+    """
+    if machine is None or event_date is None or service_type is None:
+        return False
+    return ArchivedMaintenance.objects.filter(machine=machine, event_date=event_date, service_type=service_type).exists()
+
+
+def union_tiers(querysets, ordering):
+    """
+    Одна выборка по горячей таблице и архиву (UNION ALL) с сортировкой и срезами для пагинации.
+
+    Записи архива возвращаются экземплярами горячей модели с archived=True.
+    """
+    if len(querysets) == 1:
+        return querysets[0]
+    fields = [field.attname for field in querysets[0].model._meta.concrete_fields]
+    hot, *archives = [
+        queryset.order_by().only(*fields).annotate(archived=Value(index > 0, BooleanField()))
+        for index, queryset in enumerate(querysets)
+    ]
+    return hot.union(*archives, all=True).order_by(*ordering)
+
+
+def archive_batch(model, cutoff, batch_size=None, using='default'):
+    """
+    Переносит в архив одну пачку самых старых записей с датой раньше cutoff; возвращает их число.
+
+    Каждая пачка - отдельная транзакция: прерванный перенос продолжается повторным запуском.
+    Записи с вложениями остаются в горячей таблице (вложения ссылаются на нее).
+    """
+    archive_model, date_field, label = TIERS[model]
+    fields = [field.attname for field in model._meta.concrete_fields]
+    has_attachments = Exists(Attachment.objects.filter(**{model._meta.model_name: OuterRef('pk')}))
+    with transaction.atomic(using=using):
+        rows = list(
+            model.objects.using(using)
+            .filter(**{f'{date_field}__lt': cutoff})
+            .exclude(has_attachments)
+            .order_by(date_field, 'pk')
+            .values(*fields)[:batch_size or settings.ARCHIVE_BATCH_SIZE]
+        )
+        if not rows:
+            return 0
+        archive_model.objects.using(using).bulk_create(
+            [archive_model(**row) for row in rows], ignore_conflicts=True
+        )
+        with archiving():
+            model.objects.using(using).filter(pk__in=[row['id'] for row in rows]).delete()
+        versioning.bump_data_version(label, using=using)
+        # Записи остаются в пакетах данных, но с отметкой архива
+        from . import datapack  # datapack.py импортирует этот модуль через services.py
+        datapack.mark_stale(datapack.get_machine_scope_keys({row['machine_id'] for row in rows}, using=using),
+                            using=using)
+    return len(rows)
+
+
+def count_archivable(model, cutoff, using='default'):
+    _, date_field, _ = TIERS[model]
+    has_attachments = Exists(Attachment.objects.filter(**{model._meta.model_name: OuterRef('pk')}))
+    return model.objects.using(using).filter(**{f'{date_field}__lt': cutoff}).exclude(has_attachments).count()
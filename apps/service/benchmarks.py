@@ -0,0 +1,128 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from django.db import transaction
+
+from apps.users.models import CustomUser
+from .models import (
+    Complaint,
+    DriveAxleModel,
+    EngineModel,
+    FailureNode,
+    Machine,
+    Maintenance,
+    RecoveryMethod,
+    ServiceType,
+    SteeringAxleModel,
+    TechniqueModel,
+    TransmissionModel,
+)
+
+BATCH_SIZE = 5000
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rollback_afterwards(using='default'):
+    """Синтетические данные бенчмарка живут только внутри транзакции и откатываются в конце."""
+    try:
+        with transaction.atomic(using=using):
+            yield
+            raise Rollback
+    except Rollback:
+        pass
+
+
+@contextmanager
+def timer(results, name):
+    started = time.perf_counter()
+    yield
+    results[name] = time.perf_counter() - started
+
+
+def seed_fleet(machines=1000, events_per_machine=2, clients=200, service_companies=20, seed=0, using='default'):
+    """
+    Наполняет базу синтетическим парком машин с ТО и рекламациями через bulk_create.
+
+    Возвращает словарь с количеством созданных записей.
+    """
+    rnd = random.Random(seed)
+    catalogs = {}
+    for model in (TechniqueModel, EngineModel, TransmissionModel, DriveAxleModel, SteeringAxleModel,
+                  ServiceType, FailureNode, RecoveryMethod):
+        catalogs[model] = model.objects.using(using).bulk_create(
+            [model(name=f'bench {model.__name__} {i}') for i in range(10)]
+        )
+    users = CustomUser.objects.using(using).bulk_create(
+        [CustomUser(username=f'bench-client-{i}', role=CustomUser.CLIENT, name=f'Клиент {i}', password='!')
+         for i in range(clients)]
+        + [CustomUser(username=f'bench-service-{i}', role=CustomUser.SERVICE, name=f'Сервис {i}', password='!')
+           for i in range(service_companies)]
+    )
+    client_users, service_users = users[:clients], users[clients:]
+
+    start = date(2015, 1, 1)
+    machine_objs = []
+    for i in range(machines):
+        machine_objs.append(Machine(
+            serial_number=f'B{i:08d}',
+            technique_model=rnd.choice(catalogs[TechniqueModel]),
+            engine_model=rnd.choice(catalogs[EngineModel]),
+            engine_serial=f'E{i}',
+            transmission_model=rnd.choice(catalogs[TransmissionModel]),
+            transmission_serial=f'T{i}',
+            drive_axle_model=rnd.choice(catalogs[DriveAxleModel]),
+            drive_axle_serial=f'D{i}',
+            steering_axle_model=rnd.choice(catalogs[SteeringAxleModel]),
+            steering_axle_serial=f'S{i}',
+            date_shipment=start + timedelta(days=rnd.randrange(3000)),
+            consignee='bench',
+            delivery_address='bench',
+            client=rnd.choice(client_users),
+            service_company=rnd.choice(service_users),
+        ))
+    machine_objs = Machine.objects.using(using).bulk_create(machine_objs, batch_size=BATCH_SIZE)
+
+    maintenances, complaints = [], []
+    for machine in machine_objs:
+        for j in range(events_per_machine):
+            event_date = machine.date_shipment + timedelta(days=30 * (j + 1))
+            maintenances.append(Maintenance(
+                machine=machine,
+                service_type=catalogs[ServiceType][j % 10],
+                event_date=event_date,
+                operating_hours=100 * (j + 1),
+                order_number=f'{machine.serial_number}-{j}',
+                order_date=event_date,
+                service_company=machine.service_company,
+            ))
+            failure_date = event_date + timedelta(days=rnd.randrange(1, 20))
+            recovery_date = failure_date + timedelta(days=rnd.randrange(0, 10))
+            complaints.append(Complaint(
+                machine=machine,
+                failure_date=failure_date,
+                operating_hours=100 * (j + 1) + 50,
+                failure_node=rnd.choice(catalogs[FailureNode]),
+                failure_description='bench',
+                recovery_method=rnd.choice(catalogs[RecoveryMethod]),
+                recovery_date=recovery_date,
+                downtime=(recovery_date - failure_date).days,
+                service_company=machine.service_company,
+            ))
+        if len(maintenances) >= BATCH_SIZE:
+            Maintenance.objects.using(using).bulk_create(maintenances, batch_size=BATCH_SIZE)
+            Complaint.objects.using(using).bulk_create(complaints, batch_size=BATCH_SIZE)
+            maintenances, complaints = [], []
+    Maintenance.objects.using(using).bulk_create(maintenances, batch_size=BATCH_SIZE)
+    Complaint.objects.using(using).bulk_create(complaints, batch_size=BATCH_SIZE)
+
+    return {
+        'machines': machines,
+        'maintenances': machines * events_per_machine,
+        'complaints': machines * events_per_machine,
+    }
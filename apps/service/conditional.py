@@ -0,0 +1,74 @@
+import hashlib
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+from . import versioning
+from .scope import get_role_scope
+
+
+@lru_cache(maxsize=None)
+def get_release_key():
+    """
+    Версия кода и шаблонов для ETag: после выкладки старые ETag перестают совпадать.
+
+    Берется из RELEASE, иначе - по времени изменения последнего файла проекта
+    (одинаково во всех воркерах одной выкладки).
+    """
+    if settings.RELEASE:
+        return settings.RELEASE
+    roots = [settings.BASE_DIR / 'apps', settings.BASE_DIR / 'config', *settings.TEMPLATES[0]['DIRS']]
+    newest = max(
+        (path.stat().st_mtime_ns for root in roots for path in root.rglob('*') if path.suffix in ('.py', '.html')),
+        default=0,
+    )
+    return f'{newest:x}'
+
+
+def get_etag(request, labels):
+    """
+    Строгий ETag ответа без его построения.
+
+    Ответ однозначно определяется версиями данных, пользователем (роль и область
+    видимости входят в версию user), сессией и запросом, поэтому совпадающий ETag означает,
+    что у клиента актуальная копия. CSRF-токен и ключ сессии входят в ETag, потому что
+    страницы с формами выводят токен: после повторного входа старая копия отправила бы
+    устаревший токен и получила 403.
+    """
+    versions = versioning.get_data_versions(*labels)
+    user = request.user
+    session = getattr(request, 'session', None)
+    parts = [
+        get_release_key(),
+        request.path,
+        sorted(request.GET.lists()),
+        request.META.get('HTTP_ACCEPT', ''),
+        user.pk,
+        get_role_scope(user).key,
+        versioning.format_version_key(versions, labels),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+        session.session_key if session is not None else None,
+    ]
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def conditional_get(request, labels, get_response):
+    """
+    304 Not Modified до выполнения запросов к данным, если ETag клиента еще актуален.
+
+    Last-Modified не отправляется: у него секундная точность, и клиент, проверяющий только
+    If-Modified-Since, пропускал бы записи, сделанные в ту же секунду.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return get_response()
+    etag = get_etag(request, labels)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = get_response()
+    if response.status_code in (200, 304):
+        response.headers.setdefault('ETag', etag)
+        # Браузер хранит копию, но перед показом каждый раз сверяет ETag
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,7 @@
+from django.utils.functional import SimpleLazyObject
+
+from .scope import get_role_scope
+
+
+def role_scope(request):
+    return {'role_scope': SimpleLazyObject(lambda: get_role_scope(request.user))}
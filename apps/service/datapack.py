@@ -0,0 +1,352 @@
+import gzip
+import hashlib
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+from datetime import date, timedelta
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.users.models import CustomUser, OrganizationClosure
+from . import versioning
+from .models import DataPack, Machine
+from .scope import RoleScope, get_role_scope
+from .services import (
+    CATALOG_MODELS,
+    get_archived_complaints_in_scope,
+    get_archived_maintenances_in_scope,
+    get_complaints_in_scope,
+    get_machines_in_scope,
+    get_maintenances_in_scope,
+)
+from .taskqueue import enqueue
+
+logger = logging.getLogger(__name__)
+
+# Версии данных, от которых зависит содержимое пакета
+DATA_PACK_LABELS = (
+    versioning.MACHINE, versioning.MAINTENANCE, versioning.COMPLAINT, versioning.CATALOG, versioning.USER,
+)
+FORMAT_VERSION = 1
+CHUNK_SIZE = 2000
+
+MACHINE_FIELDS = (
+    'id', 'serial_number', 'technique_model_id', 'engine_model_id', 'engine_serial',
+    'transmission_model_id', 'transmission_serial', 'drive_axle_model_id', 'drive_axle_serial',
+    'steering_axle_model_id', 'steering_axle_serial', 'supply_contract', 'date_shipment', 'consignee',
+    'delivery_address', 'equipment', 'client_id', 'service_company_id',
+)
+MAINTENANCE_FIELDS = (
+    'id', 'machine_id', 'service_type_id', 'event_date', 'operating_hours', 'order_number', 'order_date',
+    'service_company_id',
+)
+COMPLAINT_FIELDS = (
+    'id', 'machine_id', 'failure_date', 'operating_hours', 'failure_node_id', 'failure_description',
+    'recovery_method_id', 'spare_parts', 'recovery_date', 'downtime', 'service_company_id',
+)
+
+SCHEMA = f"""
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE machine ({', '.join(MACHINE_FIELDS)});
+CREATE TABLE maintenance ({', '.join(MAINTENANCE_FIELDS)}, archived INTEGER NOT NULL);
+CREATE TABLE complaint ({', '.join(COMPLAINT_FIELDS)}, archived INTEGER NOT NULL);
+CREATE TABLE catalog (catalog TEXT NOT NULL, id INTEGER NOT NULL, name TEXT NOT NULL, description TEXT NOT NULL,
+                      PRIMARY KEY (catalog, id));
+CREATE TABLE company (id INTEGER PRIMARY KEY, name TEXT NOT NULL, role TEXT NOT NULL);
+"""
+# Индексы строятся после вставки: так быстрее, чем обновлять их на каждой строке
+INDEXES = """
+CREATE UNIQUE INDEX machine_id_idx ON machine (id);
+CREATE INDEX machine_serial_idx ON machine (serial_number);
+CREATE INDEX maintenance_machine_idx ON maintenance (machine_id, event_date);
+CREATE INDEX complaint_machine_idx ON complaint (machine_id, failure_date);
+"""
+
+
+def get_etag(pack):
+    return '"{}"'.format(hashlib.sha256(f'{pack.scope_key}|{pack.version_key}'.encode()).hexdigest()[:32])
+
+
+def is_stale(pack):
+    """После сборки менялись данные области видимости пакета."""
+    return pack.changes > pack.built_changes
+
+
+def is_shrunk(pack):
+    """После сборки область сузилась (машины переданы, иерархия изменилась): в файле есть чужие данные."""
+    return pack.shrunk_changes > pack.built_changes
+
+
+def get_scope_keys(owners, using='default'):
+    """
+    Ключи пакетов, в которые попадают машины учетных записей owners - пар (роль, id): клиента машины
+    (RoleScope.CLIENT) или ее сервисной компании (RoleScope.SERVICE). Это пакет менеджеров, пакеты самих
+    учетных записей и пакеты их организаций со всеми головными (строки замыкания с descendant).
+    """
+    owners = {(kind, pk) for kind, pk in owners if pk is not None}
+    keys = {RoleScope.ALL} | {f'{kind}:{pk}' for kind, pk in owners}
+    organizations = dict(
+        CustomUser.objects.using(using).filter(pk__in={pk for _, pk in owners}, organization__isnull=False)
+        .values_list('pk', 'organization_id')
+    )
+    ancestors = {}
+    rows = OrganizationClosure.objects.using(using).filter(descendant_id__in=set(organizations.values()))
+    for descendant_id, ancestor_id in rows.values_list('descendant_id', 'ancestor_id'):
+        ancestors.setdefault(descendant_id, []).append(ancestor_id)
+    keys.update(
+        f'{kind}:org:{ancestor_id}' for kind, pk in owners for ancestor_id in ancestors.get(organizations.get(pk), ())
+    )
+    return keys
+
+
+def get_owners(client_id, service_company_id):
+    """Учетные записи, по которым машина попадает в области видимости: [(роль, id)]."""
+    return [(RoleScope.CLIENT, client_id), (RoleScope.SERVICE, service_company_id)]
+
+
+def get_machine_scope_keys(machine_ids, using='default'):
+    """Ключи пакетов, в которые попадают машины machine_ids (и их ТО и рекламации)."""
+    rows = Machine.objects.using(using).filter(pk__in=set(machine_ids)).values_list('client_id', 'service_company_id')
+    return get_scope_keys([owner for row in rows for owner in get_owners(*row)], using=using)
+
+
+def _mark(packs, shrunk):
+    changes = {'changes': F('changes') + 1}
+    if shrunk:
+        # В UPDATE правая часть читает значение до изменения: shrunk_changes станет равным новому changes
+        changes['shrunk_changes'] = F('changes') + 1
+    return packs.update(**changes)
+
+
+def mark_stale(scope_keys=None, shrunk=False, using='default'):
+    """
+    Отмечает изменение данных в пакетах scope_keys (None - во всех); пересобираются они при следующем
+    скачивании. shrunk - область сузилась, и до пересборки прежний файл не отдается.
+    """
+    packs = DataPack.objects.using(using)
+    if scope_keys is not None:
+        packs = packs.filter(pk__in=scope_keys)
+    return _mark(packs, shrunk)
+
+
+def mark_organizations_shrunk(using='default'):
+    """Иерархия организаций изменилась: пакеты любой организации могли потерять подразделения."""
+    return _mark(DataPack.objects.using(using).filter(scope_key__contains=':org:'), shrunk=True)
+
+
+def get_path(file_name):
+    return Path(settings.DATA_PACK_ROOT) / file_name
+
+
+def is_ready(pack):
+    return bool(pack.file_name) and get_path(pack.file_name).exists()
+
+
+def _plain(row):
+    return tuple(value.isoformat() if isinstance(value, date) else value for value in row)
+
+
+def _copy(cursor, table, rows, extra=()):
+    """Построчное чтение итератором и вставка пачками по CHUNK_SIZE; возвращает число строк."""
+    rows = iter(rows)
+    count = 0
+    while True:
+        chunk = [_plain(row) + extra for row in islice(rows, CHUNK_SIZE)]
+        if not chunk:
+            return count
+        cursor.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(chunk[0]))})", chunk)
+        count += len(chunk)
+
+
+def _companies(rows, ids, *positions):
+    # Учетные записи из строк запоминаются по ходу копирования, без отдельного запроса по машинам
+    for row in rows:
+        ids.update(row[position] for position in positions)
+        yield row
+
+
+def write_pack(user, path, version_key):
+    """Пишет SQLite-файл пакета в path; возвращает {таблица: строк}."""
+    counts = {}
+    company_ids = set()
+    connection = sqlite3.connect(path)
+    try:
+        cursor = connection.cursor()
+        cursor.executescript('PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF;' + SCHEMA)
+        machines = get_machines_in_scope(user).order_by().values_list(*MACHINE_FIELDS)
+        counts['machine'] = _copy(cursor, 'machine', _companies(
+            machines.iterator(chunk_size=CHUNK_SIZE), company_ids,
+            MACHINE_FIELDS.index('client_id'), MACHINE_FIELDS.index('service_company_id'),
+        ))
+        for table, fields, tiers in (
+            ('maintenance', MAINTENANCE_FIELDS, (get_maintenances_in_scope, get_archived_maintenances_in_scope)),
+            ('complaint', COMPLAINT_FIELDS, (get_complaints_in_scope, get_archived_complaints_in_scope)),
+        ):
+            counts[table] = 0
+            for archived, get_queryset in enumerate(tiers):
+                rows = get_queryset(user).order_by().values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+                counts[table] += _copy(cursor, table, _companies(
+                    rows, company_ids, fields.index('service_company_id')
+                ), extra=(archived,))
+        counts['catalog'] = 0
+        for slug, model in CATALOG_MODELS.items():
+            rows = model.objects.order_by().values_list('pk', 'name', 'description').iterator(chunk_size=CHUNK_SIZE)
+            counts['catalog'] += _copy(cursor, 'catalog', ((slug, *row) for row in rows))
+        counts['company'] = _copy(cursor, 'company', CustomUser.objects.filter(pk__in=company_ids).order_by().values_list(
+            'pk', 'name', 'role'
+        ).iterator(chunk_size=CHUNK_SIZE))
+        cursor.executemany('INSERT INTO meta VALUES (?, ?)', [
+            ('format', str(FORMAT_VERSION)),
+            ('scope', get_role_scope(user).key),
+            ('versions', version_key),
+            ('built_at', timezone.now().isoformat()),
+        ])
+        cursor.executescript(INDEXES)
+        connection.commit()
+    finally:
+        connection.close()
+    return counts
+
+
+def build_pack(pack):
+    """
+    Собирает пакет заново по области видимости pack.user: SQLite во временном файле,
+    сжатие gzip, атомарная замена. Файл пишется вне транзакции; в короткой транзакции
+    запись переключается на новый файл, после фиксации предыдущий удаляется.
+
+    Возвращает число строк по таблицам или None, если область видимости пользователя уже другая.
+    """
+    user = pack.user
+    if get_role_scope(user).key != pack.scope_key:
+        # Пользователь перешел в другую организацию или сменил роль; пакет создаст следующий запрос
+        delete_pack(pack)
+        return None
+    # Счетчик и версии читаются до выборки: изменения во время сборки сделают пакет устаревшим, а не потерянным
+    changes = DataPack.objects.filter(pk=pack.pk).values_list('changes', flat=True).first() or 0
+    version_key = versioning.get_version_key(*DATA_PACK_LABELS)
+    root = Path(settings.DATA_PACK_ROOT)
+    root.mkdir(parents=True, exist_ok=True)
+    slug = re.sub(r'[^a-z0-9]+', '-', pack.scope_key.lower())
+    file_name = f"{slug}-{hashlib.sha256(version_key.encode()).hexdigest()[:12]}.sqlite3.gz"
+
+    descriptor, database = tempfile.mkstemp(suffix='.sqlite3', dir=root)
+    os.close(descriptor)
+    compressed = database + '.gz'
+    try:
+        counts = write_pack(user, database, version_key)
+        with open(database, 'rb') as source, gzip.open(compressed, 'wb') as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        os.replace(compressed, root / file_name)
+    finally:
+        Path(database).unlink(missing_ok=True)
+        Path(compressed).unlink(missing_ok=True)
+
+    pack.version_key = version_key
+    pack.file_name = file_name
+    pack.size = (root / file_name).stat().st_size
+    pack.built_at = timezone.now()
+    pack.built_changes = changes
+    with transaction.atomic():
+        previous = DataPack.objects.select_for_update().filter(pk=pack.pk).values_list('file_name', flat=True).first()
+        if previous is None:
+            # Пакет удалили во время сборки (давно не запрашивали)
+            transaction.on_commit(lambda: get_path(file_name).unlink(missing_ok=True))
+            return None
+        DataPack.objects.filter(pk=pack.pk).update(
+            version_key=version_key, file_name=file_name, size=pack.size, built_at=pack.built_at,
+            built_changes=changes,
+        )
+        if previous and previous != file_name:
+            # Уже начатые скачивания дочитают открытый файл; продолжение по Range получит новый (If-Range)
+            transaction.on_commit(lambda: get_path(previous).unlink(missing_ok=True))
+    return counts
+
+
+def delete_pack(pack):
+    if pack.file_name:
+        get_path(pack.file_name).unlink(missing_ok=True)
+    pack.delete()
+
+
+def request_pack(user):
+    """Пакет области видимости пользователя; запрос продлевает срок его хранения."""
+    scope_key = get_role_scope(user).key
+    pack, created = DataPack.objects.get_or_create(scope_key=scope_key, defaults={'user': user})
+    if not created:
+        DataPack.objects.filter(pk=scope_key).update(user=user, requested_at=timezone.now())
+        pack.user = user
+    return pack
+
+
+def enqueue_build(scope_key=None, using='default'):
+    """Пересборка одного пакета или, без scope_key, всех устаревших."""
+    from . import tasks  # tasks.py импортирует этот модуль
+
+    if scope_key is None:
+        return enqueue(tasks.BUILD_DATA_PACKS, {}, dedup_key='datapack:refresh', using=using)
+    return enqueue(tasks.BUILD_DATA_PACKS, {'scope_key': scope_key}, dedup_key=f'datapack:{scope_key}',
+                   using=using)
+
+
+def refresh_data_packs(scope_keys=None):
+    """
+    Пересобирает устаревшие пакеты (все или перечисленные), которые запрашивали за последние
+    DATA_PACK_KEEP_DAYS дней; остальные удаляются вместе с файлами. Возвращает число собранных.
+    """
+    horizon = timezone.now() - timedelta(days=settings.DATA_PACK_KEEP_DAYS)
+    for pack in DataPack.objects.filter(requested_at__lt=horizon):
+        delete_pack(pack)
+
+    packs = DataPack.objects.select_related('user')
+    if scope_keys is not None:
+        packs = packs.filter(pk__in=scope_keys)
+    built = 0
+    for pack in packs:
+        if is_ready(pack) and not is_stale(pack):
+            continue
+        try:
+            if build_pack(pack) is not None:
+                built += 1
+        except Exception:
+            # Ошибка одного пакета не мешает остальным; до следующей сборки отдается прежний файл
+            logger.exception('Не удалось собрать пакет данных %s', pack.scope_key)
+    return built
+
+
+def parse_range(header, size):
+    """
+    Заголовок Range -> (начало, конец включительно) или None, если диапазон не указан
+    или их несколько (тогда отдается весь файл). ValueError - диапазон за пределами файла.
+    """
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', (header or '').strip())
+    if match is None or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError('Диапазон за пределами файла')
+    return start, end
+
+
+def read_range(file, start, length, block_size=64 * 1024):
+    """Читает length байт открытого файла с позиции start блоками (для ответа 206) и закрывает файл."""
+    with file:
+        file.seek(start)
+        while length > 0:
+            block = file.read(min(block_size, length))
+            if not block:
+                return
+            length -= len(block)
+            yield block
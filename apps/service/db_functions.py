@@ -0,0 +1,26 @@
+from django.db.models import Func, IntegerField
+
+
+class DaysBetween(Func):
+    """
+    Количество дней между двумя датами: DaysBetween(end, start) = end - start.
+
+    Выражение переносимо между СУБД и допустимо в CHECK-ограничениях
+    (в SQLite используется встроенная julianday()).
+    """
+    arg_joiner = ' - '
+    template = '(%(expressions)s)'
+    arity = 2
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS INTEGER)',
+            arg_joiner=') - julianday(',
+            **extra_context,
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, function='DATEDIFF', template='%(function)s(%(expressions)s)',
+                           arg_joiner=', ', **extra_context)
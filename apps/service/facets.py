@@ -0,0 +1,114 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from . import metrics, versioning
+from .filters import ComplaintFilter, MachineFilter, MaintenanceFilter, filter_param_names
+from .services import (
+    get_complaint_tiers,
+    get_filtered_machines,
+    get_maintenance_tiers,
+    get_scope_key,
+    parse_id_list,
+)
+
+FACET_CACHE_TIMEOUT = 600
+
+# Таблица -> (функция выборок (горячая таблица и архив, если запрошен), FilterSet, {параметр-фасет: поле модели},
+#             версии данных, от которых зависят счетчики)
+FACETS = {
+    'machines': (
+        lambda user, params: [get_filtered_machines(user, params)],
+        MachineFilter,
+        {
+            'technique_model': 'technique_model_id',
+            'engine_model': 'engine_model_id',
+            'transmission_model': 'transmission_model_id',
+            'drive_axle_model': 'drive_axle_model_id',
+            'steering_axle_model': 'steering_axle_model_id',
+        },
+        (versioning.MACHINE,),
+    ),
+    'maintenances': (
+        get_maintenance_tiers,
+        MaintenanceFilter,
+        {
+            'service_type': 'service_type_id',
+            'service_company_to': 'service_company_id',
+        },
+        (versioning.MACHINE, versioning.MAINTENANCE),
+    ),
+    'complaints': (
+        get_complaint_tiers,
+        ComplaintFilter,
+        {
+            'failure_node': 'failure_node_id',
+            'recovery_method': 'recovery_method_id',
+            'service_company_complaint': 'service_company_id',
+        },
+        (versioning.MACHINE, versioning.COMPLAINT),
+    ),
+}
+
+
+def get_facet_counts(user, params):
+    """
+    Счетчики для выпадающих фильтров главной страницы.
+
+    Для каждого варианта - количество записей в области видимости пользователя
+    при всех остальных активных фильтрах. Результат: {таблица: {параметр: {id: count}}}.
+    """
+    versions = versioning.get_data_versions(*versioning.LABELS)
+    return {table: get_table_facet_counts(user, params, table, versions) for table in FACETS}
+
+
+def get_table_facet_counts(user, params, table, versions=None):
+    get_querysets, filterset_class, facets, labels = FACETS[table]
+    if versions is None:
+        versions = versioning.get_data_versions(*labels)
+    active = {param: parse_id_list(params.get(param)) for param in facets}
+    active = {param: values for param, values in active.items() if values}
+    other_params = {
+        param: params[param] for param in filter_param_names(filterset_class)
+        if param not in facets and params.get(param)
+    }
+
+    cache_key = _cache_key(table, get_scope_key(user), active, other_params, versioning.format_version_key(versions, labels))
+    counts = cache.get(cache_key)
+    if counts is None:
+        metrics.incr(f'facet_cache.{table}.miss')
+        counts = _compute_counts(get_querysets(user, other_params), facets, active)
+        cache.set(cache_key, counts, FACET_CACHE_TIMEOUT)
+    else:
+        metrics.incr(f'facet_cache.{table}.hit')
+    return counts
+
+
+def get_filter_query(params):
+    """Строка с параметрами фильтров всех таблиц в каноническом порядке, без пагинации и вкладки."""
+    names = {name for _, filterset_class, _, _ in FACETS.values() for name in filter_param_names(filterset_class)}
+    return '&'.join(f'{name}={value}' for name in sorted(names) for value in params.getlist(name) if value)
+
+
+def _compute_counts(querysets, facets, active):
+    # Один GROUP BY по всем полям-фасетам таблицы (и архива); разрезы по каждому фильтру считаются в памяти.
+    # Комбинаций значений справочников немного, поэтому строк в ответе мало при любом размере таблицы.
+    fields = list(facets.values())
+    rows = [row for queryset in querysets for row in queryset.order_by().values(*fields).annotate(n=Count('pk'))]
+
+    counts = {param: {} for param in facets}
+    for row in rows:
+        for param, field in facets.items():
+            matches_others = all(
+                row[facets[other]] in values for other, values in active.items() if other != param
+            )
+            if matches_others and row[field] is not None:
+                counts[param][row[field]] = counts[param].get(row[field], 0) + row['n']
+    return counts
+
+
+def _cache_key(table, scope_key, active, other_params, version_key):
+    filters = sorted((key, sorted(values)) for key, values in active.items()) + sorted(other_params.items())
+    digest = hashlib.md5(repr(filters).encode()).hexdigest()
+    return f'facets:{table}:{scope_key}:{version_key}:{digest}'
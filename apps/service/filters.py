@@ -0,0 +1,85 @@
+import django_filters
+from django_filters.fields import DateRangeField
+
+from .models import Complaint, Machine, Maintenance
+
+
+class NumberInFilter(django_filters.BaseInFilter, django_filters.NumberFilter):
+    """Список id через запятую: ?technique_model=1,3 -> technique_model_id IN (1, 3)."""
+
+
+class CharInFilter(django_filters.BaseInFilter, django_filters.CharFilter):
+    pass
+
+
+class PlainDateRangeField(DateRangeField):
+    # Границы остаются датами (без приведения к datetime), условие - BETWEEN по столбцу DateField
+    def compress(self, data_list):
+        if data_list:
+            return slice(*data_list)
+        return None
+
+
+class DateRangeFilter(django_filters.DateFromToRangeFilter):
+    """Диапазон дат: ?<поле>_after=2024-01-01&<поле>_before=2024-12-31."""
+    field_class = PlainDateRangeField
+
+
+def filter_param_names(filterset_class):
+    """Имена GET-параметров, которые понимает FilterSet (для диапазонов - с суффиксами _after/_min и т.п.)."""
+    names = []
+    for name, field in filterset_class().form.fields.items():
+        suffixes = getattr(field.widget, 'suffixes', None)
+        if suffixes:
+            names.extend(f'{name}_{suffix}' for suffix in suffixes)
+        else:
+            names.append(name)
+    return names
+
+
+class MachineFilter(django_filters.FilterSet):
+    serial_number = CharInFilter(field_name='serial_number')
+    technique_model = NumberInFilter(field_name='technique_model_id')
+    engine_model = NumberInFilter(field_name='engine_model_id')
+    transmission_model = NumberInFilter(field_name='transmission_model_id')
+    drive_axle_model = NumberInFilter(field_name='drive_axle_model_id')
+    steering_axle_model = NumberInFilter(field_name='steering_axle_model_id')
+    client = NumberInFilter(field_name='client_id')
+    service_company = NumberInFilter(field_name='service_company_id')
+    date_shipment = DateRangeFilter(field_name='date_shipment')
+
+    class Meta:
+        model = Machine
+        fields = []
+
+
+class MaintenanceFilter(django_filters.FilterSet):
+    machine = NumberInFilter(field_name='machine_id')
+    # Точное совпадение заводского номера (значения из выпадающего списка), обслуживается уникальным индексом
+    car_serial_to = CharInFilter(field_name='machine__serial_number')
+    service_type = NumberInFilter(field_name='service_type_id')
+    service_company = NumberInFilter(field_name='service_company_id')
+    service_company_to = NumberInFilter(field_name='service_company_id')
+    event_date = DateRangeFilter(field_name='event_date')
+    operating_hours = django_filters.RangeFilter(field_name='operating_hours')
+
+    class Meta:
+        model = Maintenance
+        fields = []
+
+
+class ComplaintFilter(django_filters.FilterSet):
+    machine = NumberInFilter(field_name='machine_id')
+    car_serial = CharInFilter(field_name='machine__serial_number')
+    failure_node = NumberInFilter(field_name='failure_node_id')
+    recovery_method = NumberInFilter(field_name='recovery_method_id')
+    service_company = NumberInFilter(field_name='service_company_id')
+    service_company_complaint = NumberInFilter(field_name='service_company_id')
+    failure_date = DateRangeFilter(field_name='failure_date')
+    recovery_date = DateRangeFilter(field_name='recovery_date')
+    operating_hours = django_filters.RangeFilter(field_name='operating_hours')
+    downtime = django_filters.RangeFilter(field_name='downtime')
+
+    class Meta:
+        model = Complaint
+        fields = []
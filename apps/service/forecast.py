@@ -0,0 +1,187 @@
+import time
+
+import numpy as np
+from django.db import transaction
+from django.db.models import ExpressionWrapper, F, FloatField, IntegerField, Value
+from django.db.models.functions import Cast, Greatest, Round
+from django.utils import timezone
+
+from .db_functions import DaysBetween
+from .models import TechniqueModel, UsageForecast
+from .quality import (
+    EPOCH,
+    day_to_date,
+    get_changed_machines,
+    load_events,
+    load_shipments,
+    machine_batches,
+    record_batch_run,
+)
+
+FORECAST_NAME = 'usage_forecast'
+# Остатки дальше HUBER_K робастных отклонений получают вес меньше 1: выбросы (ошибки ввода
+# наработки) почти не влияют на темп
+HUBER_K = 1.345
+ITERATIONS = 10
+# Нижняя граница разброса остатков, м/час: при точной прямой веса не вырождаются
+MIN_SCALE = 1.0
+PERCENTILES = (10, 50, 90)
+
+
+def _group_sum(group, values, count):
+    return np.bincount(group, weights=values, minlength=count)
+
+
+def _group_median(group, values, count):
+    order = np.lexsort((values, group))
+    ordered = values[order]
+    sizes = np.bincount(group, minlength=count)
+    starts = np.cumsum(sizes) - sizes
+    median = np.zeros(count)
+    present = sizes > 0
+    lower = starts[present] + (sizes[present] - 1) // 2
+    upper = starts[present] + sizes[present] // 2
+    median[present] = (ordered[lower] + ordered[upper]) / 2
+    return median
+
+
+def fit_rates(group, x, y, count, iterations=ITERATIONS):
+    """
+    Наклон y по x в каждой группе (номера групп 0..count-1) сразу для всех групп:
+    взвешенный МНК по суммам np.bincount, веса Хьюбера пересчитываются по остаткам.
+    Возвращает (наклоны, свободные члены); для групп с одним значением x - nan.
+    """
+    weights = np.ones(len(x))
+    slope = intercept = np.full(count, np.nan)
+    for _ in range(iterations):
+        sw = _group_sum(group, weights, count)
+        sx = _group_sum(group, weights * x, count)
+        sy = _group_sum(group, weights * y, count)
+        sxx = _group_sum(group, weights * x * x, count)
+        sxy = _group_sum(group, weights * x * y, count)
+        denominator = sw * sxx - sx * sx
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = np.where(denominator > 0, (sw * sxy - sx * sy) / denominator, np.nan)
+            intercept = (sy - np.nan_to_num(slope) * sx) / sw
+        residual = np.abs(y - intercept[group] - np.nan_to_num(slope)[group] * x)
+        # Робастный разброс: медиана абсолютных остатков группы, приведенная к стандартному отклонению
+        limit = HUBER_K * np.maximum(1.4826 * _group_median(group, residual, count), MIN_SCALE)[group]
+        weights = np.where(residual <= limit, 1.0, limit / np.maximum(residual, MIN_SCALE))
+    return slope, intercept
+
+
+def build_forecasts(events, machine_ids, shipment_days, today):
+    """
+    Темп наработки каждой машины с показаниями: регрессия наработки по дням от отгрузки, где
+    отгрузка - нулевое показание. Возвращает несохраненные UsageForecast.
+    """
+    position = np.searchsorted(machine_ids, events['machine'])
+    known = position < len(machine_ids)
+    known[known] = machine_ids[position[known]] == events['machine'][known]
+    events, position = events[known], position[known]
+    if not len(events):
+        return []
+    count = len(machine_ids)
+    readings = np.bincount(position, minlength=count)
+
+    group = np.concatenate([np.arange(count), position])
+    x = np.concatenate([np.zeros(count), events['day'] - shipment_days[position]]).astype('f8')
+    y = np.concatenate([np.zeros(count), events['hours']]).astype('f8')
+    slope, _ = fit_rates(group, x, y, count)
+    rate = np.maximum(np.nan_to_num(slope), 0)
+
+    # События упорядочены по машине, дате и наработке: последнее показание - последнее в группе
+    last = np.flatnonzero(np.append(events['machine'][1:] != events['machine'][:-1], True))
+    today_day = (today - EPOCH).days
+    projected = np.maximum(
+        events['hours'][last] + np.round(rate[position[last]] * (today_day - events['day'][last])), 0
+    )
+    now = timezone.now()
+    return [
+        UsageForecast(
+            machine_id=int(machine_ids[machine]),
+            rate=float(rate[machine]),
+            readings=int(readings[machine]),
+            last_reading_date=day_to_date(events['day'][index]),
+            last_reading_hours=int(events['hours'][index]),
+            projected_hours=int(projected[number]),
+            fitted_at=now,
+        )
+        for number, (index, machine) in enumerate(zip(last, position[last]))
+    ]
+
+
+def fit_usage_forecasts(incremental=False, using='default'):
+    """
+    Пересчитывает темпы наработки всего парка (или машин, изменившихся после прошлого расчета).
+    Возвращает словарь с числом машин, показаний, прогнозов и длительностью этапов.
+    """
+    started = timezone.now()
+    timings = {}
+    machines = get_changed_machines(FORECAST_NAME, started) if incremental else None
+
+    clock = time.perf_counter()
+    machine_ids, shipment_days = load_shipments(machines)
+    events = load_events(machines)
+    timings['load'] = time.perf_counter() - clock
+
+    clock = time.perf_counter()
+    forecasts = build_forecasts(events, machine_ids, shipment_days, timezone.localdate())
+    timings['fit'] = time.perf_counter() - clock
+
+    clock = time.perf_counter()
+    with transaction.atomic(using=using):
+        # Прогнозы машин, у которых не осталось показаний, удаляются
+        for batch in machine_batches(machines):
+            stale = UsageForecast.objects.using(using)
+            if batch is not None:
+                stale = stale.filter(machine_id__in=batch)
+            stale.delete()
+        UsageForecast.objects.using(using).bulk_create(forecasts, batch_size=1000)
+        timings['write'] = time.perf_counter() - clock
+        result = {
+            'machines': len(machine_ids),
+            'readings': len(events),
+            'forecasts': len(forecasts),
+            'timings': timings,
+        }
+        record_batch_run(FORECAST_NAME, started, result, using=using)
+    return result
+
+
+def with_projected_hours(queryset, day, prefix=''):
+    """
+    Добавляет к выборке projected_hours - прогноз наработки на дату day, вычисляемый базой
+    (как UsageForecast.projected_hours_on); prefix - путь до машины ('machine__' для ТО и рекламаций).
+    """
+    forecast = f'{prefix}usage_forecast__'
+    days = DaysBetween(Value(day), F(f'{forecast}last_reading_date'))
+    return queryset.annotate(projected_hours=Greatest(
+        Cast(Round(ExpressionWrapper(
+            F(f'{forecast}last_reading_hours') + F(f'{forecast}rate') * days, output_field=FloatField()
+        )), IntegerField()),
+        Value(0),
+    ))
+
+
+def get_utilization_percentiles(forecasts, percentiles=PERCENTILES):
+    """
+    Перцентили темпа наработки по моделям техники для выборки UsageForecast:
+    [{'technique_model', 'name', 'machines', 'p10', 'p50', 'p90'}] по убыванию числа машин.
+    """
+    rows = forecasts.order_by().values_list('machine__technique_model_id', 'rate')
+    data = np.fromiter(rows.iterator(), dtype=[('model', 'i8'), ('rate', 'f8')])
+    data = np.sort(data, order=('model', 'rate'))
+    models, starts, sizes = np.unique(data['model'], return_index=True, return_counts=True)
+    names = dict(TechniqueModel.objects.filter(pk__in=models.tolist()).values_list('pk', 'name'))
+    result = []
+    for model, start, size in zip(models, starts, sizes):
+        values = np.percentile(data['rate'][start:start + size], percentiles)
+        result.append({
+            'technique_model': int(model),
+            'name': names.get(int(model)),
+            'machines': int(size),
+            **{f'p{percentile}': round(float(value), 2) for percentile, value in zip(percentiles, values)},
+        })
+    result.sort(key=lambda item: (-item['machines'], item['name'] or ''))
+    return result
@@ -1,5 +1,18 @@
 from django import forms
-from .models import Machine, Maintenance, Complaint
+from django.core.exceptions import NON_FIELD_ERRORS
+from .archive import has_archived_maintenance
+from .models import DUPLICATE_MAINTENANCE_MESSAGE, Machine, Maintenance, Complaint
+from .scope import get_role_scope
+from .services import get_machines_for_form, get_service_companies_for_form
+from .widgets import AutocompleteSelect
+
+
+def catalog_widget(catalog):
+    return AutocompleteSelect('autocomplete_catalog', {'catalog': catalog})
+
+
+def users_widget(scope):
+    return AutocompleteSelect('autocomplete_users', {'scope': scope})
 
 class MachineForm(forms.ModelForm):
     class Meta:
@@ -7,6 +20,13 @@ class MachineForm(forms.ModelForm):
         fields = '__all__'
         widgets = {
             'date_shipment': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+            'technique_model': catalog_widget('technique_model'),
+            'engine_model': catalog_widget('engine_model'),
+            'transmission_model': catalog_widget('transmission_model'),
+            'drive_axle_model': catalog_widget('drive_axle_model'),
+            'steering_axle_model': catalog_widget('steering_axle_model'),
+            'client': users_widget('client'),
+            'service_company': users_widget('service'),
         }
     
     def __init__(self, *args, **kwargs):
@@ -26,9 +46,16 @@ class MaintenanceForm(forms.ModelForm):
         labels = {
             'machine': 'Заводской №',
         }
+        # Дубликаты отсекает ограничение unique_maintenance_event, здесь только текст ошибки
+        error_messages = {
+            NON_FIELD_ERRORS: {'unique_together': DUPLICATE_MAINTENANCE_MESSAGE},
+        }
         widgets = {
             'event_date': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
             'order_date': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+            'machine': AutocompleteSelect('autocomplete_machines'),
+            'service_type': catalog_widget('service_type'),
+            'service_company': users_widget('service_or_self'),
         }
     
     def __init__(self, *args, **kwargs):
@@ -36,27 +63,11 @@ class MaintenanceForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         
         if user:
-            if getattr(user, 'is_manager', False) or user.is_superuser:
-                pass
-            elif getattr(user, 'is_service', False):
-                self.fields['machine'].queryset = Machine.objects.filter(service_company=user)
-            elif getattr(user, 'is_client', False):
-                self.fields['machine'].queryset = Machine.objects.filter(client=user)
-            else:
-                self.fields['machine'].queryset = Machine.objects.none()
-        
-        if user:
-            from apps.users.models import CustomUser
-            if getattr(user, 'is_manager', False) or user.is_superuser:
-                self.fields['service_company'].queryset = CustomUser.objects.filter(role='service')
-            elif getattr(user, 'is_service', False):
-                self.fields['service_company'].queryset = CustomUser.objects.filter(id=user.id)
-            elif getattr(user, 'is_client', False):
-                service_companies_ids = Machine.objects.filter(client=user).values_list('service_company_id', flat=True).distinct()
-                self.fields['service_company'].queryset = CustomUser.objects.filter(
-                    id__in=list(service_companies_ids) + [user.id]
-                )
-                
+            # Те же выборки, что отдает автодополнение: присланный id проверяется в пределах роли
+            self.fields['machine'].queryset = get_machines_for_form(user)
+            self.fields['service_company'].queryset = get_service_companies_for_form(user, include_self=True)
+
+            if get_role_scope(user).is_client:
                 # Переопределено отображение (label) для текущего пользователя (клиента)
                 # Чтобы в списке вместо имени (например, "Клиент Иванов") отображалось "Самостоятельно"
                 original_label_from_instance = self.fields['service_company'].label_from_instance
@@ -67,33 +78,19 @@ class MaintenanceForm(forms.ModelForm):
                     return original_label_from_instance(obj)
 
                 self.fields['service_company'].label_from_instance = custom_label_from_instance
-            else:
-                self.fields['service_company'].queryset = CustomUser.objects.none()
         
         for field in self.fields:
             self.fields[field].widget.attrs.update({'class': 'form-input'})
-    
+
     def clean(self):
         cleaned_data = super().clean()
-        machine = cleaned_data.get('machine')
-        event_date = cleaned_data.get('event_date')
-        service_type = cleaned_data.get('service_type')
-        
-        # Проверка на дубликаты (машина + дата + вид ТО)
-        if machine and event_date and service_type:
-            queryset = Maintenance.objects.filter(
-                machine=machine,
-                event_date=event_date,
-                service_type=service_type
-            )
-            if self.instance.pk:
-                queryset = queryset.exclude(pk=self.instance.pk)
-            
-            if queryset.exists():
-                self.add_error(None, 'Запись о ТО с такими параметрами (машина, дата, вид ТО) уже существует в системе.')
-        
+        # Дубликат записи, уже перенесенной в архив, ограничение горячей таблицы не видит
+        if has_archived_maintenance(
+            cleaned_data.get('machine'), cleaned_data.get('event_date'), cleaned_data.get('service_type')
+        ):
+            raise forms.ValidationError(DUPLICATE_MAINTENANCE_MESSAGE)
         return cleaned_data
-
+    
 class ComplaintForm(forms.ModelForm):
     class Meta:
         model = Complaint
@@ -104,6 +101,10 @@ class ComplaintForm(forms.ModelForm):
         widgets = {
             'failure_date': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
             'recovery_date': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+            'machine': AutocompleteSelect('autocomplete_machines'),
+            'failure_node': catalog_widget('failure_node'),
+            'recovery_method': catalog_widget('recovery_method'),
+            'service_company': users_widget('service'),
         }
     
     def __init__(self, *args, **kwargs):
@@ -111,26 +112,8 @@ class ComplaintForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         
         if user:
-            if getattr(user, 'is_manager', False) or user.is_superuser:
-                pass
-            elif getattr(user, 'is_service', False):
-                self.fields['machine'].queryset = Machine.objects.filter(service_company=user)
-            elif getattr(user, 'is_client', False):
-                self.fields['machine'].queryset = Machine.objects.filter(client=user)
-            else:
-                self.fields['machine'].queryset = Machine.objects.none()
-        
-        if user:
-            from apps.users.models import CustomUser
-            if getattr(user, 'is_manager', False) or user.is_superuser:
-                 self.fields['service_company'].queryset = CustomUser.objects.filter(role='service')
-            elif getattr(user, 'is_service', False):
-                 self.fields['service_company'].queryset = CustomUser.objects.filter(id=user.id)
-            elif getattr(user, 'is_client', False):
-                 service_companies_ids = Machine.objects.filter(client=user).values_list('service_company_id', flat=True).distinct()
-                 self.fields['service_company'].queryset = CustomUser.objects.filter(id__in=service_companies_ids)
-            else:
-                 self.fields['service_company'].queryset = CustomUser.objects.none()
+            self.fields['machine'].queryset = get_machines_for_form(user)
+            self.fields['service_company'].queryset = get_service_companies_for_form(user)
         
         for field in self.fields:
             self.fields[field].widget.attrs.update({'class': 'form-input'})
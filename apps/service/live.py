@@ -0,0 +1,253 @@
+import asyncio
+import contextvars
+import json
+import time
+from collections import Counter
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import metrics
+from .models import LiveEvent, Machine
+from .scope import RoleScope
+
+EVENT_FIELDS = ('id', 'model', 'object_id', 'action', 'machine_id', 'client_id', 'service_company_id')
+# Очередь подписчика переполнена: клиент должен перечитать таблицы целиком
+RESET = b'event: reset\ndata: {}\n\n'
+PING = b': ping\n\n'
+
+
+class TooManyConnections(Exception):
+    pass
+
+
+def publish(instance, action, using='default'):
+    """Записывает событие об изменении ТО или рекламации в текущей транзакции."""
+    owners = Machine.objects.using(using).filter(pk=instance.machine_id).values(
+        'client_id', 'service_company_id'
+    ).first() or {}
+    LiveEvent.objects.using(using).create(
+        model=instance._meta.model_name,
+        object_id=instance.pk,
+        action=action,
+        machine_id=instance.machine_id,
+        client_id=owners.get('client_id'),
+        service_company_id=owners.get('service_company_id'),
+    )
+    # Подписчики этого же процесса получат событие сразу, остальные - при следующем опросе
+    transaction.on_commit(broadcaster.wake_up, using=using)
+
+
+def is_visible(event, scope):
+    if scope.kind == RoleScope.ALL:
+        return True
+    # account_ids вычислены до подписки (LiveEventsView), здесь запросов к базе нет
+    if scope.kind == RoleScope.SERVICE:
+        return event['service_company_id'] in scope.account_ids
+    if scope.kind == RoleScope.CLIENT:
+        return event['client_id'] in scope.account_ids
+    return False
+
+
+def format_event(event):
+    data = {key: event[key] for key in ('object_id', 'action', 'machine_id')}
+    return f"id: {event['id']}\nevent: {event['model']}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+def get_last_event_id():
+    return LiveEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def fetch_events(after, grace_since=None, limit=None):
+    """События с id больше after (и за последние секунды - см. Broadcaster.poll) по возрастанию id."""
+    condition = Q(id__gt=after)
+    if grace_since is not None:
+        condition |= Q(created_at__gte=grace_since)
+    queryset = LiveEvent.objects.filter(condition).order_by('id').values(*EVENT_FIELDS)
+    return list(queryset[:limit] if limit else queryset)
+
+
+def purge_live_events():
+    deadline = timezone.now() - timedelta(seconds=settings.LIVE_EVENTS_RETENTION)
+    return LiveEvent.objects.filter(created_at__lt=deadline).delete()[0]
+
+
+class Subscriber:
+    __slots__ = ('scope', 'queue', 'initial_id')
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.queue = asyncio.Queue(settings.LIVE_EVENTS_QUEUE_SIZE)
+        # Id, с которого браузер продолжит при переподключении, если событий еще не было
+        self.initial_id = None
+
+    def put(self, chunk):
+        try:
+            self.queue.put_nowait(chunk)
+        except asyncio.QueueFull:
+            # Медленный клиент не копит события в памяти: очередь заменяется одним reset
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESET)
+
+
+class Broadcaster:
+    """
+    Рассылка событий LiveEvent подписчикам одного процесса ASGI.
+
+    Пока есть подписчики, одна корутина опрашивает журнал раз в LIVE_EVENTS_POLL_INTERVAL
+    (или сразу после записи в этом же процессе) и раскладывает каждое событие, один раз
+    переведенное в текст SSE, по очередям подписчиков с доступом к машине. Запрос
+    к базе один на процесс, а не на подключение.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.per_user = Counter()
+        self.last_id = 0
+        self.seen = {}
+        self.ready = None
+        self._task = None
+        self._loop = None
+        self._wakeup = None
+
+    def subscribe(self, scope):
+        if len(self.subscribers) >= settings.LIVE_EVENTS_MAX_CONNECTIONS:
+            raise TooManyConnections
+        if self.per_user[scope.user_id] >= settings.LIVE_EVENTS_MAX_CONNECTIONS_PER_USER:
+            raise TooManyConnections
+        subscriber = Subscriber(scope)
+        self.subscribers.add(subscriber)
+        self.per_user[scope.user_id] += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.discard(subscriber)
+            self.per_user[subscriber.scope.user_id] -= 1
+            if not self.per_user[subscriber.scope.user_id]:
+                del self.per_user[subscriber.scope.user_id]
+
+    async def start(self):
+        """Запускает опрос журнала в текущем цикле событий, если он еще не запущен."""
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self.ready = asyncio.Event()
+            # Опрос живет дольше запроса, который его запустил: он не должен унаследовать
+            # исполнитель синхронного кода этого запроса и его маршрутизацию на реплики
+            self._task = contextvars.Context().run(loop.create_task, self.run())
+        await self.ready.wait()
+
+    def wake_up(self):
+        # Вызывается после фиксации транзакции из потока синхронного кода
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def heartbeat(self):
+        # Пульс рассылается отсюда, а не таймером в каждом потоке: ожидающий подписчик - только очередь
+        for subscriber in self.subscribers:
+            if subscriber.queue.empty():
+                subscriber.put(PING)
+
+    def dispatch(self, events):
+        for event in events:
+            chunk = format_event(event)
+            for subscriber in self.subscribers:
+                if is_visible(event, subscriber.scope):
+                    subscriber.put(chunk)
+        metrics.incr('live.events', len(events))
+
+    async def poll(self):
+        # В SQLite записи сериализованы и id видны по порядку; в PostgreSQL транзакция с меньшим
+        # id может зафиксироваться позже, поэтому последние LIVE_EVENTS_GRACE секунд перечитываются
+        now = time.monotonic()
+        grace_since = timezone.now() - timedelta(seconds=settings.LIVE_EVENTS_GRACE)
+        events = await sync_to_async(fetch_events)(self.last_id, grace_since)
+        fresh = [event for event in events if event['id'] not in self.seen]
+        for event in fresh:
+            self.seen[event['id']] = now
+            self.last_id = max(self.last_id, event['id'])
+        self.seen = {
+            event_id: seen_at for event_id, seen_at in self.seen.items()
+            if now - seen_at <= settings.LIVE_EVENTS_GRACE * 2
+        }
+        if fresh:
+            self.dispatch(fresh)
+
+    async def run(self):
+        try:
+            self.last_id = await sync_to_async(get_last_event_id)()
+        finally:
+            self.seen.clear()
+            self.ready.set()
+        last_heartbeat = time.monotonic()
+        while self.subscribers:
+            self._wakeup.clear()
+            try:
+                await self.poll()
+            except Exception:
+                metrics.incr('live.poll_errors')
+            if time.monotonic() - last_heartbeat >= settings.LIVE_EVENTS_HEARTBEAT:
+                self.heartbeat()
+                last_heartbeat = time.monotonic()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.LIVE_EVENTS_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+        self._task = None
+
+
+broadcaster = Broadcaster()
+
+
+async def subscribe(scope, last_event_id=None):
+    """
+    Подписка на события, видимые области scope, и пропущенные с last_event_id
+    (заголовок Last-Event-ID при переподключении EventSource).
+    """
+    subscriber = broadcaster.subscribe(scope)
+    metrics.incr('live.subscribed')
+    await broadcaster.start()
+    try:
+        after = int(last_event_id)
+    except (TypeError, ValueError):
+        after = None
+    if after is None:
+        subscriber.initial_id = broadcaster.last_id
+    elif after < broadcaster.last_id:
+        limit = settings.LIVE_EVENTS_BACKLOG
+        backlog = await sync_to_async(fetch_events)(after, limit=limit + 1)
+        if len(backlog) > limit:
+            subscriber.put(RESET)
+        else:
+            for event in backlog:
+                if event['id'] <= broadcaster.last_id and is_visible(event, scope):
+                    subscriber.put(format_event(event))
+    return subscriber
+
+
+async def stream(subscriber):
+    """
+    Тело ответа text/event-stream. Через LIVE_EVENTS_MAX_AGE (проверяется при очередном
+    событии или пульсе) поток закрывается, и браузер переподключается с Last-Event-ID:
+    так освобождаются подписки оборванных соединений.
+    """
+    deadline = time.monotonic() + settings.LIVE_EVENTS_MAX_AGE
+    try:
+        head = f'retry: {settings.LIVE_EVENTS_RETRY_MS}\n'
+        if subscriber.initial_id is not None:
+            head += f'id: {subscriber.initial_id}\n'
+        yield (head + '\n').encode()
+        while time.monotonic() < deadline:
+            chunk = await subscriber.queue.get()
+            yield chunk
+            if chunk is RESET:
+                break
+    finally:
+        broadcaster.unsubscribe(subscriber)
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from apps.service.archive import TIERS, archive_batch, count_archivable, get_archive_cutoff
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит ТО и рекламации старше горизонта архивации (ARCHIVE_KEEP_YEARS) в архивные таблицы '
+        'пачками по одной транзакции; прерванный перенос продолжается повторным запуском'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Записей в пачке (ARCHIVE_BATCH_SIZE)')
+        parser.add_argument('--max-batches', type=int, default=None, help='Остановиться после стольких пачек')
+        parser.add_argument('--pause', type=float, default=0, help='Пауза между пачками, с (снижает нагрузку)')
+        parser.add_argument('--cutoff', type=parse_date, default=None,
+                            help='Архивировать записи раньше этой даты (ГГГГ-ММ-ДД), по умолчанию - по горизонту')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать записи к переносу')
+
+    def handle(self, *args, **options):
+        cutoff = options['cutoff'] or get_archive_cutoff()
+        self.stdout.write(f'Горизонт архивации: записи раньше {cutoff:%d.%m.%Y}')
+        batches = 0
+        for model in TIERS:
+            name = model._meta.verbose_name_plural
+            if options['dry_run']:
+                self.stdout.write(f'{name}: к переносу {count_archivable(model, cutoff)}')
+                continue
+            moved = 0
+            started = time.monotonic()
+            while options['max_batches'] is None or batches < options['max_batches']:
+                count = archive_batch(model, cutoff, options['batch_size'])
+                if not count:
+                    break
+                moved += count
+                batches += 1
+                if options['pause']:
+                    time.sleep(options['pause'])
+            self.stdout.write(f'{name}: перенесено {moved} за {time.monotonic() - started:.1f} с')
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from apps.service.spareparts import rebuild_ledger
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет журнал расхода запчастей и месячный спрос заново по тексту "Используемые запасные части" '
+        'всех рекламаций, включая архив (после пополнения справочника запчастей или его других названий)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--create-parts', action='store_true',
+                            help='Добавить нераспознанные названия в справочник запасных частей')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Строк журнала в одной вставке')
+
+    def handle(self, *args, **options):
+        complaints, rows, unmatched = rebuild_ledger(options['create_parts'], options['batch_size'])
+        self.stdout.write(
+            f'Рекламаций: {complaints}, строк журнала: {rows}, из них не распознано: {unmatched}'
+        )
@@ -0,0 +1,55 @@
+from django.contrib import admin
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from apps.users.models import CustomUser
+from apps.service.benchmarks import rollback_afterwards, seed_fleet, timer
+from apps.service.models import Complaint, Machine, Maintenance
+
+
+class Command(BaseCommand):
+    help = 'Замер времени отрисовки списков админки на синтетическом парке (данные откатываются)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--machines', type=int, default=100000)
+        parser.add_argument('--events', type=int, default=5, help='ТО и рекламаций на машину')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--analyze', action='store_true', help='Собрать статистику СУБД (оценка COUNT)')
+
+    def handle(self, *args, **options):
+        with rollback_afterwards():
+            with timer(timings := {}, 'seed'):
+                counts = seed_fleet(options['machines'], options['events'])
+            self.stdout.write(f"Данные: {counts}, наполнение {timings['seed']:.1f} с")
+            if options['analyze']:
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+
+            superuser = CustomUser.objects.create(username='bench-admin', is_staff=True, is_superuser=True)
+            service_company = CustomUser.objects.filter(username='bench-service-0').first()
+            machine = Machine.objects.filter(serial_number='B00000042').first()
+            scenarios = [
+                (Machine, {}),
+                (Machine, {'p': '100'}),
+                (Machine, {'q': 'b0001'}),
+                (Machine, {'service_company__id__exact': service_company.pk}),
+                (Maintenance, {}),
+                (Maintenance, {'machine__id__exact': machine.pk}),
+                (Maintenance, {'q': 'B0000004'}),
+                (Complaint, {}),
+                (Complaint, {'service_company__id__exact': service_company.pk}),
+            ]
+            factory = RequestFactory()
+            for model, params in scenarios:
+                model_admin = admin.site._registry[model]
+                best, queries = None, 0
+                for _ in range(options['repeat']):
+                    request = factory.get(f'/admin/service/{model._meta.model_name}/', params)
+                    request.user = superuser
+                    with CaptureQueriesContext(connection) as captured, timer(timings, 'render'):
+                        model_admin.changelist_view(request).render()
+                    best = min(best or timings['render'], timings['render'])
+                    queries = len(captured)
+                self.stdout.write(f"{model.__name__:<12} {str(params):<40} {best * 1000:8.1f} мс  запросов: {queries}")
@@ -0,0 +1,87 @@
+import asyncio
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from apps.service import live
+from apps.service.scope import RoleScope
+
+
+def make_scope(user_id, role):
+    user = SimpleNamespace(
+        pk=user_id, is_authenticated=True, is_superuser=False, is_staff=False,
+        is_manager=role == 'manager', is_service=role == 'service', is_client=role == 'client',
+    )
+    return RoleScope(user)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сколько ожидающих подписчиков /live/ держит один процесс ASGI: память на подписчика '
+        'и время рассылки одного события всем (без сети и базы данных)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, action='append',
+                            help='Число подписчиков (можно несколько раз); по умолчанию 1000, 5000, 20000')
+        parser.add_argument('--events', type=int, default=20, help='Событий для замера рассылки')
+
+    def handle(self, *args, **options):
+        counts = options['subscribers'] or [1000, 5000, 20000]
+        self.stdout.write('подписчиков  память/подписчик  рассылка события (p50 / max)')
+        for count in counts:
+            with override_settings(LIVE_EVENTS_MAX_CONNECTIONS=count, LIVE_EVENTS_MAX_CONNECTIONS_PER_USER=count):
+                per_subscriber, timings = asyncio.run(self.measure(count, options['events']))
+            timings.sort()
+            self.stdout.write(
+                f'{count:>11}  {per_subscriber / 1024:10.1f} КиБ  '
+                f'{timings[len(timings) // 2] * 1000:9.1f} / {timings[-1] * 1000:.1f} мс'
+            )
+        self.stdout.write(
+            'Подписчик - очередь и ожидающая корутина потока; буферы сервера ASGI и сокета сюда не входят.'
+        )
+
+    async def measure(self, count, events):
+        # Смесь ролей как в рабочей базе: событие видят менеджеры и владельцы машины
+        roles = ('service', 'client', 'client', 'manager')
+        received = 0
+        everyone_got_it = asyncio.Event()
+        expected = 0
+
+        async def consume(subscriber):
+            nonlocal received
+            async for chunk in live.stream(subscriber):
+                if chunk.startswith(b'id: '):
+                    received += 1
+                    if received == expected:
+                        everyone_got_it.set()
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        subscribers = [live.broadcaster.subscribe(make_scope(index % 500, roles[index % 4])) for index in range(count)]
+        tasks = [asyncio.create_task(consume(subscriber)) for subscriber in subscribers]
+        await asyncio.sleep(0.1)
+        per_subscriber = (tracemalloc.get_traced_memory()[0] - before) / count
+        tracemalloc.stop()
+
+        timings = []
+        for number in range(events):
+            event = {
+                'id': number + 1, 'model': 'complaint', 'object_id': number, 'action': 'created',
+                'machine_id': 1, 'client_id': number % 500, 'service_company_id': (number + 1) % 500,
+            }
+            expected = sum(live.is_visible(event, subscriber.scope) for subscriber in subscribers)
+            received = 0
+            everyone_got_it.clear()
+            started = time.perf_counter()
+            live.broadcaster.dispatch([event])
+            await everyone_got_it.wait()
+            timings.append(time.perf_counter() - started)
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return per_subscriber, timings
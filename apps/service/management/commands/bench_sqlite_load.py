@@ -0,0 +1,157 @@
+import itertools
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections, transaction
+from django.test.utils import override_settings
+
+from apps.service.benchmarks import seed_fleet
+from apps.service.models import Machine, Maintenance, ServiceType
+
+# Конфигурация SQLite "из коробки" и производственный профиль из settings
+PROFILES = {
+    'baseline': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'OPTIONS': {},
+        'PRAGMAS': {'journal_mode': 'DELETE'},
+    },
+    'production': {
+        'ENGINE': 'config.sqlite3',
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+        'PRAGMAS': settings.SQLITE_PRAGMAS,
+    },
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный замер SQLite: параллельные чтения списков и записи ТО '
+        'в стандартной конфигурации и в производственном профиле (на временной копии базы)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--machines', type=int, default=5000)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--duration', type=float, default=5, help='Секунд на профиль')
+        parser.add_argument('--profile', choices=sorted(PROFILES), action='append',
+                            help='По умолчанию замеряются оба профиля')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            seed_path = Path(tmp) / 'seed.sqlite3'
+            with self.database('bench_seed', seed_path, PROFILES['baseline']) as alias:
+                call_command('migrate', database=alias, verbosity=0)
+                seed_fleet(options['machines'], 2, using=alias)
+            self.stdout.write(f"Данные: {options['machines']} машин, чтение {options['readers']} потоков, "
+                              f"запись {options['writers']} потоков, {options['duration']} с на профиль")
+
+            for name in options['profile'] or list(PROFILES):
+                path = Path(tmp) / f'{name}.sqlite3'
+                shutil.copy(seed_path, path)
+                with self.database(f'bench_{name}', path, PROFILES[name]) as alias:
+                    result = self.run_load(alias, options)
+                writes = result['writes_ok'] + result['writes_failed']
+                self.stdout.write(
+                    f"{name:<11} чтений/с: {result['reads'] / options['duration']:8.1f}  "
+                    f"записей/с: {result['writes_ok'] / options['duration']:7.1f}  "
+                    f"успешных записей: {100 * result['writes_ok'] / max(writes, 1):5.1f}% "
+                    f"({result['writes_failed']} ошибок)  "
+                    f"запись p95: {result['write_p95'] * 1000:7.1f} мс"
+                )
+
+    @contextmanager
+    def database(self, alias, path, profile):
+        """Временно регистрирует соединение с файлом path и настройками профиля."""
+        connections.settings[alias] = {
+            **connections.settings['default'],
+            'ENGINE': profile['ENGINE'],
+            'NAME': str(path),
+            'OPTIONS': profile['OPTIONS'],
+            'CONN_MAX_AGE': 0,
+        }
+        try:
+            with override_settings(SQLITE_PRAGMAS=profile['PRAGMAS']):
+                yield alias
+        finally:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+
+    def run_load(self, alias, options):
+        machine_ids = list(Machine.objects.using(alias).values_list('pk', flat=True))
+        service_type = ServiceType.objects.using(alias).first()
+        days = itertools.count()
+        stop_at = time.monotonic() + options['duration']
+        lock = threading.Lock()
+        result = {'reads': 0, 'writes_ok': 0, 'writes_failed': 0, 'write_latency': []}
+
+        def reader(seed):
+            rnd = random.Random(seed)
+            reads = 0
+            while time.monotonic() < stop_at:
+                offset = rnd.randrange(max(len(machine_ids) - 50, 1))
+                list(Machine.objects.using(alias).select_related(
+                    'technique_model', 'engine_model', 'client', 'service_company',
+                ).order_by('-date_shipment')[offset:offset + 50])
+                reads += 1
+            with lock:
+                result['reads'] += reads
+
+        def writer(seed):
+            rnd = random.Random(seed)
+            ok = failed = 0
+            latency = []
+            while time.monotonic() < stop_at:
+                started = time.perf_counter()
+                try:
+                    # Чтение и запись в одной транзакции - типичный путь формы ТО
+                    with transaction.atomic(using=alias):
+                        machine = Machine.objects.using(alias).get(pk=rnd.choice(machine_ids))
+                        with lock:
+                            event_date = date(2030, 1, 1) + timedelta(days=next(days))
+                        Maintenance.objects.using(alias).create(
+                            machine=machine,
+                            service_type=service_type,
+                            event_date=event_date,
+                            operating_hours=1,
+                            order_number=f'load-{event_date}',
+                            order_date=event_date,
+                            service_company_id=machine.service_company_id,
+                        )
+                except DatabaseError:
+                    failed += 1
+                else:
+                    ok += 1
+                latency.append(time.perf_counter() - started)
+            with lock:
+                result['writes_ok'] += ok
+                result['writes_failed'] += failed
+                result['write_latency'].extend(latency)
+
+        def run(target, seed):
+            try:
+                target(seed)
+            finally:
+                connections[alias].close()
+
+        threads = [threading.Thread(target=run, args=(reader, i)) for i in range(options['readers'])]
+        threads += [threading.Thread(target=run, args=(writer, i)) for i in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        latency = result.pop('write_latency')
+        result['write_p95'] = statistics.quantiles(latency, n=20)[-1] if len(latency) > 1 else 0
+        return result
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from apps.service.forecast import fit_usage_forecasts
+
+
+class Command(BaseCommand):
+    help = (
+        'Оценивает темп наработки (м/час в день) каждой машины по показаниям в ТО и рекламациях '
+        'робастной регрессией сразу для всего парка и сохраняет прогнозы наработки'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help='Пересчитать только машины, данные которых менялись после прошлого расчета')
+
+    def handle(self, *args, **options):
+        result = fit_usage_forecasts(incremental=options['incremental'])
+        timings = result['timings']
+        self.stdout.write(
+            f"Машин: {result['machines']}, показаний: {result['readings']}, прогнозов: {result['forecasts']} "
+            f"(чтение {timings['load']:.2f} с, расчет {timings['fit']:.2f} с, запись {timings['write']:.2f} с)"
+        )
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.http import QueryDict
+
+from apps.service.filters import MachineFilter, filter_param_names
+from apps.service.models import Machine, MachineReassignment
+from apps.service.reassignment import find_machines_by_serial, is_narrowed, reassign_machines
+from apps.users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        'Передает машины другому клиенту и/или сервисной компании пачками UPDATE в одной транзакции '
+        '(при переходе сервисного договора); машины выбираются по заводским номерам или фильтрам списка машин'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--serials', default='', help='Заводские номера через запятую')
+        parser.add_argument('--serials-file', help='Файл с заводскими номерами, по одному в строке')
+        parser.add_argument('--filter', action='append', default=[], metavar='ПАРАМЕТР=ЗНАЧЕНИЕ',
+                            help='Фильтр списка машин, как в API: service_company=5, technique_model=1,3')
+        parser.add_argument('--client', help='Новый клиент: id или логин')
+        parser.add_argument('--service-company', help='Новая сервисная компания: id или логин')
+        parser.add_argument('--batch-size', type=int, default=None, help='Машин в пачке (REASSIGN_BATCH_SIZE)')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать машины к передаче')
+
+    def get_user(self, value, role):
+        if not value:
+            return None
+        condition = Q(username=value) | Q(pk=int(value)) if value.isdigit() else Q(username=value)
+        user = CustomUser.objects.filter(condition, role=role).first()
+        if user is None:
+            raise CommandError(f'Пользователь "{value}" с ролью "{role}" не найден')
+        return user
+
+    def get_machine_ids(self, options):
+        serials = options['serials'].split(',')
+        if options['serials_file']:
+            with open(options['serials_file'], encoding='utf-8') as file:
+                serials += file.read().splitlines()
+        serials = [serial for serial in serials if serial.strip()]
+        params = QueryDict(mutable=True)
+        for item in options['filter']:
+            name, _, value = item.partition('=')
+            if name not in filter_param_names(MachineFilter):
+                raise CommandError(f'Неизвестный фильтр: {name}')
+            if not value.strip():
+                raise CommandError(f'Пустое значение фильтра: {name}')
+            params[name] = value
+        if not serials and not params:
+            raise CommandError('Укажите --serials, --serials-file или --filter')
+        base = Machine.objects.all()
+        filterset = MachineFilter(params, queryset=base)
+        if not filterset.is_valid():
+            raise CommandError(f'Неверный фильтр: {filterset.errors.as_text()}')
+        queryset = filterset.qs
+        if not serials:
+            if not is_narrowed(queryset, base):
+                # Без условий передался бы весь парк
+                raise CommandError('Фильтр не задает ни одного условия')
+            return list(queryset.values_list('pk', flat=True))
+        ids, not_found = find_machines_by_serial(queryset, serials)
+        if not_found:
+            self.stderr.write(f'Не найдены: {", ".join(not_found)}')
+        return ids
+
+    def handle(self, *args, **options):
+        client = self.get_user(options['client'], CustomUser.CLIENT)
+        service_company = self.get_user(options['service_company'], CustomUser.SERVICE)
+        if client is None and service_company is None:
+            raise CommandError('Укажите --client и/или --service-company')
+        machine_ids = self.get_machine_ids(options)
+        if options['dry_run']:
+            self.stdout.write(f'К передаче машин: {len(machine_ids)}')
+            return
+        operation, moved, batches = reassign_machines(
+            machine_ids, client=client, service_company=service_company,
+            source=MachineReassignment.COMMAND, batch_size=options['batch_size'],
+        )
+        self.stdout.write(f'Операция {operation}: передано машин {moved}, пачек {batches}')
@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from apps.service.sla import evaluate_sla, get_window_start, rebuild_buckets
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает недельные показатели сервисных компаний из рекламаций и ТО и проверяет пороги: '
+        'начальное заполнение и исправление после массовых операций, которые обходят сигналы'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=parse_date, default=None,
+                            help='Пересчитать с недели этой даты (ГГГГ-ММ-ДД), по умолчанию - окно SLA_WINDOW_DAYS')
+        parser.add_argument('--days', type=int, default=None, help='Пересчитать за столько последних дней')
+
+    def handle(self, *args, **options):
+        since = options['since'] or get_window_start()
+        if options['days']:
+            since = timezone.localdate() - timedelta(days=options['days'])
+        buckets = rebuild_buckets(since)
+        created, resolved = evaluate_sla()
+        self.stdout.write(
+            f'Недель по компаниям с {since:%d.%m.%Y}: {buckets}; '
+            f'новых нарушений: {len(created)}, закрыто: {len(resolved)}'
+        )
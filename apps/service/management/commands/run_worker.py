@@ -0,0 +1,48 @@
+import multiprocessing
+import os
+import signal
+import socket
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from apps.service.taskqueue import REGISTRY, work, worker_process
+
+
+class Command(BaseCommand):
+    help = 'Воркер фоновых задач из очереди в базе данных (уведомления и другие действия после записи)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='Количество процессов-воркеров')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Пауза опроса очереди без задач, с')
+        parser.add_argument('--once', action='store_true', help='Выполнить накопившиеся задачи и выйти')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Задачи: {', '.join(sorted(REGISTRY))}; процессов: {options['processes']}")
+        if options['processes'] <= 1:
+            stop = multiprocessing.Event()
+            self.stop_on_signals(stop)
+            work(f'{socket.gethostname()}:{os.getpid()}:0', stop, options['poll_interval'], options['once'])
+            return
+
+        # Дочерние процессы открывают собственные соединения с базой
+        connections.close_all()
+        stop = multiprocessing.Event()
+        processes = [
+            multiprocessing.Process(
+                target=worker_process, args=(index, stop, options['poll_interval'], options['once']), daemon=True,
+            )
+            for index in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        self.stop_on_signals(stop)
+        for process in processes:
+            process.join()
+
+    def stop_on_signals(self, stop):
+        def handler(signum, frame):
+            self.stdout.write('Остановка после текущих задач...')
+            stop.set()
+        signal.signal(signal.SIGINT, handler)
+        signal.signal(signal.SIGTERM, handler)
@@ -0,0 +1,29 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from apps.service.models import DataQualityFinding
+from apps.service.quality import scan_data_quality
+
+
+class Command(BaseCommand):
+    help = (
+        'Ищет ошибки в данных машин (наработка уменьшилась, событие раньше отгрузки, восстановление раньше '
+        'отказа, пересекающиеся рекламации по узлу) и заменяет ими таблицу ошибок в админке'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help='Проверить только машины, данные которых менялись после прошлой проверки')
+
+    def handle(self, *args, **options):
+        result = scan_data_quality(incremental=options['incremental'])
+        timings = result['timings']
+        self.stdout.write(
+            f"Машин: {result['machines']}, событий: {result['events']}, ошибок: {result['findings']} "
+            f"(чтение {timings['load']:.2f} с, анализ {timings['analyze']:.2f} с, запись {timings['write']:.2f} с)"
+        )
+        labels = dict(DataQualityFinding.KIND_CHOICES)
+        counts = Counter(DataQualityFinding.objects.values_list('kind', flat=True))
+        for kind, count in sorted(counts.items()):
+            self.stdout.write(f'  {labels[kind]}: {count}')
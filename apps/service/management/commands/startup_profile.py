@@ -0,0 +1,85 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def parse_importtime(text):
+    """Строки -X importtime -> {модуль: (собственное время, с учетом вложенных), мкс}."""
+    modules = {}
+    for line in text.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(own), int(cumulative))
+    return modules
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер запуска воркера в чистом процессе: импорт модулей по пакетам, django.setup() по приложениям, '
+        'WSGI-приложение и прогрев; --check сравнивает готовность воркера с бюджетом STARTUP_READY_BUDGET'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3, help='Запусков; в отчет идет медианный по времени')
+        parser.add_argument('--top', type=int, default=15, help='Сколько самых долгих модулей показать')
+        parser.add_argument('--check', action='store_true',
+                            help='Ошибка, если готовность воркера дольше STARTUP_READY_BUDGET секунд')
+
+    def run_probe(self):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings')}
+        started = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-m', 'apps.service.startup'],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        elapsed = time.perf_counter() - started
+        if process.returncode:
+            raise CommandError(f'Замер завершился ошибкой:\n{process.stderr[-2000:]}')
+        result = json.loads(process.stdout)
+        # Готовность - от запуска интерпретатора до конца прогрева, как у нового воркера
+        result['process'] = elapsed
+        result['imports'] = parse_importtime(process.stderr)
+        return result
+
+    def handle(self, *args, **options):
+        runs = sorted((self.run_probe() for _ in range(max(options['runs'], 1))), key=lambda run: run['process'])
+        result = runs[len(runs) // 2]
+        write = self.stdout.write
+
+        write('Этапы, мс:')
+        write(f"  запуск до django.setup() {1000 * (result['process'] - result['ready']):8.1f}")
+        write(f"  django.setup()           {1000 * result['phases']['setup']:8.1f}")
+        write(f"  WSGI-приложение          {1000 * result['phases']['wsgi']:8.1f}")
+        for name, seconds in result['warmup'].items():
+            write(f"  прогрев: {name:<16}{1000 * seconds:8.1f}")
+
+        write('Приложения (импорт / модели / ready), мс:')
+        for label, phases in sorted(result['apps'].items(), key=lambda item: -sum(item[1].values())):
+            write(f"  {label:<16}" + ' / '.join(
+                f"{1000 * phases.get(phase, 0):6.1f}" for phase in ('import', 'models', 'ready')
+            ))
+
+        packages = defaultdict(int)
+        for name, (own, _) in result['imports'].items():
+            packages[name.split('.')[0]] += own
+        write('Импорт по пакетам (собственное время модулей), мс:')
+        for package, own in sorted(packages.items(), key=lambda item: -item[1])[:options['top']]:
+            write(f'  {package:<24}{own / 1000:8.1f}')
+        write('Самые долгие модули (с вложенными импортами), мс:')
+        slowest = sorted(result['imports'].items(), key=lambda item: -item[1][1])[:options['top']]
+        for name, (_, cumulative) in slowest:
+            write(f'  {name:<48}{cumulative / 1000:8.1f}')
+
+        ready = statistics.median(run['process'] for run in runs)
+        budget = settings.STARTUP_READY_BUDGET
+        write(f'Готовность воркера: {ready:.2f} с (медиана {len(runs)} запусков), бюджет {budget:.2f} с')
+        if options['check'] and ready > budget:
+            raise CommandError(f'Готовность воркера {ready:.2f} с превышает бюджет {budget:.2f} с')
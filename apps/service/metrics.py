@@ -0,0 +1,36 @@
+import threading
+from collections import Counter
+
+_lock = threading.Lock()
+_counters = Counter()
+
+
+def incr(name, value=1):
+    """Счетчик процесса (воркера). Снимок доступен менеджерам по /metrics/."""
+    with _lock:
+        _counters[name] += value
+
+
+def snapshot(prefix=''):
+    with _lock:
+        return {name: value for name, value in sorted(_counters.items()) if name.startswith(prefix)}
+
+
+def hit_rates(prefix=''):
+    """Доля попаданий для пар счетчиков <имя>.hit / <имя>.miss: {'<имя>.hit_rate': 0.93}."""
+    counters = snapshot(prefix)
+    rates = {}
+    for name, hits in counters.items():
+        if name.endswith('.hit'):
+            base = name[:-len('.hit')]
+            total = hits + counters.get(f'{base}.miss', 0)
+            rates[f'{base}.hit_rate'] = round(hits / total, 4)
+    for name in counters:
+        if name.endswith('.miss') and f"{name[:-len('.miss')]}.hit_rate" not in rates:
+            rates[f"{name[:-len('.miss')]}.hit_rate"] = 0.0
+    return rates
+
+
+def reset():
+    with _lock:
+        _counters.clear()
@@ -0,0 +1,89 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.middleware.gzip import GZipMiddleware as BaseGZipMiddleware
+
+from . import metrics, throttling
+from .routers import get_replica_aliases, replica_reads
+
+PRIMARY_COOKIE = 'db_primary_until'
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Разрешает чтение с реплик для безопасных запросов (GET/HEAD/OPTIONS).
+
+    После любого изменяющего запроса пользователь на REPLICA_STICKY_SECONDS
+    "прилипает" к основной базе (cookie), чтобы сразу видеть свою запись
+    даже при отставании реплики. Заодно считает, какая база обслужила запросы.
+    """
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not get_replica_aliases():
+            return self.get_response(request)
+
+        use_replicas = request.method in self.safe_methods and not self.is_sticky(request)
+        served = {}
+        with ExitStack() as stack:
+            stack.enter_context(replica_reads(use_replicas))
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(self.counter(alias, served)))
+            response = self.get_response(request)
+
+        for alias, count in served.items():
+            metrics.incr(f'db.queries.{alias}', count)
+        if settings.DEBUG:
+            response['X-DB-Aliases'] = ', '.join(f'{alias}={count}' for alias, count in served.items())
+
+        if request.method not in self.safe_methods:
+            sticky_until = time.time() + settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                PRIMARY_COOKIE, f'{sticky_until:.0f}', max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+    def is_sticky(self, request):
+        try:
+            return float(request.COOKIES.get(PRIMARY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    @staticmethod
+    def counter(alias, served):
+        def wrapper(execute, sql, params, many, context):
+            served[alias] = served.get(alias, 0) + 1
+            return execute(sql, params, many, context)
+        return wrapper
+
+
+class RateLimitMiddleware:
+    """
+    Завершает учет ограничения частоты запросов API (throttling.TokenBucketThrottle): списки
+    доплачивают за строки ответа, ответ получает заголовки X-RateLimit-*.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return throttling.finish_request(request, self.get_response(request))
+
+
+class GZipMiddleware(BaseGZipMiddleware):
+    """
+    GZip без потока событий: сжатие буферизует его, и события доходили бы до браузера с задержкой.
+    Уже сжатые пакеты данных и их части (206) тоже не сжимаются: Content-Range относится к файлу.
+    """
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '')
+        if content_type.startswith(('text/event-stream', 'application/gzip')) or response.status_code == 206:
+            return response
+        return super().process_response(request, response)
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.27 on 2026-10-19 12:42
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0003_add_initial_nodes_and_recovery_methods'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['failure_date'], name='complaint_failure_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='machine',
+            index=models.Index(django.db.models.functions.text.Upper('serial_number'), name='machine_serial_upper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='machine',
+            index=models.Index(fields=['date_shipment'], name='machine_shipment_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='maintenance',
+            index=models.Index(fields=['event_date'], name='maintenance_event_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='maintenance',
+            index=models.Index(fields=['order_number'], name='maintenance_order_number_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.27 on 2026-10-19 12:45
+
+import apps.service.db_functions
+from apps.service.db_functions import DaysBetween
+from django.db import migrations, models
+
+
+def recompute_downtime(apps, schema_editor):
+    """Пересчет времени простоя перед включением проверки complaint_downtime_matches_dates"""
+    Complaint = apps.get_model('service', 'Complaint')
+    Complaint.objects.update(
+        downtime=DaysBetween(models.F('recovery_date'), models.F('failure_date'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0004_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(recompute_downtime, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='complaint',
+            constraint=models.CheckConstraint(check=models.Q(('recovery_date__gte', models.F('failure_date'))), name='complaint_recovery_after_failure', violation_error_message='Дата восстановления не может быть раньше даты отказа.'),
+        ),
+        migrations.AddConstraint(
+            model_name='complaint',
+            constraint=models.CheckConstraint(check=models.Q(('downtime', apps.service.db_functions.DaysBetween(models.F('recovery_date'), models.F('failure_date')))), name='complaint_downtime_matches_dates', violation_error_message='Время простоя не соответствует датам отказа и восстановления.'),
+        ),
+        migrations.AddConstraint(
+            model_name='maintenance',
+            constraint=models.UniqueConstraint(fields=('machine', 'event_date', 'service_type'), name='unique_maintenance_event', violation_error_message='Запись о ТО с такими параметрами (машина, дата, вид ТО) уже существует в системе.'),
+        ),
+    ]
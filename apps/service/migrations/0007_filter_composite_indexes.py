@@ -0,0 +1,45 @@
+# Generated by Django 4.2.27 on 2026-10-19 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0006_data_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['machine', '-failure_date'], name='complaint_machine_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['failure_node', '-failure_date'], name='complaint_node_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['service_company', '-failure_date'], name='complaint_company_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='machine',
+            index=models.Index(fields=['service_company', '-date_shipment'], name='machine_service_shipment_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='machine',
+            index=models.Index(fields=['client', '-date_shipment'], name='machine_client_shipment_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='maintenance',
+            index=models.Index(fields=['machine', '-event_date'], name='maintenance_machine_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='maintenance',
+            index=models.Index(fields=['service_type', '-event_date'], name='maintenance_type_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='maintenance',
+            index=models.Index(fields=['service_company', '-event_date'], name='maintenance_company_date_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.27 on 2026-10-19 13:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('service', '0008_task_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Attachment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(max_length=255, upload_to='', verbose_name='Файл')),
+                ('sha256', models.CharField(db_index=True, max_length=64, verbose_name='SHA-256')),
+                ('original_name', models.CharField(max_length=255, verbose_name='Имя файла')),
+                ('content_type', models.CharField(blank=True, max_length=100, verbose_name='Тип содержимого')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Размер, байт')),
+                ('preview_status', models.CharField(choices=[('pending', 'Готовится'), ('ready', 'Готово'), ('none', 'Нет (не изображение)')], default='pending', max_length=10, verbose_name='Миниатюра')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Загружен')),
+                ('complaint', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='service.complaint', verbose_name='Рекламация')),
+                ('maintenance', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='service.maintenance', verbose_name='ТО')),
+                ('uploaded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Загрузил')),
+            ],
+            options={
+                'verbose_name': 'Вложение',
+                'verbose_name_plural': 'Вложения',
+                'ordering': ['created_at', 'id'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='attachment',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('complaint__isnull', False), ('maintenance__isnull', True)), models.Q(('complaint__isnull', True), ('maintenance__isnull', False)), _connector='OR'), name='attachment_single_owner', violation_error_message='Вложение относится либо к рекламации, либо к ТО.'),
+        ),
+    ]
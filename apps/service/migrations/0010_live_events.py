@@ -0,0 +1,31 @@
+# Generated by Django 4.2.27 on 2026-10-19 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0009_attachments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LiveEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=20, verbose_name='Модель')),
+                ('object_id', models.BigIntegerField(verbose_name='ID записи')),
+                ('action', models.CharField(choices=[('created', 'Создание'), ('updated', 'Изменение'), ('deleted', 'Удаление')], max_length=10, verbose_name='Действие')),
+                ('machine_id', models.BigIntegerField(verbose_name='ID машины')),
+                ('client_id', models.BigIntegerField(null=True, verbose_name='ID клиента')),
+                ('service_company_id', models.BigIntegerField(null=True, verbose_name='ID сервисной компании')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Создано')),
+            ],
+            options={
+                'verbose_name': 'Событие для подписчиков',
+                'verbose_name_plural': 'События для подписчиков',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.27 on 2026-10-19 13:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('service', '0010_live_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMaintenance',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('event_date', models.DateField(verbose_name='Дата проведения ТО')),
+                ('operating_hours', models.IntegerField(verbose_name='Наработка, м/час')),
+                ('order_number', models.CharField(max_length=255, verbose_name='№ заказ-наряда')),
+                ('order_date', models.DateField(verbose_name='Дата заказ-наряда')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Перенесено в архив')),
+                ('machine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='service.machine', verbose_name='Машина')),
+                ('service_company', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Организация, проводившая ТО')),
+                ('service_type', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='service.servicetype', verbose_name='Вид ТО')),
+            ],
+            options={
+                'verbose_name': 'Архивное ТО',
+                'verbose_name_plural': 'Архив ТО',
+                'ordering': ['event_date'],
+                'indexes': [models.Index(fields=['event_date'], name='archived_mnt_event_date_idx'), models.Index(fields=['machine', '-event_date'], name='archived_mnt_machine_date_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedComplaint',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('failure_date', models.DateField(verbose_name='Дата отказа')),
+                ('operating_hours', models.IntegerField(verbose_name='Наработка, м/час')),
+                ('failure_description', models.TextField(verbose_name='Описание отказа')),
+                ('spare_parts', models.TextField(blank=True, verbose_name='Используемые запасные части')),
+                ('recovery_date', models.DateField(verbose_name='Дата восстановления')),
+                ('downtime', models.IntegerField(blank=True, null=True, verbose_name='Время простоя техники (дни)')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Перенесено в архив')),
+                ('failure_node', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='service.failurenode', verbose_name='Узел отказа')),
+                ('machine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='service.machine', verbose_name='Машина')),
+                ('recovery_method', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='service.recoverymethod', verbose_name='Способ восстановления')),
+                ('service_company', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Сервисная компания')),
+            ],
+            options={
+                'verbose_name': 'Архивная рекламация',
+                'verbose_name_plural': 'Архив рекламаций',
+                'ordering': ['failure_date'],
+                'indexes': [models.Index(fields=['failure_date'], name='archived_cmp_failure_date_idx'), models.Index(fields=['machine', '-failure_date'], name='archived_cmp_machine_date_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.27 on 2026-10-19 13:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('service', '0011_archive_tier'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlaAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=30, verbose_name='Показатель')),
+                ('value', models.FloatField(verbose_name='Значение')),
+                ('threshold', models.FloatField(verbose_name='Порог')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('resolved_at', models.DateTimeField(blank=True, null=True, verbose_name='Закрыто')),
+                ('service_company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Сервисная компания')),
+            ],
+            options={
+                'verbose_name': 'Нарушение SLA',
+                'verbose_name_plural': 'Нарушения SLA',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SlaBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start', models.DateField(verbose_name='Неделя с')),
+                ('complaints', models.IntegerField(default=0, verbose_name='Рекламаций')),
+                ('downtime_sum', models.IntegerField(default=0, verbose_name='Сумма простоя, дней')),
+                ('downtime_histogram', models.JSONField(blank=True, default=list, verbose_name='Распределение простоя')),
+                ('repeat_failures', models.IntegerField(default=0, verbose_name='Повторных отказов')),
+                ('maintenances', models.IntegerField(default=0, verbose_name='ТО')),
+                ('maintenance_delay_sum', models.IntegerField(default=0, verbose_name='Сумма задержек ТО, дней')),
+                ('late_maintenances', models.IntegerField(default=0, verbose_name='ТО с опозданием')),
+                ('service_company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Сервисная компания')),
+            ],
+            options={
+                'verbose_name': 'Показатели SLA за неделю',
+                'verbose_name_plural': 'Показатели SLA по неделям',
+                'ordering': ['-week_start'],
+                'indexes': [models.Index(fields=['week_start'], name='sla_bucket_week_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='slabucket',
+            constraint=models.UniqueConstraint(fields=('service_company', 'week_start'), name='unique_sla_bucket'),
+        ),
+        migrations.AddConstraint(
+            model_name='slaalert',
+            constraint=models.UniqueConstraint(condition=models.Q(('resolved_at__isnull', True)), fields=('service_company', 'metric'), name='unique_open_sla_alert'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.27 on 2026-10-19 13:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0012_sla_monitoring'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MachineChange',
+            fields=[
+                ('machine', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='service.machine')),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Измененная машина',
+                'verbose_name_plural': 'Измененные машины',
+            },
+        ),
+        migrations.CreateModel(
+            name='DataQualityFinding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('hours_decrease', 'Наработка уменьшилась'), ('before_shipment', 'Событие раньше отгрузки'), ('recovery_before_failure', 'Восстановление раньше отказа'), ('overlapping_complaints', 'Пересекающиеся рекламации по узлу')], max_length=30, verbose_name='Ошибка')),
+                ('record_type', models.CharField(choices=[('maintenance', 'ТО'), ('complaint', 'Рекламация')], max_length=20, verbose_name='Запись')),
+                ('object_id', models.BigIntegerField(verbose_name='Id записи')),
+                ('record_date', models.DateField(verbose_name='Дата записи')),
+                ('related_type', models.CharField(blank=True, choices=[('maintenance', 'ТО'), ('complaint', 'Рекламация')], max_length=20, verbose_name='Связанная запись')),
+                ('related_object_id', models.BigIntegerField(blank=True, null=True, verbose_name='Id связанной записи')),
+                ('details', models.TextField(blank=True, verbose_name='Подробности')),
+                ('found_at', models.DateTimeField(auto_now_add=True, verbose_name='Найдено')),
+                ('machine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='service.machine', verbose_name='Машина')),
+            ],
+            options={
+                'verbose_name': 'Ошибка в данных',
+                'verbose_name_plural': 'Ошибки в данных',
+                'ordering': ['machine', 'record_date'],
+                'indexes': [models.Index(fields=['kind', 'record_date'], name='quality_finding_kind_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.27 on 2026-10-19 13:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0013_data_quality'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchRun',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Обработка')),
+                ('started_at', models.DateTimeField(verbose_name='Начата')),
+                ('finished_at', models.DateTimeField(verbose_name='Завершена')),
+                ('stats', models.JSONField(blank=True, default=dict, verbose_name='Итоги')),
+            ],
+            options={
+                'verbose_name': 'Пакетная обработка',
+                'verbose_name_plural': 'Пакетные обработки',
+            },
+        ),
+        migrations.CreateModel(
+            name='UsageForecast',
+            fields=[
+                ('machine', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='usage_forecast', serialize=False, to='service.machine', verbose_name='Машина')),
+                ('rate', models.FloatField(verbose_name='Темп, м/час в день')),
+                ('readings', models.IntegerField(verbose_name='Показаний')),
+                ('last_reading_date', models.DateField(verbose_name='Дата последнего показания')),
+                ('last_reading_hours', models.IntegerField(verbose_name='Последнее показание, м/час')),
+                ('projected_hours', models.IntegerField(verbose_name='Прогноз наработки на дату расчета, м/час')),
+                ('fitted_at', models.DateTimeField(verbose_name='Рассчитано')),
+            ],
+            options={
+                'verbose_name': 'Прогноз наработки',
+                'verbose_name_plural': 'Прогнозы наработки',
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.27 on 2026-10-19 13:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('service', '0014_usage_forecast'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SparePart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Название')),
+                ('description', models.TextField(blank=True, verbose_name='Описание')),
+                ('aliases', models.TextField(blank=True, verbose_name='Другие названия (по одному в строке)')),
+            ],
+            options={
+                'verbose_name': 'Запасная часть',
+                'verbose_name_plural': 'Справочник: Запасные части',
+            },
+        ),
+        migrations.CreateModel(
+            name='SparePartUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('complaint_id', models.BigIntegerField(db_index=True, verbose_name='Рекламация')),
+                ('quantity', models.IntegerField(default=1, verbose_name='Количество')),
+                ('raw', models.CharField(max_length=255, verbose_name='Текст')),
+                ('failure_date', models.DateField(verbose_name='Дата отказа')),
+                ('failure_node', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='service.failurenode', verbose_name='Узел отказа')),
+                ('part', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='service.sparepart', verbose_name='Запасная часть')),
+                ('service_company', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Сервисная компания')),
+                ('technique_model', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='service.techniquemodel', verbose_name='Модель техники')),
+            ],
+            options={
+                'verbose_name': 'Расход запчасти',
+                'verbose_name_plural': 'Расход запчастей',
+                'indexes': [models.Index(fields=['part', 'failure_date'], name='part_usage_part_date_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SparePartDemand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Месяц')),
+                ('quantity', models.IntegerField(default=0, verbose_name='Количество')),
+                ('complaints', models.IntegerField(default=0, verbose_name='Рекламаций')),
+                ('failure_node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='service.failurenode', verbose_name='Узел отказа')),
+                ('part', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='service.sparepart', verbose_name='Запасная часть')),
+                ('service_company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Сервисная компания')),
+                ('technique_model', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='service.techniquemodel', verbose_name='Модель техники')),
+            ],
+            options={
+                'verbose_name': 'Спрос на запчасть за месяц',
+                'verbose_name_plural': 'Спрос на запчасти по месяцам',
+                'indexes': [models.Index(fields=['month'], name='part_demand_month_idx'), models.Index(fields=['service_company', 'month'], name='part_demand_company_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='sparepartdemand',
+            constraint=models.UniqueConstraint(fields=('part', 'month', 'failure_node', 'technique_model', 'service_company'), name='unique_spare_part_demand'),
+        ),
+    ]
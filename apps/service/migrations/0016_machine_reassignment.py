@@ -0,0 +1,35 @@
+# Generated by Django 4.2.27 on 2026-10-19 13:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('service', '0015_spare_parts_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MachineReassignment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operation', models.UUIDField(db_index=True, verbose_name='Операция')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Выполнена')),
+                ('source', models.CharField(choices=[('admin', 'Админка'), ('command', 'Команда'), ('api', 'API')], max_length=10, verbose_name='Источник')),
+                ('machines', models.IntegerField(verbose_name='Машин')),
+                ('previous', models.JSONField(default=list, verbose_name='Прежние владельцы')),
+                ('client', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Новый клиент')),
+                ('service_company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Новая сервисная компания')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Передача машин',
+                'verbose_name_plural': 'Передачи машин',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.27 on 2026-10-19 13:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('service', '0016_machine_reassignment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataPack',
+            fields=[
+                ('scope_key', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Область видимости')),
+                ('version_key', models.CharField(blank=True, max_length=255, verbose_name='Версии данных')),
+                ('file_name', models.CharField(blank=True, max_length=255, verbose_name='Файл')),
+                ('size', models.BigIntegerField(default=0, verbose_name='Размер, байт')),
+                ('built_at', models.DateTimeField(blank=True, null=True, verbose_name='Собран')),
+                ('requested_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Последний запрос')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Пакет данных',
+                'verbose_name_plural': 'Пакеты данных',
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.27 on 2026-10-19 14:16
+
+from django.db import migrations, models
+
+
+def mark_packs_stale(apps, schema_editor):
+    """Пакеты, собранные до появления счетчиков, пересобираются при следующем скачивании"""
+    DataPack = apps.get_model('service', 'DataPack')
+    DataPack.objects.update(changes=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0018_task_dedup_pending_only'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datapack',
+            name='built_changes',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Изменений на момент сборки'),
+        ),
+        migrations.AddField(
+            model_name='datapack',
+            name='changes',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Изменений данных'),
+        ),
+        migrations.AddField(
+            model_name='datapack',
+            name='shrunk_changes',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Изменений на момент сужения'),
+        ),
+        migrations.RunPython(mark_packs_stale, migrations.RunPython.noop),
+    ]
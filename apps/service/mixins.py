@@ -1,29 +1,97 @@
+from functools import partial
+
 from django.contrib.auth.mixins import AccessMixin
+from django.db import IntegrityError, transaction
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from rest_framework.exceptions import ValidationError
+
+from .archive import reaches_archive
+from .conditional import conditional_get
+from .scope import get_role_scope
+from .services import get_constraint_violation_message
 
 
 class RoleBasedAccessMixin(AccessMixin):
     def get_queryset(self):
         queryset = super().get_queryset()
-        user = self.request.user
+        prefix = '' if queryset.model.__name__ == 'Machine' else 'machine__'
+        return get_role_scope(self.request.user).filter_machines(queryset, prefix=prefix)
+
+
+class ConstraintErrorMixin:
+    """
+    Ограничения целостности проверяются базой данных. Если запись не прошла
+    проверку (например, параллельно создан такой же ТО), форма возвращается
+    с понятной ошибкой вместо ответа 500.
+    """
+
+    def form_valid(self, form):
+        try:
+            with transaction.atomic():
+                return super().form_valid(form)
+        except IntegrityError as exc:
+            form.add_error(None, get_constraint_violation_message(exc, form._meta.model))
+            return self.form_invalid(form)
+
+
+class ConstraintErrorViewSetMixin:
+    """То же для API: IntegrityError превращается в ответ 400 с текстом нарушенного ограничения."""
+
+    def perform_save(self, save, serializer):
+        try:
+            with transaction.atomic():
+                save(serializer)
+        except IntegrityError as exc:
+            model = self.get_queryset().model
+            raise ValidationError({'non_field_errors': [get_constraint_violation_message(exc, model)]})
+
+    def perform_create(self, serializer):
+        self.perform_save(super().perform_create, serializer)
+
+    def perform_update(self, serializer):
+        self.perform_save(super().perform_update, serializer)
+
+
+class ConditionalGetMixin:
+    """
+    GET/HEAD отвечают 304, если данные из version_labels не менялись с прошлого
+    запроса клиента: страница не строится и запросы к данным не выполняются.
+    """
+    version_labels = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        return conditional_get(request, self.version_labels, partial(super().dispatch, request, *args, **kwargs))
+
+
+class ConditionalGetViewSetMixin:
+    """То же для API: проверка после аутентификации DRF, чтобы ETag учитывал пользователя запроса."""
+    version_labels = ()
+
+    def list(self, request, *args, **kwargs):
+        return conditional_get(request, self.version_labels, partial(super().list, request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_get(request, self.version_labels, partial(super().retrieve, request, *args, **kwargs))
 
-        if not user.is_authenticated:
-            return queryset.none()
 
-        if user.is_superuser or getattr(user, 'is_manager', False):
-            return queryset
+class ArchiveFallbackMixin:
+    """Карточка записи, перенесенной в архив, открывается по прежнему адресу (только просмотр)."""
+    archive_queryset = None  # функция (user) -> выборка архива в области видимости
 
-        model_name = queryset.model.__name__
+    def get_object(self, queryset=None):
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            return get_object_or_404(self.archive_queryset(self.request.user), pk=self.kwargs['pk'])
 
-        if getattr(user, 'is_service', False):
-            if model_name == 'Machine':
-                return queryset.filter(service_company=user)
-            elif model_name in ['Maintenance', 'Complaint']:
-                return queryset.filter(machine__service_company=user)
 
-        elif getattr(user, 'is_client', False):
-            if model_name == 'Machine':
-                return queryset.filter(client=user)
-            elif model_name in ['Maintenance', 'Complaint']:
-                return queryset.filter(machine__client=user)
+class ArchiveTierViewSetMixin:
+    """Список API с диапазоном дат, доходящим до архива, включает архивные записи (archived=true)."""
+    filtered_queryset = None  # функция (user, params) -> выборка по горячей таблице и архиву
 
-        return queryset.none()
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list' and reaches_archive(queryset.model, self.request.query_params):
+            return self.filtered_queryset(self.request.user, self.request.query_params)
+        return queryset
@@ -1,5 +1,10 @@
 from django.conf import settings
 from django.db import models
+from django.db.models import F, Q
+from django.db.models.functions import Upper
+from django.utils import timezone
+
+from .db_functions import DaysBetween
 
 
 class BaseCatalog(models.Model):
@@ -61,6 +66,15 @@ class RecoveryMethod(BaseCatalog):
         verbose_name_plural = 'Справочник: Способы восстановления'
 
 
+class SparePart(BaseCatalog):
+    # Другие написания, по которым разбор Complaint.spare_parts узнает запчасть (см. spareparts.py)
+    aliases = models.TextField(blank=True, verbose_name='Другие названия (по одному в строке)')
+
+    class Meta:
+        verbose_name = 'Запасная часть'
+        verbose_name_plural = 'Справочник: Запасные части'
+
+
 class Machine(models.Model):
     serial_number = models.CharField(max_length=255, unique=True, verbose_name='Зав. № машины')
     technique_model = models.ForeignKey(TechniqueModel, on_delete=models.PROTECT, verbose_name='Модель техники')
@@ -86,11 +100,39 @@ class Machine(models.Model):
         verbose_name = 'Машина'
         verbose_name_plural = 'Машины'
         ordering = ['date_shipment']
+        indexes = [
+            # Поиск по заводскому номеру без учета регистра (services.filter_serial_prefix)
+            models.Index(Upper('serial_number'), name='machine_serial_upper_idx'),
+            models.Index(fields=['date_shipment'], name='machine_shipment_idx'),
+            # Выборки в области видимости сервисной компании/клиента с сортировкой по дате отгрузки
+            models.Index(fields=['service_company', '-date_shipment'], name='machine_service_shipment_idx'),
+            models.Index(fields=['client', '-date_shipment'], name='machine_client_shipment_idx'),
+        ]
 
     def __str__(self):
         return f"{self.serial_number}"
 
 
+DUPLICATE_MAINTENANCE_MESSAGE = 'Запись о ТО с такими параметрами (машина, дата, вид ТО) уже существует в системе.'
+
+
+class MaintenanceQuerySet(models.QuerySet):
+    def upsert(self, objs, batch_size=None):
+        """
+        Пакетная запись ТО без построчной валидации: дубликаты (машина + дата + вид ТО)
+        разрешаются ограничением unique_maintenance_event на стороне БД.
+        """
+        created = self.bulk_create(
+            objs,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['machine', 'event_date', 'service_type'],
+            update_fields=['operating_hours', 'order_number', 'order_date', 'service_company'],
+        )
+        _bump_data_version('maintenance', using=self.db)
+        return created
+
+
 class Maintenance(models.Model):
     machine = models.ForeignKey(Machine, on_delete=models.CASCADE, related_name='maintenances', verbose_name='Машина')
     service_type = models.ForeignKey(ServiceType, on_delete=models.PROTECT, verbose_name='Вид ТО')
@@ -101,10 +143,79 @@ class Maintenance(models.Model):
 
     service_company = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, verbose_name='Организация, проводившая ТО')
 
+    objects = MaintenanceQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Техническое обслуживание'
         verbose_name_plural = 'Технические обслуживания'
         ordering = ['event_date']
+        indexes = [
+            models.Index(fields=['event_date'], name='maintenance_event_date_idx'),
+            models.Index(fields=['order_number'], name='maintenance_order_number_idx'),
+            # Фильтр по значению справочника/машине + диапазон дат (filters.MaintenanceFilter)
+            models.Index(fields=['machine', '-event_date'], name='maintenance_machine_date_idx'),
+            models.Index(fields=['service_type', '-event_date'], name='maintenance_type_date_idx'),
+            models.Index(fields=['service_company', '-event_date'], name='maintenance_company_date_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['machine', 'event_date', 'service_type'],
+                name='unique_maintenance_event',
+                violation_error_message=DUPLICATE_MAINTENANCE_MESSAGE,
+            ),
+        ]
+
+
+class ComplaintQuerySet(models.QuerySet):
+    """
+    Поддерживает Complaint.downtime в массовых операциях, которые обходят save():
+    update(), bulk_create() и bulk_update(). Согласованность дополнительно
+    проверяет ограничение complaint_downtime_matches_dates.
+    """
+
+    def update(self, **kwargs):
+        if ('failure_date' in kwargs or 'recovery_date' in kwargs) and 'downtime' not in kwargs:
+            kwargs['downtime'] = DaysBetween(
+                _date_value(kwargs.get('recovery_date', F('recovery_date'))),
+                _date_value(kwargs.get('failure_date', F('failure_date'))),
+            )
+        rows = super().update(**kwargs)
+        _bump_data_version('complaint', using=self.db)
+        return rows
+
+    update.alters_data = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.downtime = obj.compute_downtime()
+        created = super().bulk_create(objs, *args, **kwargs)
+        _bump_data_version('complaint', using=self.db)
+        return created
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        fields = list(fields)
+        if 'failure_date' in fields or 'recovery_date' in fields:
+            objs = list(objs)
+            for obj in objs:
+                obj.downtime = obj.compute_downtime()
+            if 'downtime' not in fields:
+                fields.append('downtime')
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        _bump_data_version('complaint', using=self.db)
+        return rows
+
+
+def _bump_data_version(label, using):
+    # Массовые операции не отправляют post_save, версия данных увеличивается явно
+    from .versioning import bump_data_version
+    bump_data_version(label, using=using)
+
+
+def _date_value(value):
+    if hasattr(value, 'resolve_expression'):
+        return value
+    return models.Value(value, output_field=models.DateField())
 
 
 class Complaint(models.Model):
@@ -121,13 +232,556 @@ class Complaint(models.Model):
 
     service_company = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, verbose_name='Сервисная компания')
 
+    objects = ComplaintQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Рекламация'
         verbose_name_plural = 'Рекламации'
         ordering = ['failure_date']
+        indexes = [
+            models.Index(fields=['failure_date'], name='complaint_failure_date_idx'),
+            # Фильтр по значению справочника/машине + диапазон дат (filters.ComplaintFilter)
+            models.Index(fields=['machine', '-failure_date'], name='complaint_machine_date_idx'),
+            models.Index(fields=['failure_node', '-failure_date'], name='complaint_node_date_idx'),
+            models.Index(fields=['service_company', '-failure_date'], name='complaint_company_date_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=Q(recovery_date__gte=F('failure_date')),
+                name='complaint_recovery_after_failure',
+                violation_error_message='Дата восстановления не может быть раньше даты отказа.',
+            ),
+            models.CheckConstraint(
+                check=Q(downtime=DaysBetween(F('recovery_date'), F('failure_date'))),
+                name='complaint_downtime_matches_dates',
+                violation_error_message='Время простоя не соответствует датам отказа и восстановления.',
+            ),
+        ]
+
+    def compute_downtime(self):
+        if self.recovery_date and self.failure_date:
+            return (self.recovery_date - self.failure_date).days
+        return None
 
     def save(self, *args, **kwargs):
-        if self.recovery_date and self.failure_date:
-            delta = self.recovery_date - self.failure_date
-            self.downtime = delta.days
-        super().save(*args, **kwargs)
\ No newline at end of file
+        self.downtime = self.compute_downtime()
+        super().save(*args, **kwargs)
+
+
+class DataVersion(models.Model):
+    """
+    Счетчик версий данных по типам записей (machine, maintenance, complaint, catalog, user).
+
+    Увеличивается после каждой фиксированной записи (см. versioning.py) и служит
+    частью ключей кэша: при изменении данных старые ключи просто перестают использоваться.
+    """
+    label = models.CharField(max_length=50, primary_key=True, verbose_name='Тип данных')
+    version = models.PositiveBigIntegerField(default=0, verbose_name='Версия')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Изменено')
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f"{self.label}: {self.version}"
+
+
+class Task(models.Model):
+    """
+    Фоновая задача очереди в базе данных (см. tasks.py и manage.py run_worker).
+
+    Создается в той же транзакции, что и запись, которая ее породила: при откате
+    задача исчезает вместе с записью, а после фиксации ее подхватывает воркер.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Ожидает'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(max_length=100, verbose_name='Задача')
+    payload = models.JSONField(default=dict, blank=True, verbose_name='Параметры')
+    dedup_key = models.CharField(max_length=255, null=True, blank=True, verbose_name='Ключ дедупликации')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, verbose_name='Статус')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попыток')
+    max_attempts = models.PositiveIntegerField(default=5, verbose_name='Максимум попыток')
+    run_at = models.DateTimeField(default=timezone.now, verbose_name='Запустить не раньше')
+    locked_by = models.CharField(max_length=100, blank=True, verbose_name='Воркер')
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name='Взята в работу')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создана')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Завершена')
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        ordering = ['run_at', 'id']
+        indexes = [
+            # Выборка воркера: ожидающие задачи одного типа, срок которых наступил
+            models.Index(fields=['status', 'name', 'run_at'], name='task_queue_idx'),
+        ]
+        constraints = [
+            # Пока задача с ключом ждет, такая же не ставится повторно. Во время выполнения - ставится:
+            # выполняемая задача могла уже прочитать данные и не увидит запись, ради которой ставят новую
+            models.UniqueConstraint(
+                fields=['dedup_key'],
+                condition=Q(status='pending'),
+                name='unique_pending_task_dedup_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.get_status_display()})"
+
+
+def attachment_path(sha256, variant='original'):
+    """Путь файла в хранилище по хэшу содержимого: одинаковые файлы хранятся один раз."""
+    return f'attachments/{variant}/{sha256[:2]}/{sha256[2:4]}/{sha256}'
+
+
+class Attachment(models.Model):
+    """
+    Файл (фото отказа, акт и т.п.), приложенный к рекламации или ТО.
+
+    Содержимое хранится по SHA-256 (attachment_path): повторная загрузка того же файла
+    не занимает места. Миниатюру и превью картинки строит фоновая задача.
+    """
+    PREVIEW_PENDING = 'pending'
+    PREVIEW_READY = 'ready'
+    PREVIEW_NONE = 'none'
+    PREVIEW_CHOICES = (
+        (PREVIEW_PENDING, 'Готовится'),
+        (PREVIEW_READY, 'Готово'),
+        (PREVIEW_NONE, 'Нет (не изображение)'),
+    )
+
+    complaint = models.ForeignKey(Complaint, on_delete=models.CASCADE, null=True, blank=True,
+                                  related_name='attachments', verbose_name='Рекламация')
+    maintenance = models.ForeignKey(Maintenance, on_delete=models.CASCADE, null=True, blank=True,
+                                    related_name='attachments', verbose_name='ТО')
+    file = models.FileField(max_length=255, verbose_name='Файл')
+    sha256 = models.CharField(max_length=64, db_index=True, verbose_name='SHA-256')
+    original_name = models.CharField(max_length=255, verbose_name='Имя файла')
+    content_type = models.CharField(max_length=100, blank=True, verbose_name='Тип содержимого')
+    size = models.PositiveBigIntegerField(verbose_name='Размер, байт')
+    preview_status = models.CharField(max_length=10, choices=PREVIEW_CHOICES, default=PREVIEW_PENDING,
+                                      verbose_name='Миниатюра')
+    uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='+', verbose_name='Загрузил')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Загружен')
+
+    class Meta:
+        verbose_name = 'Вложение'
+        verbose_name_plural = 'Вложения'
+        ordering = ['created_at', 'id']
+        constraints = [
+            models.CheckConstraint(
+                check=Q(complaint__isnull=False, maintenance__isnull=True)
+                | Q(complaint__isnull=True, maintenance__isnull=False),
+                name='attachment_single_owner',
+                violation_error_message='Вложение относится либо к рекламации, либо к ТО.',
+            ),
+        ]
+
+    def __str__(self):
+        return self.original_name
+
+    @property
+    def is_image(self):
+        return self.preview_status == self.PREVIEW_READY
+
+    def variant_path(self, variant):
+        return attachment_path(self.sha256, variant)
+
+
+class LiveEvent(models.Model):
+    """
+    Журнал изменений ТО и рекламаций для потока /live/ (см. live.py).
+
+    Запись создается в той же транзакции, что и изменение; процессы ASGI читают
+    журнал по возрастанию id и рассылают события подписчикам, которым видна машина.
+    """
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    ACTION_CHOICES = (
+        (CREATED, 'Создание'),
+        (UPDATED, 'Изменение'),
+        (DELETED, 'Удаление'),
+    )
+
+    model = models.CharField(max_length=20, verbose_name='Модель')
+    object_id = models.BigIntegerField(verbose_name='ID записи')
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, verbose_name='Действие')
+    # Не внешние ключи: событие об удалении переживает машину и пользователей
+    machine_id = models.BigIntegerField(verbose_name='ID машины')
+    client_id = models.BigIntegerField(null=True, verbose_name='ID клиента')
+    service_company_id = models.BigIntegerField(null=True, verbose_name='ID сервисной компании')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Создано')
+
+    class Meta:
+        verbose_name = 'Событие для подписчиков'
+        verbose_name_plural = 'События для подписчиков'
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.model} {self.object_id}: {self.action}"
+
+
+class ArchivedMaintenance(models.Model):
+    """
+    ТО старше горизонта архивации (см. archive.py): те же поля и id, что у Maintenance.
+
+    Горячая таблица Maintenance и ее индексы остаются ограниченными по размеру;
+    архив читается только запросами с диапазоном дат, который до него доходит.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    machine = models.ForeignKey(Machine, on_delete=models.CASCADE, related_name='+', verbose_name='Машина')
+    service_type = models.ForeignKey(ServiceType, on_delete=models.PROTECT, related_name='+', verbose_name='Вид ТО')
+    event_date = models.DateField(verbose_name='Дата проведения ТО')
+    operating_hours = models.IntegerField(verbose_name='Наработка, м/час')
+    order_number = models.CharField(max_length=255, verbose_name='№ заказ-наряда')
+    order_date = models.DateField(verbose_name='Дата заказ-наряда')
+    service_company = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, related_name='+',
+                                        verbose_name='Организация, проводившая ТО')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='Перенесено в архив')
+
+    # Как у записей архива в общей выборке (archive.union_tiers): шаблоны скрывают изменение и вложения
+    archived = True
+
+    class Meta:
+        verbose_name = 'Архивное ТО'
+        verbose_name_plural = 'Архив ТО'
+        ordering = ['event_date']
+        indexes = [
+            models.Index(fields=['event_date'], name='archived_mnt_event_date_idx'),
+            models.Index(fields=['machine', '-event_date'], name='archived_mnt_machine_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"ТО {self.id} от {self.event_date} (архив)"
+
+
+class ArchivedComplaint(models.Model):
+    """Рекламация старше горизонта архивации: те же поля и id, что у Complaint."""
+    id = models.BigIntegerField(primary_key=True)
+    machine = models.ForeignKey(Machine, on_delete=models.CASCADE, related_name='+', verbose_name='Машина')
+    failure_date = models.DateField(verbose_name='Дата отказа')
+    operating_hours = models.IntegerField(verbose_name='Наработка, м/час')
+    failure_node = models.ForeignKey(FailureNode, on_delete=models.PROTECT, related_name='+',
+                                     verbose_name='Узел отказа')
+    failure_description = models.TextField(verbose_name='Описание отказа')
+    recovery_method = models.ForeignKey(RecoveryMethod, on_delete=models.PROTECT, related_name='+',
+                                        verbose_name='Способ восстановления')
+    spare_parts = models.TextField(blank=True, verbose_name='Используемые запасные части')
+    recovery_date = models.DateField(verbose_name='Дата восстановления')
+    downtime = models.IntegerField(verbose_name='Время простоя техники (дни)', blank=True, null=True)
+    service_company = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, related_name='+',
+                                        verbose_name='Сервисная компания')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='Перенесено в архив')
+
+    archived = True
+
+    class Meta:
+        verbose_name = 'Архивная рекламация'
+        verbose_name_plural = 'Архив рекламаций'
+        ordering = ['failure_date']
+        indexes = [
+            models.Index(fields=['failure_date'], name='archived_cmp_failure_date_idx'),
+            models.Index(fields=['machine', '-failure_date'], name='archived_cmp_machine_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Рекламация {self.id} от {self.failure_date} (архив)"
+
+
+class SlaBucket(models.Model):
+    """
+    Состояние показателей сервисной компании за неделю (по дате отказа / дате ТО), см. sla.py.
+
+    Обновляется приращениями при каждой записи рекламации или ТО, поэтому рейтинг за скользящее
+    окно складывается из нескольких строк на компанию, а не из всех рекламаций.
+    """
+    service_company = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+',
+                                        verbose_name='Сервисная компания')
+    week_start = models.DateField(verbose_name='Неделя с')
+    complaints = models.IntegerField(default=0, verbose_name='Рекламаций')
+    downtime_sum = models.IntegerField(default=0, verbose_name='Сумма простоя, дней')
+    # Гистограмма простоя по границам sla.DOWNTIME_BINS: оценка перцентилей без исходных записей
+    downtime_histogram = models.JSONField(default=list, blank=True, verbose_name='Распределение простоя')
+    repeat_failures = models.IntegerField(default=0, verbose_name='Повторных отказов')
+    maintenances = models.IntegerField(default=0, verbose_name='ТО')
+    maintenance_delay_sum = models.IntegerField(default=0, verbose_name='Сумма задержек ТО, дней')
+    late_maintenances = models.IntegerField(default=0, verbose_name='ТО с опозданием')
+
+    class Meta:
+        verbose_name = 'Показатели SLA за неделю'
+        verbose_name_plural = 'Показатели SLA по неделям'
+        ordering = ['-week_start']
+        constraints = [
+            models.UniqueConstraint(fields=['service_company', 'week_start'], name='unique_sla_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['week_start'], name='sla_bucket_week_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.service_company_id}: {self.week_start}"
+
+
+class SlaAlert(models.Model):
+    """Превышение порога показателем сервисной компании за скользящее окно; закрывается, когда показатель вернулся."""
+    service_company = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+',
+                                        verbose_name='Сервисная компания')
+    metric = models.CharField(max_length=30, verbose_name='Показатель')
+    value = models.FloatField(verbose_name='Значение')
+    threshold = models.FloatField(verbose_name='Порог')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
+    resolved_at = models.DateTimeField(null=True, blank=True, verbose_name='Закрыто')
+
+    class Meta:
+        verbose_name = 'Нарушение SLA'
+        verbose_name_plural = 'Нарушения SLA'
+        ordering = ['-created_at']
+        constraints = [
+            # По показателю компании одновременно открыто не больше одного нарушения
+            models.UniqueConstraint(
+                fields=['service_company', 'metric'], condition=Q(resolved_at__isnull=True),
+                name='unique_open_sla_alert',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.service_company_id} {self.metric}: {self.value:.2f} > {self.threshold:.2f}"
+
+
+class DataQualityFinding(models.Model):
+    """Ошибка в данных машины, найденная командой scan_data_quality (см. quality.py)."""
+    HOURS_DECREASE = 'hours_decrease'
+    BEFORE_SHIPMENT = 'before_shipment'
+    RECOVERY_BEFORE_FAILURE = 'recovery_before_failure'
+    OVERLAPPING_COMPLAINTS = 'overlapping_complaints'
+
+    KIND_CHOICES = (
+        (HOURS_DECREASE, 'Наработка уменьшилась'),
+        (BEFORE_SHIPMENT, 'Событие раньше отгрузки'),
+        (RECOVERY_BEFORE_FAILURE, 'Восстановление раньше отказа'),
+        (OVERLAPPING_COMPLAINTS, 'Пересекающиеся рекламации по узлу'),
+    )
+    RECORD_CHOICES = (
+        ('maintenance', 'ТО'),
+        ('complaint', 'Рекламация'),
+    )
+
+    machine = models.ForeignKey(Machine, on_delete=models.CASCADE, related_name='+', verbose_name='Машина')
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES, verbose_name='Ошибка')
+    record_type = models.CharField(max_length=20, choices=RECORD_CHOICES, verbose_name='Запись')
+    object_id = models.BigIntegerField(verbose_name='Id записи')
+    record_date = models.DateField(verbose_name='Дата записи')
+    related_type = models.CharField(max_length=20, choices=RECORD_CHOICES, blank=True, verbose_name='Связанная запись')
+    related_object_id = models.BigIntegerField(null=True, blank=True, verbose_name='Id связанной записи')
+    details = models.TextField(blank=True, verbose_name='Подробности')
+    found_at = models.DateTimeField(auto_now_add=True, verbose_name='Найдено')
+
+    class Meta:
+        verbose_name = 'Ошибка в данных'
+        verbose_name_plural = 'Ошибки в данных'
+        ordering = ['machine', 'record_date']
+        indexes = [
+            models.Index(fields=['kind', 'record_date'], name='quality_finding_kind_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.get_record_type_display()} {self.object_id}"
+
+
+class MachineChange(models.Model):
+    """
+    Когда последний раз менялись машина, ее ТО или рекламации. Пакетные обработки с --incremental
+    (scan_data_quality, fit_usage_forecasts) берут машины, измененные после своего прошлого запуска (BatchRun).
+    """
+    machine = models.OneToOneField(Machine, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Измененная машина'
+        verbose_name_plural = 'Измененные машины'
+
+
+class BatchRun(models.Model):
+    """Последний успешный запуск пакетной обработки парка машин: граница для следующего --incremental."""
+    name = models.CharField(max_length=50, primary_key=True, verbose_name='Обработка')
+    started_at = models.DateTimeField(verbose_name='Начата')
+    finished_at = models.DateTimeField(verbose_name='Завершена')
+    stats = models.JSONField(default=dict, blank=True, verbose_name='Итоги')
+
+    class Meta:
+        verbose_name = 'Пакетная обработка'
+        verbose_name_plural = 'Пакетные обработки'
+
+    def __str__(self):
+        return f"{self.name}: {self.started_at}"
+
+
+class UsageForecast(models.Model):
+    """
+    Темп наработки машины (м/час в день), оцененный по показаниям наработки в ТО и рекламациях
+    (см. forecast.py), и прогноз наработки от последнего показания.
+    """
+    machine = models.OneToOneField(Machine, on_delete=models.CASCADE, primary_key=True,
+                                   related_name='usage_forecast', verbose_name='Машина')
+    rate = models.FloatField(verbose_name='Темп, м/час в день')
+    readings = models.IntegerField(verbose_name='Показаний')
+    last_reading_date = models.DateField(verbose_name='Дата последнего показания')
+    last_reading_hours = models.IntegerField(verbose_name='Последнее показание, м/час')
+    projected_hours = models.IntegerField(verbose_name='Прогноз наработки на дату расчета, м/час')
+    fitted_at = models.DateTimeField(verbose_name='Рассчитано')
+
+    class Meta:
+        verbose_name = 'Прогноз наработки'
+        verbose_name_plural = 'Прогнозы наработки'
+
+    def __str__(self):
+        return f"{self.machine_id}: {self.rate:.1f} м/час в день"
+
+    def projected_hours_on(self, day):
+        """Наработка на дату: от последнего показания с оцененным темпом (то же, что forecast.projected_hours)."""
+        days = (day - self.last_reading_date).days
+        return max(self.last_reading_hours + round(self.rate * days), 0)
+
+
+class SparePartUsage(models.Model):
+    """
+    Запчасть, указанная в рекламации (разбор текста Complaint.spare_parts, см. spareparts.py).
+
+    Рекламация хранится числом, а не внешним ключом: при переносе в архив строки журнала остаются.
+    Измерения спроса скопированы из рекламации, чтобы удаление строки вычиталось из SparePartDemand
+    без обращения к рекламации.
+    """
+    complaint_id = models.BigIntegerField(db_index=True, verbose_name='Рекламация')
+    part = models.ForeignKey(SparePart, on_delete=models.PROTECT, null=True, blank=True, related_name='+',
+                             verbose_name='Запасная часть')
+    quantity = models.IntegerField(default=1, verbose_name='Количество')
+    # Фрагмент текста рекламации; строки без запчасти - кандидаты в справочник или его другие названия
+    raw = models.CharField(max_length=255, verbose_name='Текст')
+    failure_date = models.DateField(verbose_name='Дата отказа')
+    failure_node = models.ForeignKey(FailureNode, on_delete=models.PROTECT, related_name='+', verbose_name='Узел отказа')
+    technique_model = models.ForeignKey(TechniqueModel, on_delete=models.PROTECT, related_name='+',
+                                        verbose_name='Модель техники')
+    service_company = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, related_name='+',
+                                        verbose_name='Сервисная компания')
+
+    class Meta:
+        verbose_name = 'Расход запчасти'
+        verbose_name_plural = 'Расход запчастей'
+        indexes = [
+            models.Index(fields=['part', 'failure_date'], name='part_usage_part_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.raw} x{self.quantity} (рекламация {self.complaint_id})"
+
+
+class SparePartDemand(models.Model):
+    """
+    Расход запчасти за месяц в разрезе узла отказа, модели техники и сервисной компании.
+
+    Поддерживается приращениями вместе с SparePartUsage; отчеты о спросе суммируют эти строки.
+    """
+    month = models.DateField(verbose_name='Месяц')
+    part = models.ForeignKey(SparePart, on_delete=models.CASCADE, related_name='+', verbose_name='Запасная часть')
+    failure_node = models.ForeignKey(FailureNode, on_delete=models.CASCADE, related_name='+', verbose_name='Узел отказа')
+    technique_model = models.ForeignKey(TechniqueModel, on_delete=models.CASCADE, related_name='+',
+                                        verbose_name='Модель техники')
+    service_company = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+',
+                                        verbose_name='Сервисная компания')
+    quantity = models.IntegerField(default=0, verbose_name='Количество')
+    complaints = models.IntegerField(default=0, verbose_name='Рекламаций')
+
+    class Meta:
+        verbose_name = 'Спрос на запчасть за месяц'
+        verbose_name_plural = 'Спрос на запчасти по месяцам'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['part', 'month', 'failure_node', 'technique_model', 'service_company'],
+                name='unique_spare_part_demand',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['month'], name='part_demand_month_idx'),
+            models.Index(fields=['service_company', 'month'], name='part_demand_company_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.part_id} {self.month}: {self.quantity}"
+
+
+class MachineReassignment(models.Model):
+    """
+    Пачка массовой передачи машин другому клиенту или сервисной компании (см. reassignment.py):
+    одна запись на пачку UPDATE с прежними владельцами машин, пачки одной операции - общий operation.
+    """
+    ADMIN = 'admin'
+    COMMAND = 'command'
+    API = 'api'
+    SOURCE_CHOICES = (
+        (ADMIN, 'Админка'),
+        (COMMAND, 'Команда'),
+        (API, 'API'),
+    )
+
+    operation = models.UUIDField(db_index=True, verbose_name='Операция')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Выполнена')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                             related_name='+', verbose_name='Пользователь')
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, verbose_name='Источник')
+    client = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                               related_name='+', verbose_name='Новый клиент')
+    service_company = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                        related_name='+', verbose_name='Новая сервисная компания')
+    machines = models.IntegerField(verbose_name='Машин')
+    # [[id машины, прежний клиент, прежняя сервисная компания], ...]
+    previous = models.JSONField(default=list, verbose_name='Прежние владельцы')
+
+    class Meta:
+        verbose_name = 'Передача машин'
+        verbose_name_plural = 'Передачи машин'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.operation}: {self.machines} машин"
+
+
+class DataPack(models.Model):
+    """
+    Пакет данных для работы без связи (см. datapack.py): файл SQLite со всеми машинами, ТО,
+    рекламациями и справочниками области видимости. Один на область видимости (RoleScope.key),
+    пересобирается в фоне при скачивании, если после сборки менялись данные этой области.
+    """
+    scope_key = models.CharField(max_length=100, primary_key=True, verbose_name='Область видимости')
+    # Пользователь, по чьей области видимости собирается пакет (последний, кто его запросил)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+',
+                             verbose_name='Пользователь')
+    version_key = models.CharField(max_length=255, blank=True, verbose_name='Версии данных')
+    file_name = models.CharField(max_length=255, blank=True, verbose_name='Файл')
+    size = models.BigIntegerField(default=0, verbose_name='Размер, байт')
+    built_at = models.DateTimeField(null=True, blank=True, verbose_name='Собран')
+    requested_at = models.DateTimeField(default=timezone.now, verbose_name='Последний запрос')
+    # Счетчик изменений данных области видимости (datapack.mark_stale), его значение на момент сборки
+    # файла и на момент последнего сужения области (машины ушли к другому владельцу)
+    changes = models.PositiveBigIntegerField(default=0, verbose_name='Изменений данных')
+    built_changes = models.PositiveBigIntegerField(default=0, verbose_name='Изменений на момент сборки')
+    shrunk_changes = models.PositiveBigIntegerField(default=0, verbose_name='Изменений на момент сужения')
+
+    class Meta:
+        verbose_name = 'Пакет данных'
+        verbose_name_plural = 'Пакеты данных'
+
+    def __str__(self):
+        return f"{self.scope_key}: {self.version_key or 'не собран'}"
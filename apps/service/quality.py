@@ -0,0 +1,239 @@
+import time
+from datetime import date, timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import DateField, F, Value
+from django.utils import timezone
+
+from .archive import TIERS
+from .db_functions import DaysBetween
+from .models import BatchRun, DataQualityFinding, Machine, MachineChange, Maintenance
+
+EPOCH = date(1970, 1, 1)
+MAINTENANCE, COMPLAINT = 0, 1
+RECORD_TYPES = ('maintenance', 'complaint')
+# Колонки событий: даты - дни от EPOCH (считает база), end и node есть только у рекламаций
+EVENT_DTYPE = np.dtype([
+    ('machine', 'i8'), ('day', 'i8'), ('hours', 'i8'), ('id', 'i8'),
+    ('record', 'i8'), ('end', 'i8'), ('node', 'i8'),
+])
+CHUNK_SIZE = 20000
+SCAN_NAME = 'data_quality'
+# Машин в одном условии IN при --incremental (ограничение числа параметров SQLite)
+MACHINE_BATCH = 500
+
+
+def get_changed_machines(name, started):
+    """
+    Машины, изменившиеся после прошлого запуска обработки name, или None,
+    если она еще не запускалась (нужна полная обработка).
+    """
+    previous = BatchRun.objects.filter(name=name).values_list('started_at', flat=True).first()
+    if previous is None:
+        return None
+    return list(
+        MachineChange.objects.filter(changed_at__gte=previous, changed_at__lte=started)
+        .values_list('machine_id', flat=True)
+    )
+
+
+def record_batch_run(name, started, stats, using='default'):
+    # Граница - начало запуска: изменения во время обработки попадут в следующий
+    BatchRun.objects.using(using).update_or_create(
+        name=name, defaults={'started_at': started, 'finished_at': timezone.now(), 'stats': stats}
+    )
+
+
+def _days(field):
+    return DaysBetween(F(field), Value(EPOCH, output_field=DateField()))
+
+
+def day_to_date(day):
+    return EPOCH + timedelta(days=int(day))
+
+
+def machine_batches(machines):
+    if machines is None:
+        yield None
+        return
+    for start in range(0, len(machines), MACHINE_BATCH):
+        yield machines[start:start + MACHINE_BATCH]
+
+
+def _event_querysets(machines=None):
+    """По выборке на таблицу (ТО, рекламации и их архивы), только нужные колонки без сортировки."""
+    for model, (archive_model, _, _) in TIERS.items():
+        for tier in (model, archive_model):
+            queryset = tier.objects.order_by()
+            if machines is not None:
+                queryset = queryset.filter(machine_id__in=machines)
+            if model is Maintenance:
+                queryset = queryset.annotate(
+                    day=_days('event_date'), record=Value(MAINTENANCE), end=Value(0), node=Value(0)
+                )
+            else:
+                queryset = queryset.annotate(
+                    day=_days('failure_date'), record=Value(COMPLAINT), end=_days('recovery_date'),
+                    node=F('failure_node_id'),
+                )
+            yield queryset.values_list('machine_id', 'day', 'operating_hours', 'id', 'record', 'end', 'node')
+
+
+def load_events(machines=None):
+    """
+    Все события машин в одном структурированном массиве, упорядоченном по машине, дате и наработке.
+
+    Строки читаются потоком (iterator) прямо в массивы NumPy без объектов моделей;
+    сортировка выполняется здесь, а не в базе.
+    """
+    parts = [
+        np.fromiter(queryset.iterator(chunk_size=CHUNK_SIZE), dtype=EVENT_DTYPE)
+        for batch in machine_batches(machines)
+        for queryset in _event_querysets(batch)
+    ]
+    events = np.concatenate(parts or [np.empty(0, dtype=EVENT_DTYPE)])
+    order = np.lexsort((events['id'], events['hours'], events['day'], events['machine']))
+    return events[order]
+
+
+def load_shipments(machines=None):
+    """Id машин по возрастанию и даты их отгрузки (дни от EPOCH)."""
+    dtype = [('machine', 'i8'), ('day', 'i8')]
+    parts = []
+    for batch in machine_batches(machines):
+        queryset = Machine.objects.order_by('id')
+        if batch is not None:
+            queryset = queryset.filter(id__in=batch)
+        rows = queryset.annotate(day=_days('date_shipment')).values_list('id', 'day')
+        parts.append(np.fromiter(rows.iterator(chunk_size=CHUNK_SIZE), dtype=dtype))
+    shipments = np.sort(np.concatenate(parts or [np.empty(0, dtype=dtype)]), order='machine')
+    return shipments['machine'], shipments['day']
+
+
+def find_hours_decrease(events):
+    """Наработка меньше, чем в предыдущем событии той же машины: (индексы, индексы предыдущих)."""
+    machine, hours = events['machine'], events['hours']
+    flagged = np.flatnonzero((machine[1:] == machine[:-1]) & (hours[1:] < hours[:-1])) + 1
+    return flagged, flagged - 1
+
+
+def find_before_shipment(events, machine_ids, shipment_days):
+    if not len(machine_ids):
+        return np.flatnonzero(np.zeros(len(events), dtype=bool)), np.zeros(len(events), dtype='i8')
+    position = np.searchsorted(machine_ids, events['machine'])
+    known = position < len(machine_ids)
+    known[known] = machine_ids[position[known]] == events['machine'][known]
+    shipment = np.where(known, shipment_days[np.minimum(position, len(machine_ids) - 1)], np.iinfo('i8').min)
+    return np.flatnonzero(events['day'] < shipment), shipment
+
+
+def find_recovery_before_failure(events):
+    return np.flatnonzero((events['record'] == COMPLAINT) & (events['end'] < events['day']))
+
+
+def find_overlapping_complaints(events):
+    """
+    Отказ узла раньше восстановления предыдущего отказа того же узла машины:
+    (индексы рекламаций, индексы рекламаций с самым поздним восстановлением до них).
+    """
+    complaints = np.flatnonzero(events['record'] == COMPLAINT)
+    if not len(complaints):
+        return complaints, complaints
+    subset = events[complaints]
+    order = np.lexsort((subset['id'], subset['day'], subset['node'], subset['machine']))
+    complaints, subset = complaints[order], subset[order]
+    machine, node, day, end = subset['machine'], subset['node'], subset['day'], subset['end']
+    starts = np.ones(len(subset), dtype=bool)
+    starts[1:] = (machine[1:] != machine[:-1]) | (node[1:] != node[:-1])
+    group = np.cumsum(starts) - 1
+    # Скользящий максимум даты восстановления внутри группы одним проходом: группы разнесены сдвигом
+    base = end.min()
+    span = end.max() - base + 1
+    shifted = end - base + group * span
+    running = np.maximum.accumulate(shifted)
+    holder = np.maximum.accumulate(np.where(shifted == running, np.arange(len(subset)), 0))
+    previous_end = np.full_like(end, base)
+    previous_end[1:] = running[:-1] - group[1:] * span + base
+    flagged = np.flatnonzero(~starts & (day < previous_end))
+    return complaints[flagged], complaints[holder[flagged - 1]]
+
+
+def build_findings(events, machine_ids, shipment_days):
+    findings = []
+
+    def add(kind, index, related=None, details=''):
+        event = events[index]
+        finding = DataQualityFinding(
+            machine_id=int(event['machine']),
+            kind=kind,
+            record_type=RECORD_TYPES[event['record']],
+            object_id=int(event['id']),
+            record_date=day_to_date(event['day']),
+            details=details,
+        )
+        if related is not None:
+            finding.related_type = RECORD_TYPES[events[related]['record']]
+            finding.related_object_id = int(events[related]['id'])
+        findings.append(finding)
+
+    flagged, previous = find_hours_decrease(events)
+    for index, related in zip(flagged, previous):
+        add(DataQualityFinding.HOURS_DECREASE, index, related, (
+            f"Наработка {events[index]['hours']} м/час меньше {events[related]['hours']} м/час "
+            f"в записи от {day_to_date(events[related]['day']):%d.%m.%Y}"
+        ))
+    flagged, shipment = find_before_shipment(events, machine_ids, shipment_days)
+    for index in flagged:
+        add(DataQualityFinding.BEFORE_SHIPMENT, index, details=(
+            f"Дата {day_to_date(events[index]['day']):%d.%m.%Y} раньше отгрузки {day_to_date(shipment[index]):%d.%m.%Y}"
+        ))
+    for index in find_recovery_before_failure(events):
+        add(DataQualityFinding.RECOVERY_BEFORE_FAILURE, index, details=(
+            f"Восстановление {day_to_date(events[index]['end']):%d.%m.%Y} "
+            f"раньше отказа {day_to_date(events[index]['day']):%d.%m.%Y}"
+        ))
+    flagged, holders = find_overlapping_complaints(events)
+    for index, related in zip(flagged, holders):
+        add(DataQualityFinding.OVERLAPPING_COMPLAINTS, index, related, (
+            f"Отказ {day_to_date(events[index]['day']):%d.%m.%Y} до восстановления "
+            f"{day_to_date(events[related]['end']):%d.%m.%Y} по рекламации {events[related]['id']}"
+        ))
+    return findings
+
+
+def scan_data_quality(incremental=False, using='default'):
+    """
+    Проверяет события всех машин (или только измененных после прошлой проверки) и заменяет
+    их найденные ошибки. Возвращает словарь с числом машин, событий, ошибок и длительностью этапов.
+    """
+    started = timezone.now()
+    timings = {}
+    machines = get_changed_machines(SCAN_NAME, started) if incremental else None
+
+    clock = time.perf_counter()
+    machine_ids, shipment_days = load_shipments(machines)
+    events = load_events(machines)
+    timings['load'] = time.perf_counter() - clock
+
+    clock = time.perf_counter()
+    findings = build_findings(events, machine_ids, shipment_days)
+    timings['analyze'] = time.perf_counter() - clock
+
+    clock = time.perf_counter()
+    with transaction.atomic(using=using):
+        for batch in machine_batches(machines):
+            stale = DataQualityFinding.objects.using(using)
+            if batch is not None:
+                stale = stale.filter(machine_id__in=batch)
+            stale.delete()
+        DataQualityFinding.objects.using(using).bulk_create(findings, batch_size=1000)
+        timings['write'] = time.perf_counter() - clock
+        result = {
+            'machines': len(machine_ids),
+            'events': len(events),
+            'findings': len(findings),
+            'timings': timings,
+        }
+        record_batch_run(SCAN_NAME, started, result, using=using)
+    return result
@@ -0,0 +1,89 @@
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+
+from . import datapack, versioning
+from .models import Machine, MachineReassignment
+
+# Сколько заводских номеров в одном условии IN (ограничение числа параметров SQLite)
+SERIAL_BATCH = 500
+
+
+def find_machines_by_serial(queryset, serials):
+    """Id машин выборки с заводскими номерами из списка и номера, которых в ней нет: (ids, not_found)."""
+    serials = list(dict.fromkeys(serial.strip() for serial in serials if serial.strip()))
+    found = {}
+    for start in range(0, len(serials), SERIAL_BATCH):
+        found.update(
+            queryset.filter(serial_number__in=serials[start:start + SERIAL_BATCH])
+            .values_list('serial_number', 'pk')
+        )
+    return sorted(found.values()), [serial for serial in serials if serial not in found]
+
+
+def is_narrowed(queryset, base):
+    """
+    Фильтры действительно сузили выборку: у нее есть условия сверх исходной. Пустые и отброшенные
+    значения фильтров (?service_company=) условий не добавляют, и передался бы весь парк.
+    """
+    return queryset.query.where != base.query.where
+
+
+def reassign_machines(machine_ids, client=None, service_company=None, user=None,
+                      source=MachineReassignment.COMMAND, batch_size=None, using='default'):
+    """
+    Передает машины новому клиенту и/или сервисной компании одной транзакцией.
+
+    Машины обновляются пачками по REASSIGN_BATCH_SIZE одним UPDATE на пачку (без форм и сигналов
+    на каждую машину); на пачку пишется запись журнала с прежними владельцами и один раз
+    увеличиваются версии данных: ТО и рекламации видны по владельцам машины, поэтому вместе
+    с машинами меняется и их видимость. Машины, у которых владельцы уже такие, пропускаются.
+
+    Возвращает (операция, передано машин, пачек).
+    """
+    if client is None and service_company is None:
+        raise ValueError('Не указан ни новый клиент, ни новая сервисная компания')
+    changes = {}
+    if client is not None:
+        changes['client'] = client
+    if service_company is not None:
+        changes['service_company'] = service_company
+    batch_size = batch_size or settings.REASSIGN_BATCH_SIZE
+    machine_ids = sorted(set(machine_ids))
+    operation = uuid.uuid4()
+    moved = batches = 0
+    with transaction.atomic(using=using):
+        for start in range(0, len(machine_ids), batch_size):
+            rows = (
+                Machine.objects.using(using).select_for_update()
+                .filter(pk__in=machine_ids[start:start + batch_size])
+                .values_list('pk', 'client_id', 'service_company_id')
+            )
+            previous = [
+                [pk, client_id, service_company_id] for pk, client_id, service_company_id in rows
+                if (client is not None and client_id != client.pk)
+                or (service_company is not None and service_company_id != service_company.pk)
+            ]
+            if not previous:
+                continue
+            Machine.objects.using(using).filter(pk__in=[row[0] for row in previous]).update(**changes)
+            MachineReassignment.objects.using(using).create(
+                operation=operation, user=user, source=source, client=client,
+                service_company=service_company, machines=len(previous), previous=previous,
+            )
+            # QuerySet.update() не вызывает сигналы: версии увеличиваются здесь, один раз на пачку
+            versioning.bump_data_version(
+                versioning.MACHINE, versioning.MAINTENANCE, versioning.COMPLAINT, using=using
+            )
+            # Пакеты новых владельцев устарели, а из пакетов прежних машины ушли: их файлы не отдаются до пересборки
+            keys = datapack.get_machine_scope_keys([row[0] for row in previous], using=using)
+            previous_keys = datapack.get_scope_keys(
+                [owner for _, client_id, service_company_id in previous
+                 for owner in datapack.get_owners(client_id, service_company_id)], using=using
+            )
+            datapack.mark_stale(keys, using=using)
+            datapack.mark_stale(previous_keys - keys, shrunk=True, using=using)
+            moved += len(previous)
+            batches += 1
+    return operation, moved, batches
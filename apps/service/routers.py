@@ -0,0 +1,97 @@
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Чтение с реплик разрешается только явно (ReplicaRoutingMiddleware для безопасных запросов).
+# Команды, воркеры и запросы после записи читают с основной базы.
+_replica_reads = ContextVar('replica_reads', default=False)
+
+_lag_checked_at = {}
+_healthy = {}
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def get_replica_aliases():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def replica_is_healthy(alias):
+    """Отставание реплики проверяется не чаще раза в REPLICA_LAG_CHECK_INTERVAL секунд на процесс."""
+    now = time.monotonic()
+    if now - _lag_checked_at.get(alias, float('-inf')) < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return _healthy.get(alias, True)
+    _lag_checked_at[alias] = now
+    try:
+        lag = get_replica_lag(alias)
+    except DatabaseError:
+        logger.warning('Реплика %s недоступна, чтение идет с основной базы', alias, exc_info=True)
+        lag = None
+        healthy = False
+    else:
+        healthy = lag is None or lag <= settings.REPLICA_MAX_LAG
+    if not healthy:
+        metrics.incr(f'db.replica_unhealthy.{alias}')
+    _healthy[alias] = healthy
+    return healthy
+
+
+def get_replica_lag(alias):
+    """Отставание реплики в секундах; None, если СУБД его не сообщает (например, копия SQLite)."""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT CASE WHEN pg_is_in_recovery() '
+            'THEN EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) ELSE 0 END'
+        )
+        lag = cursor.fetchone()[0]
+    return float(lag) if lag is not None else None
+
+
+class ReplicaRouter:
+    """
+    Чтение моделей приложения service - с реплик из DATABASE_REPLICAS, запись - всегда в default.
+    Реплики должны содержать полную копию базы (в том числе пользователей для select_related).
+    """
+    route_app_labels = {'service'}
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in self.route_app_labels or not _replica_reads.get():
+            return DEFAULT_DB_ALIAS
+        replicas = [alias for alias in get_replica_aliases() if replica_is_healthy(alias)]
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Объект, прочитанный с реплики, сохраняется в default; объекты других баз остаются в своей базе
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db and instance._state.db not in get_replica_aliases():
+            return instance._state.db
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик приходит репликацией; локальные копии SQLite мигрируются вместе с default
+        return None
@@ -0,0 +1,114 @@
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from apps.users.models import CustomUser, OrganizationClosure
+
+
+class RoleScope:
+    """
+    Роль пользователя и его область видимости данных.
+
+    Вычисляется один раз на запрос (get_role_scope запоминает объект на request.user)
+    и используется сервисами, миксинами, формами и шаблонами вместо повторных
+    проверок is_manager / is_service / is_client.
+    """
+    ANONYMOUS = 'anonymous'
+    ALL = 'all'
+    SERVICE = 'service'
+    CLIENT = 'client'
+    NONE = 'none'
+
+    def __init__(self, user):
+        self.user = user
+        self.user_id = user.pk
+        self.is_authenticated = user.is_authenticated
+        self.is_manager = self.is_authenticated and (user.is_superuser or getattr(user, 'is_manager', False))
+        self.is_service = self.is_authenticated and getattr(user, 'is_service', False)
+        self.is_client = self.is_authenticated and getattr(user, 'is_client', False)
+
+        if not self.is_authenticated:
+            self.kind = self.ANONYMOUS
+        elif self.is_manager:
+            self.kind = self.ALL
+        elif self.is_service:
+            self.kind = self.SERVICE
+        elif self.is_client:
+            self.kind = self.CLIENT
+        else:
+            self.kind = self.NONE
+        # Пользователь организации видит технику всех ее учетных записей и подразделений
+        self.organization_id = (
+            getattr(user, 'organization_id', None) if self.kind in (self.SERVICE, self.CLIENT) else None
+        )
+
+    @property
+    def sees_all(self):
+        return self.kind == self.ALL
+
+    @property
+    def key(self):
+        """Ключ для кэшей: у всех менеджеров одна и та же выборка."""
+        if self.organization_id is not None:
+            return f'{self.kind}:org:{self.organization_id}'
+        if self.kind in (self.SERVICE, self.CLIENT):
+            return f'{self.kind}:{self.user_id}'
+        return self.kind
+
+    @property
+    def can_create_complaints(self):
+        return self.is_manager or self.is_service
+
+    def can_attach(self, owner):
+        """Загрузка вложений к записи в области видимости: к рекламациям - тем, кто их создает, к ТО - всем."""
+        if owner == 'complaint':
+            return self.can_create_complaints
+        return self.kind in (self.ALL, self.SERVICE, self.CLIENT)
+
+    def can_delete_attachment(self, attachment):
+        """Удалить вложение может тот, кто его загрузил, и менеджер."""
+        return self.is_manager or (self.is_authenticated and attachment.uploaded_by_id == self.user_id)
+
+    def _subtree(self):
+        # Организация и все ее подразделения - строки замыкания по индексу (ancestor, descendant)
+        return OrganizationClosure.objects.filter(ancestor_id=self.organization_id).values('descendant_id')
+
+    def owner_condition(self, field):
+        """
+        Условие "учетная запись в поле field принадлежит пользователю": сам пользователь или,
+        если он в организации, любая учетная запись организации и ее подразделений
+        (подзапрос без рекурсии, без соединений во внешнем запросе).
+        """
+        if self.organization_id is None:
+            return Q(**{field: self.user_id})
+        return Q(**{f'{field}__in': CustomUser.objects.filter(organization__in=self._subtree()).values('pk')})
+
+    def filter_accounts(self, queryset):
+        """Ограничивает выборку пользователей учетными записями организации пользователя (или им самим)."""
+        if self.organization_id is None:
+            return queryset.filter(pk=self.user_id)
+        return queryset.filter(organization__in=self._subtree())
+
+    @cached_property
+    def account_ids(self):
+        """Id учетных записей области видимости; без организации запроса к базе нет."""
+        if self.organization_id is None:
+            return frozenset([self.user_id])
+        return frozenset(self.filter_accounts(CustomUser.objects.all()).values_list('pk', flat=True))
+
+    def filter_machines(self, queryset, prefix=''):
+        """Ограничивает выборку машинами пользователя; prefix - путь до машины ('machine__' для ТО и рекламаций)."""
+        if self.kind == self.ALL:
+            return queryset
+        if self.kind == self.SERVICE:
+            return queryset.filter(self.owner_condition(f'{prefix}service_company'))
+        if self.kind == self.CLIENT:
+            return queryset.filter(self.owner_condition(f'{prefix}client'))
+        return queryset.none()
+
+
+def get_role_scope(user):
+    scope = getattr(user, '_role_scope', None)
+    if scope is None:
+        scope = RoleScope(user)
+        user._role_scope = scope
+    return scope
@@ -1,6 +1,10 @@
 from rest_framework import serializers
 
-from .models import Complaint, Machine, Maintenance
+from apps.users.models import CustomUser
+
+from .archive import has_archived_maintenance
+from .models import DUPLICATE_MAINTENANCE_MESSAGE, Complaint, Machine, Maintenance
+from .services import get_machines_for_form, get_service_companies_for_form
 
 
 class MachineSerializer(serializers.ModelSerializer):
@@ -9,13 +13,129 @@ class MachineSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class MaintenanceSerializer(serializers.ModelSerializer):
+class ScopedRelationsMixin:
+    """
+    Машина и сервисная компания выбираются из тех же выборок, что в формах: присланный id
+    проверяется в пределах области видимости пользователя запроса (чужая машина - ошибка 400).
+    """
+    include_self = False  # клиент может указать себя сервисной компанией (ТО самостоятельно)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is not None:
+            self.fields['machine'].queryset = get_machines_for_form(request.user)
+            self.fields['service_company'].queryset = get_service_companies_for_form(
+                request.user, include_self=self.include_self
+            )
+
+
+class MaintenanceSerializer(ScopedRelationsMixin, serializers.ModelSerializer):
+    include_self = True
+    # Запись из архива (только в списках с диапазоном дат до горизонта архивации)
+    archived = serializers.SerializerMethodField()
+
     class Meta:
         model = Maintenance
         fields = '__all__'
 
+    def get_unique_together_validators(self):
+        validators = super().get_unique_together_validators()
+        for validator in validators:
+            validator.message = DUPLICATE_MAINTENANCE_MESSAGE
+        return validators
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        # unique_maintenance_event не видит архив: дубликат архивной записи проверяется отдельно
+        values = [
+            attrs.get(name, getattr(self.instance, name, None)) for name in ('machine', 'event_date', 'service_type')
+        ]
+        if has_archived_maintenance(*values):
+            raise serializers.ValidationError({'non_field_errors': [DUPLICATE_MAINTENANCE_MESSAGE]})
+        return attrs
+
+    def get_archived(self, obj):
+        return getattr(obj, 'archived', False)
+
+
+class ComplaintSerializer(ScopedRelationsMixin, serializers.ModelSerializer):
+    archived = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Complaint
+        fields = '__all__'
+
+    def get_archived(self, obj):
+        return getattr(obj, 'archived', False)
+
+
+class ServiceBookMaintenanceSerializer(serializers.ModelSerializer):
+    service_type_name = serializers.CharField(source='service_type.name')
+    service_company_name = serializers.StringRelatedField(source='service_company')
+    archived = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Maintenance
+        fields = (
+            'id', 'event_date', 'operating_hours', 'order_number', 'order_date',
+            'service_type', 'service_type_name', 'service_company', 'service_company_name', 'archived',
+        )
+        read_only_fields = fields
+
+    def get_archived(self, obj):
+        return getattr(obj, 'archived', False)
+
+
+class ServiceBookComplaintSerializer(serializers.ModelSerializer):
+    failure_node_name = serializers.CharField(source='failure_node.name')
+    recovery_method_name = serializers.CharField(source='recovery_method.name')
+    service_company_name = serializers.StringRelatedField(source='service_company')
+    archived = serializers.SerializerMethodField()
 
-class ComplaintSerializer(serializers.ModelSerializer):
     class Meta:
         model = Complaint
-        fields = '__all__'
\ No newline at end of file
+        fields = (
+            'id', 'failure_date', 'operating_hours', 'failure_node', 'failure_node_name', 'failure_description',
+            'recovery_method', 'recovery_method_name', 'spare_parts', 'recovery_date', 'downtime',
+            'service_company', 'service_company_name', 'archived',
+        )
+        read_only_fields = fields
+
+    def get_archived(self, obj):
+        return getattr(obj, 'archived', False)
+
+
+class ServiceBookSerializer(serializers.ModelSerializer):
+    """Сервисная книжка: машина с названиями справочников, всеми ТО и рекламациями (включая архив)."""
+    technique_model_name = serializers.CharField(source='technique_model.name')
+    engine_model_name = serializers.CharField(source='engine_model.name')
+    transmission_model_name = serializers.CharField(source='transmission_model.name')
+    drive_axle_model_name = serializers.CharField(source='drive_axle_model.name')
+    steering_axle_model_name = serializers.CharField(source='steering_axle_model.name')
+    client_name = serializers.StringRelatedField(source='client')
+    service_company_name = serializers.StringRelatedField(source='service_company')
+    # Списки собирает servicebook.build_service_books: записи основной таблицы и архива
+    maintenances = ServiceBookMaintenanceSerializer(many=True, source='service_book_maintenances')
+    complaints = ServiceBookComplaintSerializer(many=True, source='service_book_complaints')
+
+    class Meta:
+        model = Machine
+        fields = '__all__'
+        read_only_fields = [field.name for field in Machine._meta.concrete_fields]
+
+
+class MachineReassignSerializer(serializers.Serializer):
+    """Тело POST /api/machines/reassign/: новые владельцы и, вместо фильтров списка, заводские номера."""
+    client = serializers.PrimaryKeyRelatedField(
+        queryset=CustomUser.objects.filter(role=CustomUser.CLIENT), required=False
+    )
+    service_company = serializers.PrimaryKeyRelatedField(
+        queryset=CustomUser.objects.filter(role=CustomUser.SERVICE), required=False
+    )
+    serial_numbers = serializers.ListField(child=serializers.CharField(), required=False)
+
+    def validate(self, attrs):
+        if not attrs.get('client') and not attrs.get('service_company'):
+            raise serializers.ValidationError('Укажите нового клиента или новую сервисную компанию.')
+        return attrs
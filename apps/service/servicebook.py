@@ -0,0 +1,81 @@
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+from . import metrics, versioning
+from .models import ArchivedComplaint, ArchivedMaintenance, Complaint, Machine, Maintenance
+from .serializers import ServiceBookSerializer
+
+# Данные, из которых состоит книжка: ETag ответа и ключ кэша зависят от их версий
+SERVICE_BOOK_LABELS = (
+    versioning.MACHINE, versioning.MAINTENANCE, versioning.COMPLAINT, versioning.CATALOG, versioning.USER,
+)
+SERVICE_BOOK_CACHE_TIMEOUT = 3600
+
+
+def get_service_books(machines):
+    """
+    Сервисные книжки машин выборки machines (уже ограниченной областью видимости) в ее порядке.
+
+    Содержимое книжки не зависит от пользователя, поэтому готовые книжки берутся из общего
+    кэша по id машины и версиям данных; недостающие строятся одной пачкой.
+    """
+    ids = list(machines.values_list('pk', flat=True))
+    version_key = versioning.format_version_key(versioning.get_data_versions(*SERVICE_BOOK_LABELS), SERVICE_BOOK_LABELS)
+    keys = {pk: f'service_book:{pk}:{version_key}' for pk in ids}
+    books = cache.get_many(list(keys.values())) if ids else {}
+    missing = [pk for pk in ids if keys[pk] not in books]
+    metrics.incr('service_book_cache.hit', len(ids) - len(missing))
+    if missing:
+        metrics.incr('service_book_cache.miss', len(missing))
+        built = {keys[book['id']]: book for book in build_service_books(missing)}
+        cache.set_many(built, SERVICE_BOOK_CACHE_TIMEOUT)
+        books.update(built)
+    return [books[keys[pk]] for pk in ids if keys[pk] in books]
+
+
+def build_service_books(machine_ids):
+    """
+    Книжки машин по id за пять запросов при любом числе машин и записей: машины со справочниками,
+    ТО и рекламации (prefetch_related) и их архивные записи.
+    """
+    machines = list(
+        Machine.objects.filter(pk__in=machine_ids)
+        .select_related(
+            'technique_model', 'engine_model', 'transmission_model',
+            'drive_axle_model', 'steering_axle_model', 'client', 'service_company',
+        )
+        .prefetch_related(
+            Prefetch('maintenances', queryset=Maintenance.objects.select_related(
+                'service_type', 'service_company').order_by('-event_date')),
+            Prefetch('complaints', queryset=Complaint.objects.select_related(
+                'failure_node', 'recovery_method', 'service_company').order_by('-failure_date')),
+        )
+    )
+    archived_maintenances = _group_by_machine(
+        ArchivedMaintenance.objects.filter(machine_id__in=machine_ids)
+        .select_related('service_type', 'service_company').order_by('-event_date')
+    )
+    archived_complaints = _group_by_machine(
+        ArchivedComplaint.objects.filter(machine_id__in=machine_ids)
+        .select_related('failure_node', 'recovery_method', 'service_company').order_by('-failure_date')
+    )
+    for machine in machines:
+        # В основной таблице тоже бывают старые записи (с вложениями), поэтому общий порядок - по дате
+        machine.service_book_maintenances = sorted(
+            [*machine.maintenances.all(), *archived_maintenances[machine.pk]],
+            key=lambda record: record.event_date, reverse=True,
+        )
+        machine.service_book_complaints = sorted(
+            [*machine.complaints.all(), *archived_complaints[machine.pk]],
+            key=lambda record: record.failure_date, reverse=True,
+        )
+    return ServiceBookSerializer(machines, many=True).data
+
+
+def _group_by_machine(queryset):
+    grouped = defaultdict(list)
+    for record in queryset:
+        grouped[record.machine_id].append(record)
+    return grouped
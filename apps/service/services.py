@@ -1,5 +1,40 @@
+from django.db.models import Q, UniqueConstraint
+from django.db.models.functions import Upper
+
 from apps.users.models import CustomUser
-from .models import Complaint, Machine, Maintenance
+from .archive import reaches_archive, union_tiers
+from .filters import ComplaintFilter, MachineFilter, MaintenanceFilter
+from .models import (
+    ArchivedComplaint,
+    ArchivedMaintenance,
+    Attachment,
+    Complaint,
+    DriveAxleModel,
+    EngineModel,
+    FailureNode,
+    Machine,
+    Maintenance,
+    RecoveryMethod,
+    ServiceType,
+    SparePart,
+    SteeringAxleModel,
+    TechniqueModel,
+    TransmissionModel,
+)
+from .scope import get_role_scope
+
+# Справочники, доступные через автодополнение: slug -> модель
+CATALOG_MODELS = {
+    'technique_model': TechniqueModel,
+    'engine_model': EngineModel,
+    'transmission_model': TransmissionModel,
+    'drive_axle_model': DriveAxleModel,
+    'steering_axle_model': SteeringAxleModel,
+    'service_type': ServiceType,
+    'failure_node': FailureNode,
+    'recovery_method': RecoveryMethod,
+    'spare_part': SparePart,
+}
 
 
 def validate_id(val):
@@ -9,108 +44,174 @@ def validate_id(val):
         return None
 
 
-def get_filtered_machines(user, params):
-    if not user.is_authenticated:
-        return Machine.objects.none()
+def parse_id_list(val):
+    """'1,3' -> {1, 3}; некорректные элементы отбрасываются, как и в NumberInFilter."""
+    ids = {validate_id(item) for item in str(val or '').split(',')}
+    ids.discard(None)
+    return ids
+
+
+def filter_serial_prefix(queryset, term, field='serial_number'):
+    """
+    Поиск по началу заводского номера без учета регистра.
+
+    Условие записано диапазоном по UPPER(serial_number), чтобы его обслуживал
+    индекс machine_serial_upper_idx, в отличие от LIKE '%...%'.
+    """
+    term = term.strip().upper()
+    if not term:
+        return queryset
+    upper_bound = term[:-1] + chr(ord(term[-1]) + 1)
+    return queryset.annotate(serial_upper=Upper(field)).filter(
+        serial_upper__gte=term, serial_upper__lt=upper_bound
+    )
 
+
+def get_scope_key(user):
+    """Ключ области видимости пользователя для кэшей: у всех менеджеров одна и та же выборка."""
+    return get_role_scope(user).key
+
+
+def get_machines_in_scope(user):
     queryset = Machine.objects.select_related(
         'technique_model', 'engine_model', 'transmission_model',
         'drive_axle_model', 'steering_axle_model', 'client', 'service_company'
     ).order_by('-date_shipment')
+    return get_role_scope(user).filter_machines(queryset)
 
-    if user.is_staff or user.is_superuser or getattr(user, 'is_manager', False):
-        pass
-    elif getattr(user, 'is_service', False):
-        queryset = queryset.filter(service_company=user)
-    elif getattr(user, 'is_client', False):
-        queryset = queryset.filter(client=user)
-    else:
-        return Machine.objects.none()
 
-    if val := validate_id(params.get('technique_model')):
-        queryset = queryset.filter(technique_model_id=val)
-    if val := validate_id(params.get('engine_model')):
-        queryset = queryset.filter(engine_model_id=val)
-    if val := validate_id(params.get('transmission_model')):
-        queryset = queryset.filter(transmission_model_id=val)
-    if val := validate_id(params.get('drive_axle_model')):
-        queryset = queryset.filter(drive_axle_model_id=val)
-    if val := validate_id(params.get('steering_axle_model')):
-        queryset = queryset.filter(steering_axle_model_id=val)
+def get_maintenances_in_scope(user):
+    queryset = Maintenance.objects.select_related(
+        'machine', 'service_type', 'service_company'
+    ).order_by('-event_date')
+    return get_role_scope(user).filter_machines(queryset, prefix='machine__')
 
-    return queryset
 
+def get_complaints_in_scope(user):
+    queryset = Complaint.objects.select_related(
+        'machine', 'failure_node', 'recovery_method', 'service_company'
+    ).order_by('-failure_date')
+    return get_role_scope(user).filter_machines(queryset, prefix='machine__')
 
-def get_filtered_maintenances(user, params):
-    if not user.is_authenticated:
-        return Maintenance.objects.none()
 
-    queryset = Maintenance.objects.select_related(
+def get_archived_maintenances_in_scope(user):
+    queryset = ArchivedMaintenance.objects.select_related(
         'machine', 'service_type', 'service_company'
     ).order_by('-event_date')
+    return get_role_scope(user).filter_machines(queryset, prefix='machine__')
 
-    if user.is_staff or user.is_superuser or getattr(user, 'is_manager', False):
-        pass
-    elif getattr(user, 'is_service', False):
-        queryset = queryset.filter(machine__service_company=user)
-    elif getattr(user, 'is_client', False):
-        queryset = queryset.filter(machine__client=user)
-    else:
-        return Maintenance.objects.none()
 
-    if val := validate_id(params.get('service_type')):
-        queryset = queryset.filter(service_type_id=val)
-    if val := params.get('car_serial_to'):
-        queryset = queryset.filter(machine__serial_number__icontains=val)
-    if val := validate_id(params.get('service_company_to')):
-        queryset = queryset.filter(service_company_id=val)
+def get_archived_complaints_in_scope(user):
+    queryset = ArchivedComplaint.objects.select_related(
+        'machine', 'failure_node', 'recovery_method', 'service_company'
+    ).order_by('-failure_date')
+    return get_role_scope(user).filter_machines(queryset, prefix='machine__')
+
 
-    return queryset
+def get_attachments_in_scope(user):
+    return Attachment.objects.filter(
+        Q(complaint__in=get_complaints_in_scope(user).values('pk'))
+        | Q(maintenance__in=get_maintenances_in_scope(user).values('pk'))
+    )
 
 
-def get_filtered_complaints(user, params):
-    if not user.is_authenticated:
-        return Complaint.objects.none()
+def get_filtered_machines(user, params):
+    return MachineFilter(params, queryset=get_machines_in_scope(user)).qs
 
-    queryset = Complaint.objects.select_related(
-        'machine', 'failure_node', 'recovery_method', 'service_company'
-    ).order_by('-failure_date')
 
-    if user.is_staff or user.is_superuser or getattr(user, 'is_manager', False):
-        pass
-    elif getattr(user, 'is_service', False):
-        queryset = queryset.filter(machine__service_company=user)
-    elif getattr(user, 'is_client', False):
-        queryset = queryset.filter(machine__client=user)
-    else:
-        return Complaint.objects.none()
+def get_maintenance_tiers(user, params):
+    """Отфильтрованные ТО: горячая таблица и архив, если диапазон дат до него доходит."""
+    tiers = [MaintenanceFilter(params, queryset=get_maintenances_in_scope(user)).qs]
+    if reaches_archive(Maintenance, params):
+        tiers.append(MaintenanceFilter(params, queryset=get_archived_maintenances_in_scope(user)).qs)
+    return tiers
+
+
+def get_complaint_tiers(user, params):
+    tiers = [ComplaintFilter(params, queryset=get_complaints_in_scope(user)).qs]
+    if reaches_archive(Complaint, params):
+        tiers.append(ComplaintFilter(params, queryset=get_archived_complaints_in_scope(user)).qs)
+    return tiers
+
+
+def get_filtered_maintenances(user, params):
+    return union_tiers(get_maintenance_tiers(user, params), ['-event_date'])
 
-    if val := validate_id(params.get('failure_node')):
-        queryset = queryset.filter(failure_node_id=val)
-    if val := validate_id(params.get('recovery_method')):
-        queryset = queryset.filter(recovery_method_id=val)
-    if val := validate_id(params.get('service_company_complaint')):
-        queryset = queryset.filter(service_company_id=val)
 
-    return queryset
+def get_filtered_complaints(user, params):
+    return union_tiers(get_complaint_tiers(user, params), ['-failure_date'])
 
 
 def get_machines_for_filter(user):
-    if user.is_superuser or getattr(user, 'is_manager', False):
-        return Machine.objects.all().order_by('serial_number')
-    elif getattr(user, 'is_service', False):
-        return Machine.objects.filter(service_company=user).order_by('serial_number')
-    elif getattr(user, 'is_client', False):
-        return Machine.objects.filter(client=user).order_by('serial_number')
-    return Machine.objects.none()
+    return get_role_scope(user).filter_machines(Machine.objects.only('id', 'serial_number').order_by('serial_number'))
 
 
 def get_service_companies_for_filter(user):
-    if getattr(user, 'is_client', False):
-        client_machines = Machine.objects.filter(client=user)
-        service_company_ids = client_machines.values_list('service_company', flat=True).distinct()
+    scope = get_role_scope(user)
+    if scope.is_client:
+        service_company_ids = scope.filter_machines(Machine.objects.all()).values('service_company_id')
         return CustomUser.objects.filter(id__in=service_company_ids)
-    elif getattr(user, 'is_service', False):
-        return CustomUser.objects.filter(id=user.id)
+    elif scope.is_service:
+        return scope.filter_accounts(CustomUser.objects.filter(role='service'))
     else:
         return CustomUser.objects.filter(role='service')
+
+
+def get_machines_for_form(user):
+    return get_role_scope(user).filter_machines(Machine.objects.all())
+
+
+def get_clients_for_form(user):
+    if get_role_scope(user).is_manager:
+        return CustomUser.objects.filter(role='client')
+    return CustomUser.objects.none()
+
+
+def get_service_companies_for_form(user, include_self=False):
+    scope = get_role_scope(user)
+    if scope.is_manager:
+        return CustomUser.objects.filter(role='service')
+    elif scope.is_service:
+        return scope.filter_accounts(CustomUser.objects.filter(role='service'))
+    elif scope.is_client:
+        service_company_ids = scope.filter_machines(Machine.objects.all()).values('service_company_id')
+        condition = Q(id__in=service_company_ids)
+        if include_self:
+            condition |= Q(id=user.id)
+        return CustomUser.objects.filter(condition)
+    return CustomUser.objects.none()
+
+
+# Области видимости пользователей для автодополнения: scope -> функция (user) -> queryset
+USER_SCOPES = {
+    'client': get_clients_for_form,
+    'service': get_service_companies_for_form,
+    'service_or_self': lambda user: get_service_companies_for_form(user, include_self=True),
+}
+
+
+def paginate_autocomplete(queryset, page, page_size=20):
+    """Срез страницы без COUNT: берется на одну запись больше, чтобы узнать, есть ли продолжение."""
+    page = max(validate_id(page) or 1, 1)
+    offset = (page - 1) * page_size
+    items = list(queryset[offset:offset + page_size + 1])
+    return items[:page_size], len(items) > page_size
+
+
+def get_constraint_violation_message(exc, model):
+    """
+    Понятное пользователю сообщение для IntegrityError, вызванного ограничением модели.
+
+    PostgreSQL и SQLite для CHECK сообщают имя ограничения, SQLite для UNIQUE -
+    список столбцов вида "table.column", поэтому проверяются оба варианта.
+    """
+    text = str(exc)
+    table = model._meta.db_table
+    for constraint in model._meta.constraints:
+        if constraint.name in text:
+            return constraint.get_violation_error_message()
+        if isinstance(constraint, UniqueConstraint) and constraint.fields:
+            columns = [f'{table}.{model._meta.get_field(name).column}' for name in constraint.fields]
+            if all(column in text for column in columns):
+                return constraint.get_violation_error_message()
+    return 'Не удалось сохранить запись: данные противоречат ограничениям целостности.'
@@ -0,0 +1,334 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from apps.users.models import CustomUser, Organization
+from . import archive, datapack, live, sla, spareparts, tasks, versioning
+from .models import (
+    Attachment,
+    Complaint,
+    DriveAxleModel,
+    EngineModel,
+    FailureNode,
+    LiveEvent,
+    Machine,
+    MachineChange,
+    Maintenance,
+    RecoveryMethod,
+    ServiceType,
+    SlaAlert,
+    SlaBucket,
+    SparePart,
+    SparePartDemand,
+    SparePartUsage,
+    SteeringAxleModel,
+    TechniqueModel,
+    TransmissionModel,
+)
+from .scope import RoleScope
+from .taskqueue import enqueue
+from .uploads import delete_unreferenced_files
+
+VERSION_LABELS = {
+    Machine: versioning.MACHINE,
+    Maintenance: versioning.MAINTENANCE,
+    Complaint: versioning.COMPLAINT,
+    CustomUser: versioning.USER,
+    TechniqueModel: versioning.CATALOG,
+    EngineModel: versioning.CATALOG,
+    TransmissionModel: versioning.CATALOG,
+    DriveAxleModel: versioning.CATALOG,
+    SteeringAxleModel: versioning.CATALOG,
+    ServiceType: versioning.CATALOG,
+    FailureNode: versioning.CATALOG,
+    RecoveryMethod: versioning.CATALOG,
+    SparePart: versioning.CATALOG,
+    Attachment: versioning.ATTACHMENT,
+    SlaBucket: versioning.SLA,
+    SlaAlert: versioning.SLA,
+    SparePartUsage: versioning.SPARE_PARTS,
+    SparePartDemand: versioning.SPARE_PARTS,
+}
+
+
+# Сохранения, которые не меняют отображаемые данные (вход пользователя обновляет только last_login)
+IGNORED_UPDATE_FIELDS = {frozenset(['last_login'])}
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_version_on_write(sender, using, **kwargs):
+    label = VERSION_LABELS.get(sender)
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and frozenset(update_fields) in IGNORED_UPDATE_FIELDS:
+        return
+    # Перенос в архив увеличивает версию один раз на пачку (archive.archive_batch)
+    if archive.is_archiving():
+        return
+    if label is not None and not kwargs.get('raw', False):
+        versioning.bump_data_version(label, using=using)
+
+
+def is_data_pack_change(raw=False, update_fields=None, **kwargs):
+    if raw or archive.is_archiving():
+        return False
+    return update_fields is None or frozenset(update_fields) not in IGNORED_UPDATE_FIELDS
+
+
+@receiver(pre_save, sender=Machine)
+@receiver(pre_save, sender=Maintenance)
+@receiver(pre_save, sender=Complaint)
+def remember_data_pack_owners(sender, instance, using, raw=False, **kwargs):
+    # Владельцы машины до записи: пакеты, из области которых запись уходит, сужаются
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    prefix = '' if sender is Machine else 'machine__'
+    row = sender.objects.using(using).filter(pk=instance.pk).values_list(
+        f'{prefix}client_id', f'{prefix}service_company_id'
+    ).first()
+    instance._data_pack_owners = datapack.get_owners(*row) if row else []
+
+
+@receiver(post_save, sender=Machine)
+@receiver(post_save, sender=Maintenance)
+@receiver(post_save, sender=Complaint)
+@receiver(post_delete, sender=Machine)
+@receiver(post_delete, sender=Maintenance)
+@receiver(post_delete, sender=Complaint)
+def mark_data_packs_on_write(sender, instance, using, **kwargs):
+    # Пересобираются при скачивании только пакеты, в область которых попадает машина записи
+    previous = instance.__dict__.pop('_data_pack_owners', [])
+    if not is_data_pack_change(**kwargs):
+        return
+    if sender is Machine:
+        owners = datapack.get_owners(instance.client_id, instance.service_company_id)
+    else:
+        owners = [] if instance.machine_id is None else [
+            owner for row in Machine.objects.using(using).filter(pk=instance.machine_id).values_list(
+                'client_id', 'service_company_id'
+            ) for owner in datapack.get_owners(*row)
+        ]
+    keys = datapack.get_scope_keys(owners, using=using)
+    datapack.mark_stale(keys, using=using)
+    shrunk = datapack.get_scope_keys(previous, using=using) - keys
+    if shrunk:
+        datapack.mark_stale(shrunk, shrunk=True, using=using)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def mark_data_packs_on_catalog_write(sender, using, **kwargs):
+    # Справочники и названия учетных записей есть в каждом пакете
+    if VERSION_LABELS.get(sender) in (versioning.CATALOG, versioning.USER) and is_data_pack_change(**kwargs):
+        datapack.mark_stale(using=using)
+
+
+@receiver(pre_save, sender=CustomUser)
+def remember_account_organization_packs(sender, instance, using, raw=False, **kwargs):
+    # Учетная запись уходит из организации или меняет роль: пакеты прежней организации
+    # и ее головных больше не должны показывать ее машины
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    row = CustomUser.objects.using(using).filter(pk=instance.pk).values_list('role', 'organization_id').first()
+    if row is None or row[1] is None or row == (instance.role, instance.organization_id):
+        return
+    role = row[0]
+    keys = datapack.get_scope_keys([(role, instance.pk)], using=using)
+    instance._data_pack_shrunk = keys - {RoleScope.ALL, f'{role}:{instance.pk}'}
+
+
+@receiver(post_save, sender=CustomUser)
+def mark_data_packs_on_account_move(sender, instance, using, **kwargs):
+    shrunk = instance.__dict__.pop('_data_pack_shrunk', None)
+    if shrunk:
+        datapack.mark_stale(shrunk, shrunk=True, using=using)
+
+
+@receiver(post_save, sender=Organization)
+@receiver(post_delete, sender=Organization)
+def bump_versions_on_hierarchy_change(sender, using, raw=False, **kwargs):
+    # Перенос подразделения меняет видимость техники, ТО и рекламаций для всей организации,
+    # а ключ области видимости (RoleScope.key) при этом прежний
+    if not raw:
+        versioning.bump_data_version(
+            versioning.MACHINE, versioning.MAINTENANCE, versioning.COMPLAINT, versioning.USER, using=using
+        )
+
+
+@receiver(pre_save, sender=Organization)
+def remember_organization_parent(sender, instance, using, raw=False, **kwargs):
+    if not raw and not instance._state.adding and instance.pk is not None:
+        instance._data_pack_parent = Organization.objects.using(using).filter(pk=instance.pk).values_list(
+            'parent_id', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Organization)
+@receiver(post_delete, sender=Organization)
+def mark_data_packs_on_hierarchy_change(sender, instance, using, raw=False, **kwargs):
+    # Подразделение перенесено или удалено: пакеты организаций могли потерять его технику.
+    # Переименование на содержимое пакетов не влияет
+    if raw:
+        return
+    saved = 'created' in kwargs
+    if saved and instance.__dict__.pop('_data_pack_parent', instance.parent_id) == instance.parent_id:
+        return
+    datapack.mark_organizations_shrunk(using=using)
+
+
+@receiver(post_save, sender=Complaint)
+def enqueue_complaint_notification(sender, instance, created, using, raw=False, **kwargs):
+    # Письмо отправит воркер после фиксации; запрос на создание рекламации его не ждет
+    if created and not raw:
+        enqueue(tasks.NOTIFY_NEW_COMPLAINT, {'complaint_id': instance.pk},
+                dedup_key=f'complaint-notify:{instance.pk}', using=using)
+
+
+@receiver(post_save, sender=Maintenance)
+def enqueue_maintenance_notification(sender, instance, created, using, raw=False, **kwargs):
+    if created and not raw:
+        enqueue(tasks.NOTIFY_NEW_MAINTENANCE, {'maintenance_id': instance.pk},
+                dedup_key=f'maintenance-notify:{instance.pk}', using=using)
+
+
+@receiver(post_save, sender=Complaint)
+@receiver(post_save, sender=Maintenance)
+def publish_live_update(sender, instance, created, using, raw=False, **kwargs):
+    if not raw:
+        live.publish(instance, LiveEvent.CREATED if created else LiveEvent.UPDATED, using=using)
+
+
+@receiver(post_delete, sender=Complaint)
+@receiver(post_delete, sender=Maintenance)
+def publish_live_delete(sender, instance, using, **kwargs):
+    if archive.is_archiving():
+        return
+    live.publish(instance, LiveEvent.DELETED, using=using)
+
+
+@receiver(pre_save, sender=Complaint)
+@receiver(pre_save, sender=Maintenance)
+def remember_sla_contribution(sender, instance, using, raw=False, **kwargs):
+    # Вклад записи до изменения: после сохранения он вычитается из корзины SLA
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    instance._sla_previous = sla.get_stored_contribution(sender, instance.pk, using=using)
+
+
+@receiver(pre_save, sender=Complaint)
+def remember_repeat_neighbours(sender, instance, using, raw=False, **kwargs):
+    # Повторность соседних рекламаций того же узла до записи: старое и новое место рекламации
+    if raw:
+        return
+    positions = [(instance.machine_id, instance.failure_node_id, instance.failure_date)]
+    if not instance._state.adding and instance.pk is not None:
+        positions += Complaint.objects.using(using).filter(pk=instance.pk).values_list(
+            'machine_id', 'failure_node_id', 'failure_date'
+        )
+    instance._sla_neighbours = (positions, sla.get_repeat_neighbours(positions, instance.pk, using=using))
+
+
+@receiver(pre_delete, sender=Complaint)
+def remember_deleted_repeat_neighbours(sender, instance, using, **kwargs):
+    if archive.is_archiving():
+        return
+    positions = [(instance.machine_id, instance.failure_node_id, instance.failure_date)]
+    instance._sla_neighbours = (positions, sla.get_repeat_neighbours(positions, instance.pk, using=using))
+
+
+def update_repeat_neighbours(instance, using):
+    positions, before = instance.__dict__.pop('_sla_neighbours', (None, None))
+    if positions is None:
+        return 0
+    return sla.apply_repeat_changes(before, sla.get_repeat_neighbours(positions, instance.pk, using=using), using)
+
+
+@receiver(post_save, sender=Complaint)
+@receiver(post_save, sender=Maintenance)
+def update_sla_buckets(sender, instance, using, raw=False, **kwargs):
+    if raw:
+        return
+    previous = instance.__dict__.pop('_sla_previous', None)
+    current = sla.get_contribution(instance, using=using)
+    changed = update_repeat_neighbours(instance, using)
+    if previous == current and not changed:
+        return
+    if previous != current:
+        if previous is not None:
+            sla.apply_contribution(previous, -1, using=using)
+        sla.apply_contribution(current, 1, using=using)
+    enqueue_sla_evaluation(using)
+
+
+@receiver(post_delete, sender=Complaint)
+@receiver(post_delete, sender=Maintenance)
+def remove_from_sla_buckets(sender, instance, using, **kwargs):
+    # Перенос в архив не удаляет записи из статистики
+    if archive.is_archiving():
+        return
+    sla.apply_contribution(sla.get_contribution(instance, using=using), -1, using=using)
+    update_repeat_neighbours(instance, using)
+    enqueue_sla_evaluation(using)
+
+
+def enqueue_sla_evaluation(using):
+    # Пороги проверяются одной задачей на все записи за SLA_EVALUATION_DELAY секунд
+    enqueue(tasks.EVALUATE_SLA, dedup_key='sla-evaluate', using=using,
+            run_at=timezone.now() + timedelta(seconds=settings.SLA_EVALUATION_DELAY))
+
+
+@receiver(post_save, sender=Complaint)
+def update_spare_parts_ledger(sender, instance, using, raw=False, **kwargs):
+    if not raw:
+        spareparts.sync_complaint(instance, using=using)
+
+
+@receiver(post_delete, sender=Complaint)
+def remove_from_spare_parts_ledger(sender, instance, using, **kwargs):
+    # Строки журнала перенесенной в архив рекламации остаются
+    if not archive.is_archiving():
+        spareparts.remove_complaint(instance.pk, using=using)
+
+
+@receiver(post_save, sender=Machine)
+@receiver(post_save, sender=Complaint)
+@receiver(post_save, sender=Maintenance)
+@receiver(post_delete, sender=Complaint)
+@receiver(post_delete, sender=Maintenance)
+def mark_machine_changed(sender, instance, using, raw=False, **kwargs):
+    # Машину перепроверит scan_data_quality --incremental
+    if raw or archive.is_archiving():
+        return
+    machine_id = instance.pk if sender is Machine else instance.machine_id
+    MachineChange.objects.using(using).bulk_create(
+        [MachineChange(machine_id=machine_id, changed_at=timezone.now())],
+        update_conflicts=True, unique_fields=['machine'], update_fields=['changed_at'],
+    )
+
+
+@receiver(post_save, sender=Attachment)
+def enqueue_attachment_previews(sender, instance, created, using, raw=False, **kwargs):
+    if created and not raw and instance.preview_status == Attachment.PREVIEW_PENDING:
+        enqueue(tasks.GENERATE_ATTACHMENT_PREVIEWS, {'sha256': instance.sha256, 'name': instance.file.name},
+                dedup_key=f'attachment-previews:{instance.sha256}', using=using)
+
+
+@receiver(post_delete, sender=Attachment)
+def delete_attachment_files(sender, instance, using, **kwargs):
+    # Файл общий для одинакового содержимого: удаляется, когда на него не осталось ссылок
+    sha256, name = instance.sha256, instance.file.name
+    transaction.on_commit(lambda: delete_unreferenced_files(sha256, name), using=using)
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
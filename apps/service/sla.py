@@ -0,0 +1,321 @@
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import versioning
+from .models import Complaint, Maintenance, SlaAlert, SlaBucket
+
+# Верхние границы интервалов гистограммы простоя, дни; последний интервал - больше 90 дней
+DOWNTIME_BINS = (0, 1, 2, 3, 5, 7, 10, 14, 21, 30, 60, 90)
+
+METRICS = {
+    'avg_downtime': 'Средний простой, дней',
+    'p90_downtime': 'Простой 90% отказов, дней',
+    'repeat_rate': 'Доля повторных отказов',
+    'avg_delay': 'Средняя задержка ТО, дней',
+    'late_rate': 'Доля ТО с опозданием',
+}
+# По какому числу записей считается показатель: без достаточной выборки нарушение не фиксируется
+SAMPLES = {
+    'avg_downtime': 'complaints',
+    'p90_downtime': 'complaints',
+    'repeat_rate': 'complaints',
+    'avg_delay': 'maintenances',
+    'late_rate': 'maintenances',
+}
+
+COMPLAINT_FIELDS = ('id', 'machine_id', 'failure_node_id', 'failure_date', 'downtime', 'service_company_id')
+MAINTENANCE_FIELDS = ('id', 'event_date', 'order_date', 'service_company_id')
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def downtime_bin(downtime):
+    return bisect_left(DOWNTIME_BINS, downtime)
+
+
+def _histogram(values):
+    histogram = list(values or [])
+    return histogram + [0] * (len(DOWNTIME_BINS) + 1 - len(histogram))
+
+
+def is_repeat_failure(values, using='default'):
+    """Раньше на той же машине за SLA_REPEAT_FAILURE_DAYS дней отказывал тот же узел."""
+    day = values['failure_date']
+    return Complaint.objects.using(using).filter(
+        Q(failure_date__lt=day) | Q(failure_date=day, pk__lt=values['id']),
+        machine_id=values['machine_id'],
+        failure_node_id=values['failure_node_id'],
+        failure_date__gte=day - timedelta(days=settings.SLA_REPEAT_FAILURE_DAYS),
+    ).exists()
+
+
+def get_repeat_neighbours(positions, exclude_pk=None, using='default'):
+    """
+    Повторность рекламаций, которая зависит от рекламации в позициях positions ((машина, узел, дата)):
+    тот же узел той же машины в течение SLA_REPEAT_FAILURE_DAYS начиная с даты.
+
+    Сравнение до и после записи показывает, у каких соседей повторность изменилась: вклад соседа
+    в корзину иначе остался бы прежним, и при его удалении вычиталось бы не то, что было добавлено.
+    Возвращает {pk: (компания, неделя, повторный ли отказ)} без самой рекламации exclude_pk;
+    одним запросом на узел машины.
+    """
+    window = timedelta(days=settings.SLA_REPEAT_FAILURE_DAYS)
+    groups = defaultdict(set)
+    for machine_id, node_id, day in positions:
+        groups[machine_id, node_id].add(day)
+    neighbours = {}
+    for (machine_id, node_id), days in groups.items():
+        rows = Complaint.objects.using(using).filter(
+            machine_id=machine_id,
+            failure_node_id=node_id,
+            failure_date__gte=min(days) - window,
+            failure_date__lte=max(days) + window,
+        ).order_by('failure_date', 'pk').values_list('pk', 'failure_date', 'service_company_id')
+        previous = None
+        for pk, day, company_id in rows:
+            # Своя повторность рекламации учитывается ее собственным вкладом
+            if pk != exclude_pk and any(start <= day <= start + window for start in days):
+                repeat = previous is not None and day - previous <= window
+                neighbours[pk] = (company_id, week_start(day), repeat)
+            previous = day
+    return neighbours
+
+
+def apply_repeat_changes(before, after, using='default'):
+    """Исправляет корзины соседей, повторность которых изменилась; возвращает число изменений."""
+    changed = 0
+    for pk, (company_id, week, repeat) in after.items():
+        previous = before.get(pk)
+        if previous is not None and previous[2] != repeat:
+            apply_contribution((company_id, week, {'repeat_failures': 1}), 1 if repeat else -1, using)
+            changed += 1
+    return changed
+
+
+def complaint_contribution(values, using='default'):
+    """Вклад рекламации в недельную корзину: (компания, неделя, {поле: приращение})."""
+    downtime = max(values['downtime'] or 0, 0)
+    return values['service_company_id'], week_start(values['failure_date']), {
+        'complaints': 1,
+        'downtime_sum': downtime,
+        'downtime_bin': downtime_bin(downtime),
+        'repeat_failures': int(is_repeat_failure(values, using)),
+    }
+
+
+def maintenance_contribution(values, using='default'):
+    delay = max((values['event_date'] - values['order_date']).days, 0)
+    return values['service_company_id'], week_start(values['event_date']), {
+        'maintenances': 1,
+        'maintenance_delay_sum': delay,
+        'late_maintenances': int(delay > settings.SLA_MAINTENANCE_MAX_DELAY_DAYS),
+    }
+
+
+CONTRIBUTIONS = {
+    Complaint: (COMPLAINT_FIELDS, complaint_contribution),
+    Maintenance: (MAINTENANCE_FIELDS, maintenance_contribution),
+}
+
+
+def get_contribution(instance, using='default'):
+    fields, contribution = CONTRIBUTIONS[type(instance)]
+    return contribution({field: getattr(instance, field) for field in fields}, using)
+
+
+def get_stored_contribution(model, pk, using='default'):
+    """Вклад записи в том виде, в каком она сейчас сохранена в базе (None, если ее нет)."""
+    fields, contribution = CONTRIBUTIONS[model]
+    values = model.objects.using(using).filter(pk=pk).values(*fields).first()
+    return contribution(values, using) if values else None
+
+
+def _locked_bucket(company_id, week, using):
+    queryset = SlaBucket.objects.using(using).select_for_update()
+    bucket = queryset.filter(service_company_id=company_id, week_start=week).first()
+    if bucket is not None:
+        return bucket
+    try:
+        with transaction.atomic(using=using):
+            return SlaBucket.objects.using(using).create(service_company_id=company_id, week_start=week)
+    except IntegrityError:
+        # Корзину параллельно создала другая транзакция
+        return queryset.get(service_company_id=company_id, week_start=week)
+
+
+def apply_contribution(contribution, sign=1, using='default'):
+    """Добавляет (sign=1) или вычитает (sign=-1) вклад записи; строка корзины блокируется до конца транзакции."""
+    company_id, week, deltas = contribution
+    with transaction.atomic(using=using):
+        bucket = _locked_bucket(company_id, week, using)
+        for field, value in deltas.items():
+            if field == 'downtime_bin':
+                histogram = _histogram(bucket.downtime_histogram)
+                histogram[value] += sign
+                bucket.downtime_histogram = histogram
+            else:
+                setattr(bucket, field, getattr(bucket, field) + sign * value)
+        bucket.save(using=using)
+
+
+def get_window_start(today=None):
+    today = today or timezone.localdate()
+    return week_start(today - timedelta(days=settings.SLA_WINDOW_DAYS))
+
+
+def _percentile(histogram, share):
+    total = sum(histogram)
+    if not total:
+        return None
+    running = 0
+    for index, count in enumerate(histogram):
+        running += count
+        if running >= total * share:
+            # Интервал "больше 90 дней" оценивается его нижней границей
+            return DOWNTIME_BINS[min(index, len(DOWNTIME_BINS) - 1)]
+    return DOWNTIME_BINS[-1]
+
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if denominator else None
+
+
+def get_company_stats(today=None):
+    """
+    Показатели компаний за скользящее окно SLA_WINDOW_DAYS: {id компании: показатели}.
+
+    Читаются только недельные корзины окна (несколько строк на компанию) одним запросом.
+    """
+    buckets = (
+        SlaBucket.objects.filter(week_start__gte=get_window_start(today))
+        .select_related('service_company')
+        .only('service_company__username', 'service_company__name', *[
+            field.attname for field in SlaBucket._meta.concrete_fields
+        ])
+    )
+    totals = {}
+    for bucket in buckets:
+        total = totals.get(bucket.service_company_id)
+        if total is None:
+            total = totals[bucket.service_company_id] = defaultdict(int, company=bucket.service_company)
+            total['histogram'] = _histogram(None)
+        for field in ('complaints', 'downtime_sum', 'repeat_failures',
+                      'maintenances', 'maintenance_delay_sum', 'late_maintenances'):
+            total[field] += getattr(bucket, field)
+        total['histogram'] = [a + b for a, b in zip(total['histogram'], _histogram(bucket.downtime_histogram))]
+    stats = {}
+    for company_id, total in totals.items():
+        if not total['complaints'] and not total['maintenances']:
+            continue
+        stats[company_id] = {
+            'company': total['company'],
+            'complaints': total['complaints'],
+            'maintenances': total['maintenances'],
+            'avg_downtime': _ratio(total['downtime_sum'], total['complaints']),
+            'p90_downtime': _percentile(total['histogram'], 0.9),
+            'repeat_rate': _ratio(total['repeat_failures'], total['complaints']),
+            'avg_delay': _ratio(total['maintenance_delay_sum'], total['maintenances']),
+            'late_rate': _ratio(total['late_maintenances'], total['maintenances']),
+        }
+    return stats
+
+
+def find_breaches(stats):
+    """{(компания, показатель): (значение, порог)} для показателей выше SLA_THRESHOLDS."""
+    breaches = {}
+    for company_id, company in stats.items():
+        for metric, threshold in settings.SLA_THRESHOLDS.items():
+            value = company[metric]
+            if value is None or company[SAMPLES[metric]] < settings.SLA_MIN_SAMPLE:
+                continue
+            if value > threshold:
+                breaches[company_id, metric] = (value, threshold)
+    return breaches
+
+
+def evaluate_sla(using='default'):
+    """
+    Сверяет показатели с порогами: открывает нарушения, которых еще нет, и закрывает те,
+    показатель которых вернулся в норму. Возвращает (новые, закрытые) нарушения.
+    """
+    breaches = find_breaches(get_company_stats())
+    now = timezone.now()
+    with transaction.atomic(using=using):
+        open_alerts = {
+            (alert.service_company_id, alert.metric): alert
+            for alert in SlaAlert.objects.using(using).select_for_update().filter(resolved_at__isnull=True)
+        }
+        created = [
+            SlaAlert(service_company_id=company_id, metric=metric, value=value, threshold=threshold)
+            for (company_id, metric), (value, threshold) in breaches.items()
+            if (company_id, metric) not in open_alerts
+        ]
+        resolved = [alert for key, alert in open_alerts.items() if key not in breaches]
+        SlaAlert.objects.using(using).bulk_create(created)
+        SlaAlert.objects.using(using).filter(pk__in=[alert.pk for alert in resolved]).update(resolved_at=now)
+        # bulk_create и update() не вызывают сигналы
+        if created or resolved:
+            versioning.bump_data_version(versioning.SLA, using=using)
+    return created, resolved
+
+
+def rebuild_buckets(since, using='default'):
+    """
+    Пересчитывает корзины с недели since из рекламаций и ТО: начальное заполнение и исправление
+    расхождений после массовых операций, которые обходят сигналы (QuerySet.update(), upsert_batch).
+    """
+    since = week_start(since)
+    totals = {}
+
+    def add(contribution):
+        company_id, week, deltas = contribution
+        bucket = totals.get((company_id, week))
+        if bucket is None:
+            bucket = totals[company_id, week] = SlaBucket(
+                service_company_id=company_id, week_start=week, downtime_histogram=_histogram(None)
+            )
+        for field, value in deltas.items():
+            if field == 'downtime_bin':
+                bucket.downtime_histogram[value] += 1
+            else:
+                setattr(bucket, field, getattr(bucket, field) + value)
+
+    complaints = Complaint.objects.using(using).filter(failure_date__gte=since).order_by(
+        'machine_id', 'failure_node_id', 'failure_date', 'pk'
+    ).values(*COMPLAINT_FIELDS)
+    # Повторность по отсортированному списку, без запроса на каждую рекламацию
+    last_failure = {}
+    for values in complaints.iterator():
+        node = (values['machine_id'], values['failure_node_id'])
+        previous = last_failure.get(node)
+        if previous is None and values['failure_date'] - since < timedelta(days=settings.SLA_REPEAT_FAILURE_DAYS):
+            repeat = is_repeat_failure(values, using)
+        else:
+            repeat = previous is not None and (
+                values['failure_date'] - previous <= timedelta(days=settings.SLA_REPEAT_FAILURE_DAYS)
+            )
+        last_failure[node] = values['failure_date']
+        downtime = max(values['downtime'] or 0, 0)
+        add((values['service_company_id'], week_start(values['failure_date']), {
+            'complaints': 1,
+            'downtime_sum': downtime,
+            'downtime_bin': downtime_bin(downtime),
+            'repeat_failures': int(repeat),
+        }))
+    maintenances = Maintenance.objects.using(using).filter(event_date__gte=since).values(*MAINTENANCE_FIELDS)
+    for values in maintenances.iterator():
+        add(maintenance_contribution(values, using))
+
+    with transaction.atomic(using=using):
+        SlaBucket.objects.using(using).filter(week_start__gte=since).delete()
+        SlaBucket.objects.using(using).bulk_create(totals.values())
+        versioning.bump_data_version(versioning.SLA, using=using)
+    return len(totals)
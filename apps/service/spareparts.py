@@ -0,0 +1,254 @@
+import re
+from collections import Counter, defaultdict
+from datetime import date
+
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth, TruncQuarter, TruncYear
+
+from . import versioning
+from .models import ArchivedComplaint, Complaint, Machine, SparePart, SparePartDemand, SparePartUsage
+
+SEPARATORS = re.compile(r'[,;\n+]+')
+# "2 шт", "2шт.", "x2", "2х", "× 3" и число в начале фрагмента ("2 подшипника")
+QUANTITY = re.compile(r'(\d+)\s*(?:шт\b\.?|штук[аи]?\b|[xх×](?!\w))|(?<!\w)[xх×]\s*(\d+)|^(\d+)\s+')
+EMPTY_BRACKETS = re.compile(r'\(\s*\)|\[\s*\]')
+WORDS = re.compile(r'[0-9a-zа-я]+(?:[-.][0-9a-zа-я]+)*')
+# Окончания, которые отбрасываются, чтобы "прокладки" и "прокладка" давали один ключ
+ENDINGS = sorted((
+    'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ах', 'ях', 'ов', 'ев', 'ей', 'ий', 'ый', 'ой',
+    'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ам', 'ям', 'ом', 'ем', 'а', 'я', 'ы', 'и', 'у', 'ю', 'е', 'о', 'ь',
+), key=len, reverse=True)
+# Самое длинное название в словах, которое ищется внутри фрагмента
+MAX_NAME_WORDS = 6
+DEMAND_DIMENSIONS = ('part', 'failure_node', 'technique_model', 'service_company')
+PERIODS = {'month': TruncMonth, 'quarter': TruncQuarter, 'year': TruncYear}
+COMPLAINT_FIELDS = ('id', 'spare_parts', 'failure_date', 'failure_node_id', 'service_company_id', 'machine_id')
+USAGE_FIELDS = ('part_id', 'quantity', 'raw', 'failure_date', 'failure_node_id', 'technique_model_id',
+                'service_company_id')
+
+_dictionary = {}
+
+
+def _stem(word):
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def make_key(text):
+    return tuple(_stem(word) for word in WORDS.findall(text.lower().replace('ё', 'е')))
+
+
+def build_dictionary(parts):
+    """{ключ названия: id запчасти} по названиям и другим названиям справочника."""
+    dictionary = {}
+    for pk, name, aliases in parts:
+        for text in [name, *aliases.splitlines()]:
+            key = make_key(text)
+            if key:
+                dictionary.setdefault(key, pk)
+    return dictionary
+
+
+def get_dictionary():
+    """Словарь разбора в памяти процесса; перестраивается, когда меняется версия справочников."""
+    version = versioning.get_data_versions(versioning.CATALOG)[versioning.CATALOG]
+    if _dictionary.get('version') != version:
+        _dictionary['entries'] = build_dictionary(SparePart.objects.values_list('pk', 'name', 'aliases'))
+        _dictionary['version'] = version
+    return _dictionary['entries']
+
+
+def parse_fragment(fragment):
+    """'Подшипник 2 шт.' -> ('Подшипник', 2)."""
+    quantity = 1
+    match = QUANTITY.search(fragment.lower())
+    if match:
+        quantity = int(next(group for group in match.groups() if group))
+        fragment = fragment[:match.start()] + ' ' + fragment[match.end():]
+    fragment = EMPTY_BRACKETS.sub(' ', fragment)
+    return ' '.join(fragment.split()).strip(' .-:'), max(quantity, 1)
+
+
+def lookup(key, dictionary):
+    """Запчасть по ключу фрагмента целиком или по самой длинной последовательности слов в нем."""
+    if key in dictionary:
+        return dictionary[key]
+    for size in range(min(len(key) - 1, MAX_NAME_WORDS), 0, -1):
+        for start in range(len(key) - size + 1):
+            part = dictionary.get(key[start:start + size])
+            if part is not None:
+                return part
+    return None
+
+
+def parse_spare_parts(text, dictionary):
+    """Текст Complaint.spare_parts -> [(id запчасти или None, количество, фрагмент)]; одна запчасть - одна строка."""
+    found = {}
+    for fragment in SEPARATORS.split(text or ''):
+        raw, quantity = parse_fragment(fragment)
+        key = make_key(raw)
+        if not key:
+            continue
+        part = lookup(key, dictionary)
+        slot = part if part is not None else ('raw', key)
+        if slot in found:
+            found[slot][1] += quantity
+        else:
+            found[slot] = [part, quantity, raw[:255]]
+    return [tuple(item) for item in found.values()]
+
+
+def build_usage(values, technique_model_id, dictionary):
+    """Строки журнала для рекламации (словарь полей COMPLAINT_FIELDS), без сохранения."""
+    return [
+        SparePartUsage(
+            complaint_id=values['id'],
+            part_id=part,
+            quantity=quantity,
+            raw=raw,
+            failure_date=values['failure_date'],
+            failure_node_id=values['failure_node_id'],
+            technique_model_id=technique_model_id,
+            service_company_id=values['service_company_id'],
+        )
+        for part, quantity, raw in parse_spare_parts(values['spare_parts'], dictionary)
+    ]
+
+
+def _signature(rows):
+    return Counter(tuple(getattr(row, field) for field in USAGE_FIELDS) for row in rows)
+
+
+def _demand_deltas(rows, sign):
+    deltas = defaultdict(lambda: [0, 0])
+    for row in rows:
+        if row.part_id is None:
+            continue
+        key = (row.part_id, row.failure_date.replace(day=1), row.failure_node_id,
+               row.technique_model_id, row.service_company_id)
+        deltas[key][0] += sign * row.quantity
+        deltas[key][1] += sign
+    return deltas
+
+
+def apply_demand(deltas, using='default'):
+    """Прибавляет к месячным строкам SparePartDemand; UPDATE с F() не требует блокировки строки заранее."""
+    for (part, month, node, model, company), (quantity, complaints) in deltas.items():
+        key = {'part_id': part, 'month': month, 'failure_node_id': node,
+               'technique_model_id': model, 'service_company_id': company}
+        changes = {'quantity': F('quantity') + quantity, 'complaints': F('complaints') + complaints}
+        if SparePartDemand.objects.using(using).filter(**key).update(**changes):
+            continue
+        try:
+            with transaction.atomic(using=using):
+                SparePartDemand.objects.using(using).create(**key, quantity=quantity, complaints=complaints)
+        except IntegrityError:
+            # Строку параллельно создала другая транзакция
+            SparePartDemand.objects.using(using).filter(**key).update(**changes)
+    if deltas:
+        versioning.bump_data_version(versioning.SPARE_PARTS, using=using)
+
+
+def sync_complaint(complaint, using='default'):
+    """Приводит журнал и спрос в соответствие с сохраненной рекламацией; без изменений запчастей ничего не пишет."""
+    values = {field: getattr(complaint, field) for field in COMPLAINT_FIELDS}
+    technique_model_id = Machine.objects.using(using).filter(pk=complaint.machine_id).values_list(
+        'technique_model_id', flat=True
+    ).first()
+    rows = build_usage(values, technique_model_id, get_dictionary())
+    previous = list(SparePartUsage.objects.using(using).filter(complaint_id=complaint.pk))
+    if _signature(previous) == _signature(rows):
+        return
+    with transaction.atomic(using=using):
+        SparePartUsage.objects.using(using).filter(complaint_id=complaint.pk).delete()
+        SparePartUsage.objects.using(using).bulk_create(rows)
+        deltas = _demand_deltas(previous, -1)
+        for key, (quantity, complaints) in _demand_deltas(rows, 1).items():
+            deltas[key][0] += quantity
+            deltas[key][1] += complaints
+        apply_demand({key: delta for key, delta in deltas.items() if delta != [0, 0]}, using=using)
+
+
+def remove_complaint(complaint_id, using='default'):
+    with transaction.atomic(using=using):
+        previous = list(SparePartUsage.objects.using(using).filter(complaint_id=complaint_id))
+        if previous:
+            SparePartUsage.objects.using(using).filter(complaint_id=complaint_id).delete()
+            apply_demand(_demand_deltas(previous, -1), using=using)
+
+
+def _delete_all(model, using):
+    # QuerySet.delete() загрузил бы весь журнал в память ради сигналов post_delete
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+
+
+def rebuild_ledger(create_parts=False, batch_size=2000, using='default'):
+    """
+    Заполняет журнал и спрос заново по всем рекламациям, включая архив: справочник и модели
+    техники машин держатся в памяти, строки пишутся пачками. create_parts - нераспознанные
+    фрагменты добавляются в справочник новыми запчастями.
+
+    Возвращает (рекламаций, строк журнала, из них без запчасти).
+    """
+    dictionary = build_dictionary(SparePart.objects.using(using).values_list('pk', 'name', 'aliases'))
+    technique_models = dict(Machine.objects.using(using).values_list('pk', 'technique_model_id'))
+    complaints = usage_count = unmatched = 0
+    demand = defaultdict(lambda: [0, 0])
+    with transaction.atomic(using=using):
+        _delete_all(SparePartUsage, using)
+        _delete_all(SparePartDemand, using)
+        batch = []
+        for model in (Complaint, ArchivedComplaint):
+            rows = model.objects.using(using).exclude(spare_parts='').order_by().values(*COMPLAINT_FIELDS)
+            for values in rows.iterator(chunk_size=batch_size):
+                complaints += 1
+                if create_parts:
+                    for part, _, raw in parse_spare_parts(values['spare_parts'], dictionary):
+                        if part is None:
+                            created = SparePart.objects.using(using).create(name=raw[:1].upper() + raw[1:])
+                            dictionary[make_key(raw)] = created.pk
+                usage = build_usage(values, technique_models.get(values['machine_id']), dictionary)
+                for key, (quantity, count) in _demand_deltas(usage, 1).items():
+                    demand[key][0] += quantity
+                    demand[key][1] += count
+                unmatched += sum(row.part_id is None for row in usage)
+                batch.extend(usage)
+                if len(batch) >= batch_size:
+                    usage_count += len(SparePartUsage.objects.using(using).bulk_create(batch))
+                    batch = []
+        usage_count += len(SparePartUsage.objects.using(using).bulk_create(batch))
+        SparePartDemand.objects.using(using).bulk_create([
+            SparePartDemand(part_id=part, month=month, failure_node_id=node, technique_model_id=model,
+                            service_company_id=company, quantity=quantity, complaints=count)
+            for (part, month, node, model, company), (quantity, count) in demand.items()
+        ], batch_size=batch_size)
+        versioning.bump_data_version(versioning.SPARE_PARTS, using=using)
+    return complaints, usage_count, unmatched
+
+
+def get_demand(rows, group_by, period='month'):
+    """
+    Спрос по строкам SparePartDemand (уже отфильтрованным), сгруппированный по периоду
+    и измерениям group_by, с названиями измерений; по убыванию количества.
+    """
+    fields = []
+    if 'period' in group_by:
+        rows = rows.annotate(period=PERIODS[period]('month', output_field=SparePartDemand._meta.get_field('month')))
+        fields.append('period')
+    for dimension in DEMAND_DIMENSIONS:
+        if dimension in group_by:
+            fields.extend([dimension, f'{dimension}__name'])
+    result = rows.order_by().values(*fields).annotate(
+        quantity=Sum('quantity'), complaints=Sum('complaints')
+    ).filter(quantity__gt=0)
+    ordering = ['period'] if 'period' in group_by else []
+    return [
+        {key.replace('__name', '_name'): value.isoformat() if isinstance(value, date) else value
+         for key, value in row.items()}
+        for row in result.order_by(*ordering, '-quantity')
+    ]
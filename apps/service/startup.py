@@ -0,0 +1,64 @@
+"""
+Замер запуска воркера в чистом процессе: python -X importtime -m apps.service.startup.
+
+Печатает JSON с длительностью этапов (django.setup() с разбивкой по приложениям, WSGI-приложение,
+шаги прогрева); время импорта модулей Python пишет в stderr (-X importtime). Запускается
+командой startup_profile, в уже запущенном Django замер был бы бессмыслен.
+"""
+import json
+import os
+import sys
+import time
+
+
+def _timed(method, label, phase, apps_timings):
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            apps_timings.setdefault(label, {})[phase] = time.perf_counter() - started
+    return wrapper
+
+
+def main():
+    started = time.perf_counter()
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    import django
+    from django.apps import AppConfig
+
+    apps_timings = {}
+    create = AppConfig.create.__func__
+
+    def timed_create(cls, entry):
+        # Импорт пакета приложения и AppConfig, затем моделей и ready() - отдельно для каждого приложения
+        created = time.perf_counter()
+        config = create(cls, entry)
+        apps_timings.setdefault(config.label, {})['import'] = time.perf_counter() - created
+        config.import_models = _timed(config.import_models, config.label, 'models', apps_timings)
+        config.ready = _timed(config.ready, config.label, 'ready', apps_timings)
+        return config
+
+    AppConfig.create = classmethod(timed_create)
+    phases = {}
+    clock = time.perf_counter()
+    django.setup(set_prefix=False)
+    phases['setup'] = time.perf_counter() - clock
+
+    clock = time.perf_counter()
+    from django.core.handlers.wsgi import WSGIHandler
+    WSGIHandler()
+    phases['wsgi'] = time.perf_counter() - clock
+
+    from apps.service.warmup import warm_up
+    warmup = {name: seconds for name, (_, seconds) in warm_up(keep_connections=False).items()}
+    json.dump({
+        'phases': phases,
+        'apps': apps_timings,
+        'warmup': warmup,
+        'ready': time.perf_counter() - started,
+    }, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+import logging
+import os
+import signal
+import socket
+import traceback
+from contextlib import nullcontext
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .live import purge_live_events
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class TaskType:
+    name: str
+    func: object
+    batch_size: int
+    max_attempts: int
+    retry_delay: int
+    atomic: bool
+
+
+class BatchError(Exception):
+    """
+    Обработчик выполнил пачку не целиком: failed - индексы payload'ов, которые нужно повторить.
+    Остальные задачи пачки отмечаются выполненными и повторно не запускаются.
+    """
+
+    def __init__(self, failed, message=''):
+        super().__init__(message)
+        self.failed = set(failed)
+
+
+# Имя задачи -> TaskType; заполняется декоратором register_task при импорте tasks.py
+REGISTRY = {}
+
+
+def register_task(name, batch_size=1, max_attempts=5, retry_delay=30, atomic=True):
+    """
+    Регистрирует обработчик задач. Обработчик получает список payload'ов:
+    воркер выбирает до batch_size ожидающих задач одного типа и выполняет их одним вызовом.
+
+    С atomic=False обработчик выполняется вне общей транзакции и сам открывает короткие:
+    долгая работа и сеть (почта) не держат блокировку записи SQLite. Такой обработчик должен
+    допускать повтор; чтобы не повторять выполненную часть пачки, он сообщает о невыполненной BatchError.
+    """
+    def decorator(func):
+        REGISTRY[name] = TaskType(name, func, batch_size, max_attempts, retry_delay, atomic)
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, dedup_key=None, run_at=None, using='default'):
+    """
+    Ставит задачу в очередь в текущей транзакции.
+
+    Пока задача с тем же dedup_key ждет, повторная не создается (возвращается None). Если такая
+    задача уже выполняется, новая ставится и будет взята в работу после ее завершения.
+    """
+    task_type = REGISTRY.get(name)
+    if task_type is None:
+        raise ValueError(f'Неизвестная фоновая задача: {name}')
+    task = Task(
+        name=name,
+        payload=payload or {},
+        dedup_key=dedup_key,
+        max_attempts=task_type.max_attempts,
+        run_at=run_at or timezone.now(),
+    )
+    if dedup_key is None:
+        task.save(using=using)
+        return task
+    try:
+        with transaction.atomic(using=using):
+            task.save(using=using)
+    except IntegrityError:
+        return None
+    return task
+
+
+def claim_batch(worker_id):
+    """Берет в работу пачку ожидающих задач одного типа: (TaskType, [Task]) или (None, [])."""
+    now = timezone.now()
+    with transaction.atomic():
+        # В PostgreSQL параллельные воркеры пропускают чужие строки, в SQLite выборку сериализует BEGIN IMMEDIATE
+        pending = Task.objects.select_for_update(skip_locked=True).filter(status=Task.PENDING, run_at__lte=now).exclude(
+            # Задача с тем же ключом еще выполняется: повтор ждет ее завершения
+            dedup_key__in=Task.objects.filter(status=Task.RUNNING, dedup_key__isnull=False).values('dedup_key')
+        )
+        first = pending.order_by('run_at', 'id').first()
+        if first is None:
+            return None, []
+        task_type = REGISTRY.get(first.name)
+        if task_type is None:
+            Task.objects.filter(pk=first.pk).update(
+                status=Task.FAILED, finished_at=now, last_error=f'Неизвестная задача: {first.name}'
+            )
+            return None, []
+        tasks = list(pending.filter(name=first.name).order_by('run_at', 'id')[:task_type.batch_size])
+        Task.objects.filter(pk__in=[task.pk for task in tasks]).update(
+            status=Task.RUNNING, locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1
+        )
+    for task in tasks:
+        task.attempts += 1
+    return task_type, tasks
+
+
+def run_batch(task_type, tasks):
+    failed, failure = [], None
+    try:
+        # Записи обработчика и отметка о выполнении фиксируются вместе (кроме atomic=False)
+        with transaction.atomic() if task_type.atomic else nullcontext():
+            try:
+                task_type.func([task.payload for task in tasks])
+            except BatchError as error:
+                failed = [task for index, task in enumerate(tasks) if index in error.failed]
+                failure = str(error)
+            done = [task.pk for task in tasks if task not in failed]
+            with transaction.atomic():
+                Task.objects.filter(pk__in=done).update(status=Task.DONE, finished_at=timezone.now(), last_error='')
+    except Exception:
+        logger.exception('Фоновая задача %s (%d шт.) завершилась ошибкой', task_type.name, len(tasks))
+        retry_or_fail(task_type, tasks, traceback.format_exc())
+        return
+    metrics.incr(f'tasks.{task_type.name}.done', len(tasks) - len(failed))
+    if failed:
+        logger.error('Фоновая задача %s: не выполнено %d из %d', task_type.name, len(failed), len(tasks))
+        retry_or_fail(task_type, failed, failure)
+
+
+def retry_or_fail(task_type, tasks, error):
+    metrics.incr(f'tasks.{task_type.name}.failed', len(tasks))
+    now = timezone.now()
+    for task in tasks:
+        if task.attempts >= task.max_attempts:
+            Task.objects.filter(pk=task.pk).update(status=Task.FAILED, finished_at=now, last_error=error)
+        else:
+            # Экспоненциальная задержка: 30 с, 1 мин, 2 мин, ... не больше суток
+            delay = min(task_type.retry_delay * 2 ** (task.attempts - 1), 86400)
+            return_to_queue(task, last_error=error, run_at=now + timedelta(seconds=delay))
+
+
+def return_to_queue(task, **fields):
+    """
+    Возвращает задачу в ожидание. Если с тем же dedup_key уже ждет новая задача, эта закрывается
+    как неудавшаяся: ожидающая выполнит ту же работу.
+    """
+    try:
+        with transaction.atomic():
+            return Task.objects.filter(pk=task.pk).update(status=Task.PENDING, locked_by='', **fields)
+    except IntegrityError:
+        Task.objects.filter(pk=task.pk).update(
+            status=Task.FAILED, finished_at=timezone.now(), last_error=fields.get('last_error', task.last_error)
+        )
+        return 0
+
+
+def release_stale_tasks():
+    """Возвращает в очередь задачи воркеров, которые упали, не завершив их."""
+    deadline = timezone.now() - timedelta(seconds=settings.TASK_LOCK_TIMEOUT)
+    return sum(
+        return_to_queue(task) for task in Task.objects.filter(status=Task.RUNNING, locked_at__lt=deadline)
+    )
+
+
+def purge_finished_tasks():
+    deadline = timezone.now() - timedelta(days=settings.TASK_RETENTION_DAYS)
+    return Task.objects.filter(status=Task.DONE, finished_at__lt=deadline).delete()[0]
+
+
+def work(worker_id, stop, poll_interval=1.0, once=False):
+    """Цикл воркера: выполняет задачи, пока есть работа; без работы ждет poll_interval секунд."""
+    release_stale_tasks()
+    while not stop.is_set():
+        task_type, tasks = claim_batch(worker_id)
+        if tasks:
+            run_batch(task_type, tasks)
+            continue
+        if once:
+            break
+        release_stale_tasks()
+        purge_finished_tasks()
+        purge_live_events()
+        stop.wait(poll_interval)
+
+
+def worker_process(index, stop, poll_interval, once):
+    """Точка входа дочернего процесса run_worker."""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+    # Ctrl+C и SIGTERM обрабатывает родительский процесс, выставляя stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker_id = f'{socket.gethostname()}:{os.getpid()}:{index}'
+    try:
+        work(worker_id, stop, poll_interval, once)
+    finally:
+        connections.close_all()
@@ -0,0 +1,150 @@
+import logging
+import traceback
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+
+from apps.users.models import CustomUser
+from . import datapack, sla, versioning
+from .models import Attachment, Complaint, Maintenance
+from .taskqueue import BatchError, enqueue, register_task
+from .uploads import build_previews
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_NEW_COMPLAINT = 'notify_new_complaint'
+NOTIFY_NEW_MAINTENANCE = 'notify_new_maintenance'
+NOTIFY_SLA_CHANGES = 'notify_sla_changes'
+GENERATE_ATTACHMENT_PREVIEWS = 'generate_attachment_previews'
+EVALUATE_SLA = 'evaluate_sla'
+BUILD_DATA_PACKS = 'build_data_packs'
+
+
+def _email(user):
+    return user.email if user is not None else ''
+
+
+def _send_digests(records, email_of, subject, line_of):
+    """
+    Одно письмо на получателя со списком всех его записей из пачки. Письма уходят по одному через
+    общее соединение; возвращает {индекс записи: ошибка} для записей, чье письмо не отправлено.
+    """
+    grouped = defaultdict(list)
+    for index, record in enumerate(records):
+        email = email_of(record)
+        if email:
+            grouped[email].append(index)
+    failed = {}
+    if not grouped:
+        return failed
+    with get_connection() as connection:
+        for email, indexes in grouped.items():
+            body = '\n'.join(line_of(records[index]) for index in indexes)
+            try:
+                EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [email], connection=connection).send()
+            except Exception:
+                logger.exception('Не удалось отправить письмо %s', email)
+                failed.update(dict.fromkeys(indexes, traceback.format_exc()))
+    return failed
+
+
+def _raise_for_failed(failed):
+    """{индекс payload'а: ошибка} -> BatchError: повторяются только payload'ы с неотправленными письмами."""
+    if failed:
+        raise BatchError(failed, '\n'.join(sorted(set(failed.values()))))
+
+
+# Почта отправляется вне транзакции: SMTP не должен держать блокировку записи базы
+@register_task(NOTIFY_NEW_COMPLAINT, batch_size=100, atomic=False)
+def notify_new_complaint(payloads):
+    complaints = list(Complaint.objects.select_related('machine__service_company', 'failure_node').filter(
+        pk__in=[payload['complaint_id'] for payload in payloads]
+    ))
+    failed = _send_digests(
+        complaints,
+        lambda complaint: _email(complaint.machine.service_company),
+        'Мой Силант: новые рекламации',
+        lambda complaint: (
+            f'{complaint.failure_date:%d-%m-%Y} машина {complaint.machine.serial_number}: '
+            f'{complaint.failure_node} - {complaint.failure_description}'
+        ),
+    )
+    errors = {complaints[index].pk: error for index, error in failed.items()}
+    _raise_for_failed({
+        index: errors[payload['complaint_id']] for index, payload in enumerate(payloads)
+        if payload['complaint_id'] in errors
+    })
+
+
+@register_task(NOTIFY_NEW_MAINTENANCE, batch_size=100, atomic=False)
+def notify_new_maintenance(payloads):
+    maintenances = list(Maintenance.objects.select_related('machine__client', 'service_type').filter(
+        pk__in=[payload['maintenance_id'] for payload in payloads]
+    ))
+    failed = _send_digests(
+        maintenances,
+        lambda maintenance: _email(maintenance.machine.client),
+        'Мой Силант: проведено ТО',
+        lambda maintenance: (
+            f'{maintenance.event_date:%d-%m-%Y} машина {maintenance.machine.serial_number}: '
+            f'{maintenance.service_type}, заказ-наряд {maintenance.order_number}'
+        ),
+    )
+    errors = {maintenances[index].pk: error for index, error in failed.items()}
+    _raise_for_failed({
+        index: errors[payload['maintenance_id']] for index, payload in enumerate(payloads)
+        if payload['maintenance_id'] in errors
+    })
+
+
+@register_task(NOTIFY_SLA_CHANGES, batch_size=100, atomic=False)
+def notify_sla_changes(payloads):
+    # payload - письмо одному менеджеру: {'email', 'lines'}
+    _raise_for_failed(_send_digests(
+        payloads, lambda payload: payload['email'], 'Мой Силант: показатели сервисных компаний',
+        lambda payload: '\n'.join(payload['lines']),
+    ))
+
+
+# Декодирование и уменьшение картинок - вне транзакции, в ней только отметка preview_status
+@register_task(GENERATE_ATTACHMENT_PREVIEWS, batch_size=10, atomic=False)
+def generate_attachment_previews(payloads):
+    names = {payload['sha256']: payload['name'] for payload in payloads}
+    statuses = {sha256: build_previews(sha256, name) for sha256, name in names.items()}
+    with transaction.atomic():
+        for sha256, status in statuses.items():
+            Attachment.objects.filter(sha256=sha256).update(preview_status=status)
+        # update() не вызывает сигналы: карточки с вложениями должны получить новый ETag
+        versioning.bump_data_version(versioning.ATTACHMENT)
+
+
+@register_task(EVALUATE_SLA, batch_size=100)
+def evaluate_sla(payloads):
+    created, resolved = sla.evaluate_sla()
+    if not created and not resolved:
+        return
+    companies = CustomUser.objects.in_bulk({alert.service_company_id for alert in created + resolved})
+    lines = [
+        f'Нарушение: {companies.get(alert.service_company_id)} - {sla.METRICS[alert.metric]} '
+        f'{alert.value:.2f} (порог {alert.threshold:.2f})'
+        for alert in created
+    ] + [
+        f'Восстановлено: {companies.get(alert.service_company_id)} - {sla.METRICS[alert.metric]}'
+        for alert in resolved
+    ]
+    # Одно письмо каждому менеджеру на все изменения пачки; отправляется отдельной задачей после фиксации
+    emails = CustomUser.objects.filter(role=CustomUser.MANAGER).exclude(email='').values_list('email', flat=True)
+    for email in emails:
+        enqueue(NOTIFY_SLA_CHANGES, {'email': email, 'lines': lines})
+
+
+# Сборка пакетов долгая: без общей транзакции, запись в базу - только короткое переключение файла
+@register_task(BUILD_DATA_PACKS, batch_size=20, atomic=False)
+def build_data_packs(payloads):
+    # Пустой payload - пересборка всех устаревших пакетов (enqueue_build без области видимости)
+    if any('scope_key' not in payload for payload in payloads):
+        datapack.refresh_data_packs()
+    else:
+        datapack.refresh_data_packs({payload['scope_key'] for payload in payloads})
@@ -1,7 +1,16 @@
+import hashlib
+
 from django import template
+from django.core.cache import cache
+from django.utils.html import format_html
+
+from apps.service import metrics, versioning
+from apps.service.scope import get_role_scope
 
 register = template.Library()
 
+FRAGMENT_CACHE_TIMEOUT = 600
+
 @register.simple_tag(takes_context=True)
 def param_replace(context, **kwargs):
     d = context['request'].GET.copy()
@@ -14,3 +23,68 @@ def check_selected(current_value, param_value):
     if str(current_value) == str(param_value):
         return 'selected'
     return ''
+
+
+@register.simple_tag
+def facet_option(facets, table, param, item, current_value, label=None):
+    """
+    <option> фильтра со счетчиком записей (см. facets.get_facet_counts).
+    Варианты без записей отключаются, если они не выбраны сейчас.
+    """
+    label = label or getattr(item, 'name', '') or "Не указано"
+    count = facets.get(table, {}).get(param, {}).get(item.pk, 0) if facets else 0
+    selected = str(item.pk) in str(current_value or '').split(',')
+    return format_html(
+        '<option value="{}" data-label="{}"{}{}>{} ({})</option>',
+        item.pk, label, ' selected' if selected else '', ' disabled' if not count and not selected else '',
+        label, count,
+    )
+
+
+class CachedFragmentNode(template.Node):
+    def __init__(self, nodelist, name, labels, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.labels = labels
+        self.vary_on = vary_on
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        labels = tuple(self.labels.resolve(context).split(','))
+        request = context['request']
+        # Версии всех меток читаются одним запросом на страницу, сколько бы фрагментов на ней ни было
+        versions = getattr(request, '_fragment_versions', None)
+        if versions is None:
+            versions = request._fragment_versions = versioning.get_data_versions(*versioning.LABELS)
+        vary = hashlib.md5(repr([var.resolve(context) for var in self.vary_on]).encode()).hexdigest()
+        key = (
+            f'fragment:{name}:{get_role_scope(request.user).key}:'
+            f'{versioning.format_version_key(versions, labels)}:{vary}'
+        )
+
+        content = cache.get(key)
+        if content is None:
+            metrics.incr(f'fragment_cache.{name}.miss')
+            content = self.nodelist.render(context)
+            cache.set(key, content, FRAGMENT_CACHE_TIMEOUT)
+        else:
+            metrics.incr(f'fragment_cache.{name}.hit')
+        return content
+
+
+@register.tag
+def cachefragment(parser, token):
+    """
+    {% cachefragment 'имя' 'machine,catalog' значение1 значение2 %}...{% endcachefragment %}
+
+    Кэширует фрагмент для области видимости пользователя (RoleScope.key) и текущих
+    версий перечисленных данных: любая запись в них дает новый ключ. Значения после
+    версий дополнительно различают варианты фрагмента (например, выбранный фильтр).
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' ожидает имя фрагмента и метки версий данных")
+    nodelist = parser.parse(('endcachefragment',))
+    parser.delete_first_token()
+    name, labels, *vary_on = (parser.compile_filter(bit) for bit in bits[1:])
+    return CachedFragmentNode(nodelist, name, labels, vary_on)
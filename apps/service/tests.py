@@ -1,3 +1,565 @@
-from django.test import TestCase
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import F
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from apps.users.models import CustomUser, Organization
+from config.static import PrecompressedStaticFiles
+from .benchmarks import seed_fleet
+from . import archive, datapack, tasks, taskqueue, versioning
+from .models import (
+    DUPLICATE_MAINTENANCE_MESSAGE, ArchivedMaintenance, Attachment, Complaint, DataPack, DataVersion, FailureNode, Machine, Maintenance,
+    RecoveryMethod, SlaBucket, Task,
+)
+from .sla import rebuild_buckets
+from .throttling import Bucket
+from .reassignment import reassign_machines
+from .uploads import save_content_addressed, store_attachment
+from .services import get_filtered_complaints, get_filtered_machines, get_filtered_maintenances
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Планы запросов проверяются на SQLite')
+class FilterQueryPlanTests(TestCase):
+    """Фильтры FilterSet должны давать условия, которые обслуживаются индексами, а не полным просмотром."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_fleet(machines=300, events_per_machine=3, clients=10, service_companies=3)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.manager = CustomUser.objects.create(username='plan-manager', role=CustomUser.MANAGER)
+        cls.service = CustomUser.objects.get(username='bench-service-0')
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertUsesIndex(self, queryset, table, *indexes):
+        # Планировщик выбирает индекс по статистике, поэтому допускается любой из подходящих
+        plan = self.query_plan(queryset)
+        steps = [step for step in plan if f' {table} ' in f'{step} ']
+        self.assertTrue(steps, plan)
+        self.assertTrue(any(index in step for step in steps for index in indexes), plan)
+        self.assertFalse(any(step.startswith(f'SCAN {table}') for step in steps), plan)
+
+    def test_maintenance_service_type_and_date_range(self):
+        params = QueryDict('service_type=1,2&event_date_after=2016-01-01&event_date_before=2017-12-31')
+        queryset = get_filtered_maintenances(self.manager, params)
+        self.assertUsesIndex(queryset, 'service_maintenance', 'maintenance_type_date_idx', 'maintenance_event_date_idx')
+        self.assertNotIn('LIKE', str(queryset.query))
+
+    def test_maintenance_by_machine_serial(self):
+        params = QueryDict('car_serial_to=B00000001,B00000002')
+        queryset = get_filtered_maintenances(self.manager, params)
+        self.assertUsesIndex(queryset, 'service_machine', 'serial_number')
+        self.assertEqual(queryset.count(), 6)
+
+    def test_complaint_failure_node_and_date_range(self):
+        params = QueryDict('failure_node=3&failure_date_after=2016-01-01&failure_date_before=2016-06-30')
+        queryset = get_filtered_complaints(self.manager, params)
+        self.assertUsesIndex(queryset, 'service_complaint', 'complaint_node_date_idx', 'complaint_failure_date_idx')
+
+    def test_machines_in_service_company_scope(self):
+        queryset = get_filtered_machines(self.service, QueryDict('date_shipment_after=2016-01-01'))
+        self.assertUsesIndex(queryset, 'service_machine', 'machine_service_shipment_idx')
+
+    def test_date_range_is_inclusive(self):
+        machine = get_filtered_machines(self.manager, QueryDict()).first()
+        day = machine.date_shipment.isoformat()
+        params = QueryDict(f'date_shipment_after={day}&date_shipment_before={day}')
+        self.assertIn(machine, get_filtered_machines(self.manager, params))
+
+
+class SlaRepeatFailureTests(TestCase):
+    """Недельные корзины, которые ведут сигналы, совпадают с пересчетом с нуля после любых правок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_fleet(machines=1, events_per_machine=0, clients=1, service_companies=1)
+        cls.machine = Machine.objects.get()
+        cls.node = FailureNode.objects.first()
+        cls.recovery = RecoveryMethod.objects.first()
+
+    def create_complaint(self, day):
+        return Complaint.objects.create(
+            machine=self.machine, failure_date=day, operating_hours=10, failure_node=self.node,
+            failure_description='отказ', recovery_method=self.recovery, recovery_date=day + timedelta(days=2),
+            service_company=self.machine.service_company,
+        )
+
+    def buckets(self):
+        return sorted(
+            SlaBucket.objects.filter(complaints__gt=0).values_list('week_start', 'complaints', 'repeat_failures')
+        )
+
+    def assertMatchesRebuild(self):
+        live = self.buckets()
+        rebuild_buckets(date(2020, 1, 1))
+        self.assertEqual(live, self.buckets())
+
+    def test_back_dated_complaint_then_delete_later(self):
+        later = self.create_complaint(date(2024, 3, 20))
+        earlier = self.create_complaint(date(2024, 5, 1))
+        # Перенос даты делает более позднюю рекламацию повторной
+        earlier.failure_date = date(2024, 3, 10)
+        earlier.save()
+        self.assertMatchesRebuild()
+        later.delete()
+        self.assertEqual(self.buckets(), [(date(2024, 3, 4), 1, 0)])
+        self.assertMatchesRebuild()
+
+    def test_insert_and_delete_between_complaints(self):
+        first = self.create_complaint(date(2024, 3, 1))
+        last = self.create_complaint(date(2024, 4, 20))
+        middle = self.create_complaint(date(2024, 3, 25))
+        self.assertMatchesRebuild()
+        middle.delete()
+        self.assertMatchesRebuild()
+        first.delete()
+        last.delete()
+        self.assertEqual(self.buckets(), [])
+
+
+class MachineReassignGuardTests(TestCase):
+    """Передача машин без условий отбора отклоняется: пустой фильтр не должен означать весь парк."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_fleet(machines=10, events_per_machine=0, clients=2, service_companies=2)
+        cls.manager = CustomUser.objects.create(username='reassign-manager', role=CustomUser.MANAGER)
+        cls.new_client = CustomUser.objects.get(username='bench-client-0')
+
+    def owners(self):
+        return list(Machine.objects.order_by('pk').values_list('client_id', flat=True))
+
+    def test_api_rejects_empty_filter_value(self):
+        before = self.owners()
+        self.client.force_login(self.manager)
+        for query in ('', '?service_company=', '?service_company=&client=', '?service_company=x'):
+            response = self.client.post(
+                f'/api/machines/reassign/{query}', {'client': self.new_client.pk}, content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 400, query)
+        self.assertEqual(self.owners(), before)
+
+    def test_api_reassigns_filtered_machines(self):
+        company = Machine.objects.first().service_company_id
+        others = list(Machine.objects.exclude(service_company_id=company).order_by('pk').values_list('pk', 'client_id'))
+        self.client.force_login(self.manager)
+        response = self.client.post(
+            f'/api/machines/reassign/?service_company={company}', {'client': self.new_client.pk},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Machine.objects.filter(service_company_id=company).exclude(client=self.new_client).exists())
+        self.assertEqual(
+            list(Machine.objects.exclude(service_company_id=company).order_by('pk').values_list('pk', 'client_id')),
+            others,
+        )
+
+    def test_command_rejects_empty_filter_value(self):
+        before = self.owners()
+        with self.assertRaises(CommandError):
+            call_command('reassign_machines', filter=['service_company='], client=str(self.new_client.pk))
+        self.assertEqual(self.owners(), before)
+
+
+class TokenBucketTests(SimpleTestCase):
+    """Корзины в API_THROTTLE_DB общие для потоков и процессов: одновременные запросы не превышают бюджет."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(API_THROTTLE_DB=str(Path(directory.name) / 'throttle.sqlite3'))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_parallel_takes_do_not_exceed_capacity(self):
+        now = 1000.0
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            allowed = list(executor.map(lambda _: Bucket('throttle:list:user:1', 10, 1.0).take(1, now), range(40)))
+        self.assertEqual(allowed.count(True), 10)
+
+    def test_refill_and_charge(self):
+        bucket = Bucket('throttle:list:user:1', 10, 2.0)
+        self.assertTrue(bucket.take(1, now=1000.0))
+        bucket.charge(15, now=1000.0)
+        self.assertEqual(bucket.tokens, -6)
+        self.assertFalse(bucket.take(1, now=1003.0))
+        self.assertEqual(bucket.wait(), 1)
+        self.assertTrue(bucket.take(1, now=1003.5))
+        self.assertEqual(bucket.tokens, 0)
+        # Пополнение ограничено capacity
+        self.assertTrue(bucket.take(1, now=2000.0))
+        self.assertEqual(bucket.tokens, 9)
+
+
+class DataPackDownloadTests(TestCase):
+    """Докачка пакета после пересборки и гонка с удалением предыдущего файла."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = CustomUser.objects.create(username='pack-manager', role=CustomUser.MANAGER)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(DATA_PACK_ROOT=directory.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.client.force_login(self.manager)
+        self.pack = datapack.request_pack(self.manager)
+        self.pack.file_name = 'pack.sqlite3.gz'
+        self.pack.version_key = datapack.versioning.get_version_key(*datapack.DATA_PACK_LABELS)
+        self.pack.size = 100
+        self.pack.save()
+        datapack.get_path(self.pack.file_name).write_bytes(b'x' * 100)
+
+    def test_range_of_previous_version_returns_full_file(self):
+        # Прежний пакет был больше: диапазон за концом нового файла, но If-Range от другой версии
+        response = self.client.get('/api/datapack/', HTTP_RANGE='bytes=500-', HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'x' * 100)
+
+        etag = datapack.get_etag(self.pack)
+        response = self.client.get('/api/datapack/', HTTP_RANGE='bytes=90-', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'x' * 10)
+        self.assertEqual(self.client.get('/api/datapack/', HTTP_RANGE='bytes=500-', HTTP_IF_RANGE=etag).status_code, 416)
+
+    def test_file_removed_after_record_read(self):
+        # Запись еще указывает на файл, который уже удален после пересборки
+        with mock.patch.object(datapack, 'is_ready', return_value=True):
+            datapack.get_path(self.pack.file_name).unlink()
+            response = self.client.get('/api/datapack/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Retry-After'], '30')
+
+
+class DataPackStalenessTests(TestCase):
+    """Изменение машины отмечает только пакеты, в область которых она попадает; сужение области - 202."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_fleet(machines=12, events_per_machine=1, clients=3, service_companies=2)
+        cls.manager = CustomUser.objects.create(username='stale-manager', role=CustomUser.MANAGER)
+        cls.clients = list(CustomUser.objects.filter(role=CustomUser.CLIENT).order_by('username'))
+        cls.services = list(CustomUser.objects.filter(role=CustomUser.SERVICE).order_by('username'))
+        holding = Organization.objects.create(name='Холдинг', kind=CustomUser.CLIENT)
+        subsidiary = Organization.objects.create(name='Дочернее общество', kind=CustomUser.CLIENT, parent=holding)
+        cls.clients[0].organization = holding
+        cls.clients[0].save()
+        cls.clients[1].organization = subsidiary
+        cls.clients[1].save()
+
+    def setUp(self):
+        caches['default'].clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(DATA_PACK_ROOT=directory.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.packs = {}
+        for user in [self.manager, *self.clients, *self.services]:
+            pack = datapack.request_pack(user)
+            pack.file_name = f'{user.username}.sqlite3.gz'
+            pack.save()
+            datapack.get_path(pack.file_name).write_bytes(b'x')
+            self.packs[user] = pack.scope_key
+
+    def stale_users(self):
+        packs = {pack.scope_key: pack for pack in DataPack.objects.all()}
+        return {user for user, key in self.packs.items() if datapack.is_stale(packs[key])}
+
+    def test_machine_write_marks_only_packs_of_its_scope(self):
+        machine = Machine.objects.filter(client=self.clients[1]).first()
+        machine.consignee = 'Новый грузополучатель'
+        machine.save()
+        # Менеджеры, клиент (его организация и головная) и сервисная компания машины
+        service = CustomUser.objects.get(pk=machine.service_company_id)
+        self.assertEqual(self.stale_users(), {self.manager, self.clients[0], self.clients[1], service})
+
+        DataPack.objects.update(built_changes=F('changes'))
+        Maintenance.objects.filter(machine__client=self.clients[2]).first().save()
+        self.assertNotIn(self.clients[0], self.stale_users())
+        self.assertIn(self.clients[2], self.stale_users())
+
+    def test_reassignment_hides_previous_pack_until_rebuilt(self):
+        previous_owner, new_owner = self.clients[2], self.clients[1]
+        machine = Machine.objects.filter(client=previous_owner).first()
+        reassign_machines([machine.pk], client=new_owner)
+
+        self.client.force_login(previous_owner)
+        response = self.client.get('/api/datapack/')
+        self.assertEqual(response.status_code, 202)
+        self.client.force_login(new_owner)
+        response = self.client.get('/api/datapack/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Data-Pack-Stale'], '1')
+        # Организация, из которой ушла учетная запись, тоже не получает прежний файл
+        new_owner.organization = None
+        new_owner.save()
+        self.client.force_login(self.clients[0])
+        self.assertEqual(self.client.get('/api/datapack/').status_code, 202)
+
+
+class DataVersionTests(TestCase):
+    def test_first_bumps_of_missing_label_count_up(self):
+        DataVersion.objects.filter(label=versioning.SLA).delete()
+        versioning._bump([versioning.SLA, versioning.SLA], 'default')
+        versioning._bump([versioning.SLA], 'default')
+        self.assertEqual(DataVersion.objects.get(label=versioning.SLA).version, 2)
+
+
+class SessionCacheTests(TestCase):
+    """Сессии в кэше, общем для воркеров: выход в одном воркере действует и в остальных."""
+
+    def other_worker_store(self, session_key):
+        # Другой воркер - свой экземпляр кэша, созданный по тем же настройкам
+        store = SessionStore(session_key)
+        store._cache = caches.create_connection(settings.SESSION_CACHE_ALIAS)
+        return store
+
+    def test_logout_in_one_worker_ends_session_in_another(self):
+        self.assertNotIsInstance(caches[settings.SESSION_CACHE_ALIAS], LocMemCache)
+        user = CustomUser.objects.create(username='session-user', role=CustomUser.CLIENT)
+        self.client.force_login(user)
+        session_key = self.client.session.session_key
+        self.assertEqual(self.other_worker_store(session_key).load().get('_auth_user_id'), str(user.pk))
+
+        self.client.logout()
+        self.assertEqual(self.other_worker_store(session_key).load(), {})
+
+
+class PrecompressedStaticFilesTests(SimpleTestCase):
+    def test_if_none_match_compares_each_etag(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        Path(directory.name, 'app.css').write_text('body {}')
+        application = PrecompressedStaticFiles(None, directory.name, 'static')
+        etag = application.files['/static/app.css'].etag
+        statuses = []
+
+        def get(if_none_match):
+            environ = {'PATH_INFO': '/static/app.css', 'REQUEST_METHOD': 'GET', 'HTTP_IF_NONE_MATCH': if_none_match}
+            body = application(environ, lambda status, headers: statuses.append(status))
+            getattr(body, 'close', lambda: None)()
+            return statuses[-1]
+
+        self.assertEqual(get(f'"other", W/{etag}'), '304 Not Modified')
+        self.assertEqual(get('*'), '304 Not Modified')
+        # Часть чужого ETag не совпадает с ним
+        self.assertEqual(get(f'"x{etag[1:-1]}-gzip"'), '200 OK')
+
+
+class NotificationTaskTests(TestCase):
+    """Письма пачки отправляются по одному: ошибка одного получателя не повторяет письма остальным."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_fleet(machines=10, events_per_machine=2, clients=2, service_companies=2)
+        for user in CustomUser.objects.filter(role=CustomUser.SERVICE):
+            CustomUser.objects.filter(pk=user.pk).update(email=f'{user.username}@example.com')
+        cls.complaints = [
+            Complaint.objects.filter(service_company__username=f'bench-service-{i}').first() for i in range(2)
+        ]
+
+    def test_failed_recipient_is_retried_alone(self):
+        for complaint in self.complaints:
+            taskqueue.enqueue(tasks.NOTIFY_NEW_COMPLAINT, {'complaint_id': complaint.pk})
+        task_type, batch = taskqueue.claim_batch('test-worker')
+        self.assertEqual(len(batch), 2)
+        send = tasks.EmailMessage.send
+
+        def fail_for_second(message, *args, **kwargs):
+            if message.to == ['bench-service-1@example.com']:
+                raise OSError('SMTP недоступен')
+            return send(message, *args, **kwargs)
+
+        with mock.patch.object(tasks.EmailMessage, 'send', fail_for_second):
+            taskqueue.run_batch(task_type, batch)
+        self.assertEqual([message.to for message in mail.outbox], [['bench-service-0@example.com']])
+        statuses = dict(Task.objects.values_list('payload__complaint_id', 'status'))
+        self.assertEqual(statuses, {self.complaints[0].pk: Task.DONE, self.complaints[1].pk: Task.PENDING})
+        self.assertIn('SMTP недоступен', Task.objects.get(status=Task.PENDING).last_error)
+
+
+class AttachmentStorageTests(TestCase):
+    """Файлы вложений по хэшу содержимого: одно имя на содержимое, удаление только без ссылок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_fleet(machines=1, events_per_machine=2, clients=1, service_companies=1)
+        cls.complaint = Complaint.objects.first()
+        cls.user = CustomUser.objects.get(username='bench-service-0')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(MEDIA_ROOT=directory.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.root = Path(directory.name)
+
+    def upload(self, content=b'%PDF-1.4 act'):
+        uploaded = SimpleUploadedFile('act.pdf', content, 'application/pdf')
+        uploaded.sha256 = hashlib.sha256(content).hexdigest()
+        return store_attachment(uploaded, self.user, complaint=self.complaint)
+
+    def test_same_content_is_written_under_one_name(self):
+        first, second = self.upload(), self.upload()
+        self.assertEqual(first.file.name, second.file.name)
+        # Повторная запись того же пути (как при одновременной загрузке) заменяет файл, а не создает <sha>_XXXX
+        save_content_addressed(first.file.name, SimpleUploadedFile('act.pdf', b'%PDF-1.4 act'))
+        files = [path.name for path in self.root.rglob('*') if path.is_file()]
+        self.assertEqual(files, [first.sha256])
+
+    def test_file_is_deleted_with_last_reference(self):
+        first, second = self.upload(), self.upload()
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(second.file.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(second.file.name))
+        self.assertFalse(Attachment.objects.exists())
+
+
+class ArchiveTierTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_fleet(machines=3, events_per_machine=2, clients=1, service_companies=1)
+        cls.manager = CustomUser.objects.create(username='archive-manager', role=CustomUser.MANAGER)
+
+    def test_open_ended_range_reaches_archive(self):
+        cutoff = archive.get_archive_cutoff()
+        self.assertTrue(archive.reaches_archive(Maintenance, {'event_date_before': '2030-01-01'}))
+        self.assertTrue(archive.reaches_archive(Complaint, {'recovery_date_before': '2030-01-01'}))
+        self.assertTrue(archive.reaches_archive(Maintenance, {'event_date_after': str(cutoff - timedelta(days=1))}))
+        self.assertFalse(archive.reaches_archive(Maintenance, {'event_date_after': str(cutoff)}))
+        self.assertFalse(archive.reaches_archive(Maintenance, {}))
+
+    def test_duplicate_of_archived_maintenance_is_rejected(self):
+        maintenance = Maintenance.objects.first()
+        while archive.archive_batch(Maintenance, date(2100, 1, 1)):
+            pass
+        self.assertTrue(ArchivedMaintenance.objects.filter(pk=maintenance.pk).exists())
+        self.client.force_login(self.manager)
+        response = self.client.post('/api/maintenances/', {
+            'machine': maintenance.machine_id, 'service_type': maintenance.service_type_id,
+            'event_date': str(maintenance.event_date), 'operating_hours': 10, 'order_number': 'N-1',
+            'order_date': str(maintenance.event_date), 'service_company': maintenance.service_company_id,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertEqual(response.json(), {'non_field_errors': [DUPLICATE_MAINTENANCE_MESSAGE]})
+        self.assertFalse(Maintenance.objects.exists())
+
+
+class ApiScopeTests(TestCase):
+    """API пишет и читает только в области видимости: своя техника, техника подразделений организации."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_fleet(machines=12, events_per_machine=2, clients=3, service_companies=2)
+        cls.clients = list(CustomUser.objects.filter(role=CustomUser.CLIENT).order_by('username'))
+        cls.services = list(CustomUser.objects.filter(role=CustomUser.SERVICE).order_by('username'))
+        holding = Organization.objects.create(name='Холдинг', kind=CustomUser.CLIENT)
+        subsidiary = Organization.objects.create(name='Дочернее общество', kind=CustomUser.CLIENT, parent=holding)
+        cls.clients[0].organization = holding
+        cls.clients[0].save()
+        cls.clients[1].organization = subsidiary
+        cls.clients[1].save()
+
+    def setUp(self):
+        # Строки пользователей в кэше процесса переживают откат транзакции предыдущего теста
+        caches['default'].clear()
+
+    def machine_of(self, **owner):
+        return Machine.objects.filter(**owner).first()
+
+    def maintenance_data(self, machine, service_company):
+        maintenance = Maintenance.objects.first()
+        return {
+            'machine': machine.pk, 'service_type': maintenance.service_type_id, 'event_date': '2031-05-01',
+            'operating_hours': 10, 'order_number': 'N-1', 'order_date': '2031-05-01',
+            'service_company': service_company.pk,
+        }
+
+    def post(self, user, url, data):
+        self.client.force_login(user)
+        return self.client.post(url, data, content_type='application/json')
+
+    def test_client_cannot_write_maintenance_for_foreign_machine(self):
+        outsider = self.clients[2]
+        foreign = self.machine_of(client=self.clients[0])
+        response = self.post(outsider, '/api/maintenances/', self.maintenance_data(foreign, outsider))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('machine', response.json())
+        own = self.machine_of(client=outsider)
+        self.assertEqual(self.post(outsider, '/api/maintenances/', self.maintenance_data(own, outsider)).status_code, 201)
+
+    def test_service_company_cannot_name_other_company(self):
+        service = self.services[0]
+        machine = self.machine_of(service_company=service)
+        response = self.post(service, '/api/maintenances/', self.maintenance_data(machine, self.services[1]))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('service_company', response.json())
+
+    def test_complaint_creation_requires_role(self):
+        complaint = Complaint.objects.first()
+        data = {
+            'machine': None, 'failure_date': '2031-05-01', 'operating_hours': 10,
+            'failure_node': complaint.failure_node_id, 'failure_description': 'Течь',
+            'recovery_method': complaint.recovery_method_id, 'spare_parts': '', 'recovery_date': '2031-05-03',
+            'service_company': None,
+        }
+        client = self.clients[2]
+        machine = self.machine_of(client=client)
+        data.update(machine=machine.pk, service_company=machine.service_company_id)
+        self.assertEqual(self.post(client, '/api/complaints/', data).status_code, 403)
+
+        service = self.services[0]
+        foreign = Machine.objects.exclude(service_company=service).first()
+        data.update(machine=foreign.pk, service_company=service.pk)
+        self.assertEqual(self.post(service, '/api/complaints/', data).status_code, 400)
+        own = self.machine_of(service_company=service)
+        data.update(machine=own.pk)
+        self.assertEqual(self.post(service, '/api/complaints/', data).status_code, 201)
+
+    def test_holding_sees_subsidiary_machines(self):
+        holding_user, subsidiary_user = self.clients[0], self.clients[1]
+
+        def listed(user):
+            self.client.force_login(user)
+            return {row['id'] for row in self.client.get('/api/machines/').json()}
+
+        own = set(Machine.objects.filter(client=holding_user).values_list('pk', flat=True))
+        subsidiary = set(Machine.objects.filter(client=subsidiary_user).values_list('pk', flat=True))
+        self.assertTrue(own and subsidiary)
+        self.assertEqual(listed(holding_user), own | subsidiary)
+        # Подразделение не видит технику головной организации
+        self.assertEqual(listed(subsidiary_user), subsidiary)
+        # И не пишет по ней
+        machine = self.machine_of(client=holding_user)
+        response = self.post(subsidiary_user, '/api/maintenances/', self.maintenance_data(machine, subsidiary_user))
+        self.assertEqual(response.status_code, 400)
+        machine = self.machine_of(client=subsidiary_user)
+        response = self.post(holding_user, '/api/maintenances/', self.maintenance_data(machine, holding_user))
+        self.assertEqual(response.status_code, 201)
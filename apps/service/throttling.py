@@ -0,0 +1,174 @@
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+
+LIST, DETAIL, WRITE = 'list', 'detail', 'write'
+# Строки полных корзин удаляются не чаще раза в столько секунд на процесс
+CLEANUP_INTERVAL = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL,
+                                   full_at REAL NOT NULL) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS bucket_full_at_idx ON bucket (full_at);
+"""
+# Остаток после пополнения с момента последнего списания и он же после списания cost
+REFILLED = 'MIN(:capacity, tokens + MAX(:now - updated, 0) * :rate)'
+SPENT = f'{REFILLED} - :cost'
+# Одна инструкция на чтение и запись: параллельные запросы списывают токены по очереди
+UPSERT = f"""
+INSERT INTO bucket (key, tokens, updated, full_at) VALUES (:key, :capacity - :cost, :now, :now + :cost / :rate)
+ON CONFLICT (key) DO UPDATE SET
+    tokens = {SPENT}, updated = :now, full_at = :now + (:capacity - ({SPENT})) / :rate
+"""
+TAKE = UPSERT + f' WHERE {REFILLED} >= :cost RETURNING tokens'
+CHARGE = UPSERT + ' RETURNING tokens'
+
+_local = threading.local()
+_cleaned_at = 0
+
+
+def get_connection():
+    """
+    Соединение потока с файлом корзин API_THROTTLE_DB. Отдельный от основной базы файл SQLite общий
+    для всех воркеров сервера, а запись в него не ждет блокировки записи основной базы.
+    """
+    path = str(settings.API_THROTTLE_DB)
+    key = (os.getpid(), path)  # после fork соединение мастера не используется
+    if getattr(_local, 'key', None) != key:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        connection.executescript('PRAGMA journal_mode = WAL; PRAGMA synchronous = OFF;' + SCHEMA)
+        _local.key, _local.connection = key, connection
+    return _local.connection
+
+
+def cleanup(connection, now):
+    """Удаляет корзины, которые уже пополнились: полная корзина ничем не отличается от отсутствующей."""
+    global _cleaned_at
+    if now - _cleaned_at >= CLEANUP_INTERVAL:
+        _cleaned_at = now
+        connection.execute('DELETE FROM bucket WHERE full_at < ?', (now,))
+
+
+class Bucket:
+    """
+    Корзина токенов в файле API_THROTTLE_DB: (токенов, время пересчета). Токены пополняются
+    со скоростью rate до capacity; остаток может уйти в минус, если ответ оказался дороже (см. charge).
+
+    Пополнение, проверка и списание выполняются одной инструкцией UPSERT, поэтому одновременные
+    запросы в разных воркерах не получают больше бюджета, чем в нем есть.
+    """
+
+    def __init__(self, key, capacity, rate):
+        self.key = key
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+
+    def execute(self, sql, cost, now):
+        params = {'key': self.key, 'capacity': self.capacity, 'rate': float(self.rate), 'cost': cost, 'now': now}
+        connection = get_connection()
+        cleanup(connection, now)
+        return connection.execute(sql, params).fetchone()
+
+    def take(self, cost, now=None):
+        """Списывает cost токенов, если набрался хотя бы cost; возвращает успех."""
+        now = time.time() if now is None else now
+        row = self.execute(TAKE, cost, now)
+        if row is not None:
+            self.tokens = row[0]
+            return True
+        # Отказ ничего не записывает; остаток нужен только для заголовков и Retry-After
+        row = get_connection().execute('SELECT tokens, updated FROM bucket WHERE key = ?', (self.key,)).fetchone()
+        tokens, updated = row or (self.capacity, now)
+        self.tokens = min(self.capacity, tokens + max(now - updated, 0) * self.rate)
+        return False
+
+    def charge(self, cost, now=None):
+        """Доплата после ответа: списывается без проверки остатка."""
+        now = time.time() if now is None else now
+        self.tokens = self.execute(CHARGE, cost, now)[0]
+
+    def wait(self, cost=1):
+        """Секунд до того, как наберется cost токенов."""
+        return max(math.ceil((cost - self.tokens) / self.rate), 1)
+
+    def headers(self):
+        return {
+            'X-RateLimit-Limit': str(self.capacity),
+            'X-RateLimit-Remaining': str(max(math.floor(self.tokens), 0)),
+            'X-RateLimit-Reset': str(max(math.ceil((self.capacity - self.tokens) / self.rate), 0)),
+        }
+
+
+def get_budget_scope(request, view):
+    if request.method not in SAFE_METHODS:
+        return WRITE
+    if getattr(view, 'action', None) == 'list' or getattr(view, 'detail', None) is False:
+        return LIST
+    return DETAIL
+
+
+def get_response_rows(response):
+    data = getattr(response, 'data', None)
+    if isinstance(data, dict):
+        data = data.get('results')
+    return len(data) if isinstance(data, list) else 0
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Ограничение частоты запросов API корзиной токенов (API_THROTTLE_BUDGETS): отдельные бюджеты
+    списков, карточек и изменений для каждого токена, пользователя или IP анонима.
+
+    Запрос стоит один токен; списки доплачивают по числу строк ответа (RateLimitMiddleware),
+    поэтому выгрузка всего парка расходует бюджет быстрее, чем карточки.
+    """
+
+    def get_ident_key(self, request):
+        if request.auth is not None:
+            # Токен интеграции считается отдельно от сессий того же пользователя
+            return 'token:' + hashlib.sha256(str(request.auth).encode()).hexdigest()[:32]
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        self.scope = get_budget_scope(request, view)
+        budget = settings.API_THROTTLE_BUDGETS[self.scope]
+        self.bucket = Bucket(f'throttle:{self.scope}:{self.get_ident_key(request)}', budget['capacity'], budget['rate'])
+        allowed = self.bucket.take(1)
+        # Заголовки и доплату за строки добавляет RateLimitMiddleware
+        request._request.rate_limit_bucket = self.bucket
+        request._request.rate_limit_scope = self.scope
+        if not allowed:
+            metrics.incr(f'api_throttle.throttled.{self.scope}')
+        return allowed
+
+    def wait(self):
+        return self.bucket.wait()
+
+
+def finish_request(request, response):
+    """Доплата за строки ответа списка и заголовки X-RateLimit-*; вызывается после ответа представления."""
+    bucket = getattr(request, 'rate_limit_bucket', None)
+    if bucket is None:
+        return response
+    if request.rate_limit_scope == LIST and response.status_code == 200:
+        extra = get_response_rows(response) // settings.API_THROTTLE_ROWS_PER_TOKEN
+        if extra:
+            bucket.charge(extra)
+            metrics.incr('api_throttle.extra_cost', extra)
+    for name, value in bucket.headers().items():
+        response[name] = value
+    return response
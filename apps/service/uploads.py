@@ -0,0 +1,153 @@
+import hashlib
+import io
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.move import file_move_safe
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.db import transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import Attachment, attachment_path
+
+# Картинки, которые можно показывать в браузере как есть; остальное отдается на скачивание
+INLINE_CONTENT_TYPES = {'image/jpeg', 'image/png', 'image/webp', 'image/gif'}
+
+
+class Sha256FileUploadHandler(FileUploadHandler):
+    """
+    Пишет загружаемый файл во временный файл на диске кусками и по ходу считает SHA-256.
+
+    Память на загрузку ограничена размером куска независимо от размера файла;
+    файлы больше ATTACHMENT_MAX_SIZE и с неразрешенным расширением пропускаются
+    (их имена - в rejected).
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.rejected = []
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        # При SkipFile парсер закрывает handler.file - это не должен быть уже принятый предыдущий файл
+        self.file = ContentFile(b'')
+        extension = os.path.splitext(self.file_name or '')[1].lower()
+        if extension not in settings.ATTACHMENT_EXTENSIONS:
+            self.rejected.append((self.file_name, 'type'))
+            raise SkipFile
+        self.file = TemporaryUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+        self.hash = hashlib.sha256()
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.ATTACHMENT_MAX_SIZE:
+            self.file.close()
+            self.rejected.append((self.file_name, 'size'))
+            raise SkipFile
+        self.hash.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.hash.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
+
+
+def save_content_addressed(path, content):
+    """
+    Записывает файл по пути из attachment_path: во временный файл рядом и os.replace на место.
+    Одновременная запись того же содержимого не порождает имен с суффиксом (<sha>_XXXX),
+    а читатели не видят недописанный файл. Временный файл загрузки перемещается без повторного чтения.
+    """
+    target = Path(default_storage.path(path))
+    target.parent.mkdir(parents=True, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=target.parent, prefix='.upload-')
+    try:
+        if hasattr(content, 'temporary_file_path'):
+            os.close(descriptor)
+            file_move_safe(content.temporary_file_path(), temporary, allow_overwrite=True)
+        else:
+            with os.fdopen(descriptor, 'wb') as output:
+                for chunk in content.chunks():
+                    output.write(chunk)
+        if default_storage.file_permissions_mode is not None:
+            os.chmod(temporary, default_storage.file_permissions_mode)
+        os.replace(temporary, target)
+    except BaseException:
+        Path(temporary).unlink(missing_ok=True)
+        raise
+    return path
+
+
+def store_attachment(uploaded, user, **owner):
+    """
+    Сохраняет загруженный файл (из Sha256FileUploadHandler) по хэшу содержимого.
+
+    Если такой файл уже есть в хранилище, создается только запись Attachment;
+    иначе временный файл перемещается в хранилище. Проверка файла и запись идут в одной транзакции
+    с delete_unreferenced_files (BEGIN IMMEDIATE сериализует их): удаление не может
+    убрать файл между проверкой и созданием записи.
+    """
+    path = attachment_path(uploaded.sha256)
+    with transaction.atomic():
+        if not default_storage.exists(path):
+            save_content_addressed(path, uploaded)
+        existing = Attachment.objects.filter(sha256=uploaded.sha256).exclude(preview_status=Attachment.PREVIEW_PENDING)
+        return Attachment.objects.create(
+            file=path,
+            sha256=uploaded.sha256,
+            original_name=os.path.basename(uploaded.name)[:255],
+            content_type=(uploaded.content_type or '')[:100],
+            size=uploaded.size,
+            # Миниатюры общие для одинакового содержимого: повторно их строить не нужно
+            preview_status=existing.values_list('preview_status', flat=True).first() or Attachment.PREVIEW_PENDING,
+            uploaded_by=user,
+            **owner,
+        )
+
+
+def build_previews(sha256, name):
+    """Строит превью и миниатюру JPEG; возвращает новый preview_status для записей с этим хэшем."""
+    sizes = (('preview', settings.ATTACHMENT_PREVIEW_SIZE), ('thumb', settings.ATTACHMENT_THUMBNAIL_SIZE))
+    try:
+        with default_storage.open(name) as source:
+            image = Image.open(source)
+            # JPEG декодируется сразу в уменьшенном масштабе: память не зависит от разрешения снимка
+            image.draft('RGB', (sizes[0][1], sizes[0][1]))
+            image = ImageOps.exif_transpose(image).convert('RGB')
+            for variant, size in sizes:
+                image.thumbnail((size, size), Image.LANCZOS)
+                output = io.BytesIO()
+                image.save(output, 'JPEG', quality=82, optimize=True, progressive=True)
+                save_content_addressed(attachment_path(sha256, variant), ContentFile(output.getvalue()))
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError):
+        return Attachment.PREVIEW_NONE
+    return Attachment.PREVIEW_READY
+
+
+def delete_unreferenced_files(sha256, name=None):
+    """
+    Удаляет файлы содержимого, на которое не осталось ссылок. Проверка ссылок и удаление - в одной
+    транзакции, как и store_attachment: новая загрузка того же файла ждет или видит запись.
+    name - файл удаленной записи, если он сохранен не по attachment_path (имя с суффиксом).
+    """
+    with transaction.atomic():
+        if Attachment.objects.filter(sha256=sha256).exists():
+            return
+        paths = [attachment_path(sha256, variant) for variant in ('original', 'preview', 'thumb')]
+        if name and name not in paths and not Attachment.objects.filter(file=name).exists():
+            paths.append(name)
+        for path in paths:
+            if default_storage.exists(path):
+                default_storage.delete(path)
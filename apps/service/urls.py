@@ -2,12 +2,20 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (
+    AttachmentDeleteView,
+    AttachmentFileView,
+    AttachmentUploadView,
+    CatalogAutocompleteView,
     ComplaintCreateView,
     ComplaintDeleteView,
     ComplaintDetailView,
     ComplaintUpdateView,
     ComplaintViewSet,
+    DataPackView,
+    FacetCountsView,
     IndexView,
+    LiveEventsView,
+    MachineAutocompleteView,
     MachineCreateView,
     MachineDetailView,
     MachineViewSet,
@@ -16,12 +24,17 @@ from .views import (
     MaintenanceDetailView,
     MaintenanceUpdateView,
     MaintenanceViewSet,
+    MetricsView,
+    SlaLeaderboardView,
+    SparePartDemandViewSet,
+    UserAutocompleteView,
 )
 
 router = DefaultRouter()
 router.register(r'machines', MachineViewSet)
 router.register(r'maintenances', MaintenanceViewSet)
 router.register(r'complaints', ComplaintViewSet)
+router.register(r'spare-parts/demand', SparePartDemandViewSet, basename='spare-part-demand')
 
 urlpatterns = [
     path('', IndexView.as_view(), name='index'),
@@ -35,5 +48,21 @@ urlpatterns = [
     path('complaint/<int:pk>/', ComplaintDetailView.as_view(), name='complaint_detail'),
     path('complaint/<int:pk>/update/', ComplaintUpdateView.as_view(), name='complaint_update'),
     path('complaint/<int:pk>/delete/', ComplaintDeleteView.as_view(), name='complaint_delete'),
+    path(
+        'maintenance/<int:pk>/attachments/',
+        AttachmentUploadView.as_view(owner='maintenance'),
+        name='maintenance_attachments',
+    ),
+    path('complaint/<int:pk>/attachments/', AttachmentUploadView.as_view(owner='complaint'), name='complaint_attachments'),
+    path('attachments/<int:pk>/delete/', AttachmentDeleteView.as_view(), name='attachment_delete'),
+    path('attachments/<int:pk>/<slug:variant>/', AttachmentFileView.as_view(), name='attachment_file'),
+    path('autocomplete/machines/', MachineAutocompleteView.as_view(), name='autocomplete_machines'),
+    path('autocomplete/users/<slug:scope>/', UserAutocompleteView.as_view(), name='autocomplete_users'),
+    path('autocomplete/catalog/<slug:catalog>/', CatalogAutocompleteView.as_view(), name='autocomplete_catalog'),
+    path('facets/', FacetCountsView.as_view(), name='facet_counts'),
+    path('live/', LiveEventsView.as_view(), name='live_events'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('sla/', SlaLeaderboardView.as_view(), name='sla_leaderboard'),
+    path('api/datapack/', DataPackView.as_view(), name='data_pack'),
     path('api/', include(router.urls)),
 ]
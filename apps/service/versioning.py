@@ -0,0 +1,64 @@
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import DataVersion
+
+MACHINE = 'machine'
+MAINTENANCE = 'maintenance'
+COMPLAINT = 'complaint'
+CATALOG = 'catalog'
+USER = 'user'
+ATTACHMENT = 'attachment'
+SLA = 'sla'
+SPARE_PARTS = 'spare_parts'
+
+LABELS = (MACHINE, MAINTENANCE, COMPLAINT, CATALOG, USER, ATTACHMENT, SLA, SPARE_PARTS)
+
+
+def bump_data_version(*labels, using='default'):
+    """
+    Увеличивает версии после фиксации текущей транзакции.
+
+    При откате транзакции версии не меняются, а сам UPDATE короткий и не
+    удерживает блокировку строки на время основной записи.
+    """
+    transaction.on_commit(lambda: _bump(labels, using), using=using)
+
+
+def _bump(labels, using):
+    # Одна инструкция и для первой записи метки: параллельные первые увеличения дают 1 и 2, а не 1 и 1
+    connection = connections[using]
+    table = connection.ops.quote_name(DataVersion._meta.db_table)
+    labels = list(dict.fromkeys(labels))
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (label, version, updated_at) VALUES {', '.join(['(%s, 1, %s)'] * len(labels))} "
+            f"ON CONFLICT (label) DO UPDATE SET version = {table}.version + 1, updated_at = excluded.updated_at",
+            [value for label in labels for value in (label, now)],
+        )
+
+
+def get_data_versions(*labels):
+    """Текущие версии одним запросом: {label: version}."""
+    return get_data_version_state(*labels)[0]
+
+
+def get_data_version_state(*labels):
+    """Версии и время последнего изменения любой из них (None, если записей еще не было) одним запросом."""
+    versions = dict.fromkeys(labels, 0)
+    last_modified = None
+    rows = DataVersion.objects.filter(label__in=labels).values_list('label', 'version', 'updated_at')
+    for label, version, updated_at in rows:
+        versions[label] = version
+        if last_modified is None or updated_at > last_modified:
+            last_modified = updated_at
+    return versions, last_modified
+
+
+def format_version_key(versions, labels):
+    return '.'.join(f'{label}{versions.get(label, 0)}' for label in labels)
+
+
+def get_version_key(*labels):
+    return format_version_key(get_data_versions(*labels), labels)
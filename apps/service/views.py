@@ -1,62 +1,454 @@
+import os
+from functools import partial
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
 from django.core.paginator import Paginator
-from django.http import HttpResponseForbidden
-from django.shortcuts import render
-from django.urls import reverse_lazy
-from django.views.generic import CreateView, DeleteView, DetailView, ListView, UpdateView
+from django.db import transaction
+from django.db.models import Q
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse, reverse_lazy
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.decorators import method_decorator
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import parse_etags
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.generic import CreateView, DeleteView, DetailView, ListView, TemplateView, UpdateView
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from apps.users.models import CustomUser
 
+from . import datapack, live, metrics, sla, spareparts, versioning
+from .conditional import conditional_get
+from .facets import get_facet_counts, get_filter_query
+from .forecast import get_utilization_percentiles, with_projected_hours
+from .filters import ComplaintFilter, MachineFilter, MaintenanceFilter, filter_param_names
 from .forms import ComplaintForm, MachineForm, MaintenanceForm
-from .mixins import RoleBasedAccessMixin
+from .mixins import (
+    ArchiveFallbackMixin,
+    ArchiveTierViewSetMixin,
+    ConditionalGetMixin,
+    ConditionalGetViewSetMixin,
+    ConstraintErrorMixin,
+    ConstraintErrorViewSetMixin,
+    RoleBasedAccessMixin,
+)
 from .models import (
     Complaint,
     DriveAxleModel,
     EngineModel,
     FailureNode,
     Machine,
+    MachineReassignment,
     Maintenance,
     RecoveryMethod,
     ServiceType,
+    SlaAlert,
+    SparePartDemand,
     SteeringAxleModel,
     TechniqueModel,
     TransmissionModel,
+    UsageForecast,
 )
-from .serializers import ComplaintSerializer, MachineSerializer, MaintenanceSerializer
+from .scope import get_role_scope
+from .serializers import ComplaintSerializer, MachineReassignSerializer, MachineSerializer, MaintenanceSerializer
 from .services import (
+    CATALOG_MODELS,
+    USER_SCOPES,
+    filter_serial_prefix,
+    get_archived_complaints_in_scope,
+    get_archived_maintenances_in_scope,
+    get_attachments_in_scope,
+    get_complaints_in_scope,
     get_filtered_complaints,
     get_filtered_machines,
     get_filtered_maintenances,
     get_machines_for_filter,
+    get_machines_for_form,
+    get_machines_in_scope,
+    get_maintenances_in_scope,
     get_service_companies_for_filter,
+    paginate_autocomplete,
+    parse_id_list,
+    validate_id,
 )
+from .reassignment import find_machines_by_serial, is_narrowed, reassign_machines
+from .servicebook import SERVICE_BOOK_LABELS, get_service_books
+from .uploads import INLINE_CONTENT_TYPES, Sha256FileUploadHandler, store_attachment
 
 
-class MachineViewSet(viewsets.ModelViewSet):
+class MachineViewSet(ConditionalGetViewSetMixin, ConstraintErrorViewSetMixin, viewsets.ModelViewSet):
     queryset = Machine.objects.all()
     serializer_class = MachineSerializer
     permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = MachineFilter
+    version_labels = (versioning.MACHINE, versioning.CATALOG, versioning.USER)
 
-
-class MaintenanceViewSet(viewsets.ModelViewSet):
+    def get_queryset(self):
+        return get_machines_in_scope(self.request.user)
+
+    def perform_create(self, serializer):
+        if not get_role_scope(self.request.user).is_manager:
+            raise PermissionDenied('У вас нет прав для добавления машин.')
+        super().perform_create(serializer)
+
+    @action(detail=True, url_path='service-book')
+    def service_book(self, request, pk=None):
+        """Сервисная книжка машины: справочники, все ТО и рекламации одним ответом."""
+        return conditional_get(request, SERVICE_BOOK_LABELS, partial(self.get_service_book, pk))
+
+    def get_service_book(self, pk):
+        books = get_service_books(self.get_queryset().filter(pk=validate_id(pk)))
+        if not books:
+            raise Http404
+        return Response(books[0])
+
+    @action(detail=False, url_path='service-book')
+    def service_books(self, request):
+        """Книжки нескольких машин: ?serial_number=A,B (для сверки парка у дилера), не больше SERVICE_BOOK_BATCH_LIMIT."""
+        return conditional_get(request, SERVICE_BOOK_LABELS, self.get_service_books)
+
+    def get_service_books(self):
+        serials = list(dict.fromkeys(
+            serial.strip()
+            for value in self.request.query_params.getlist('serial_number')
+            for serial in value.split(',') if serial.strip()
+        ))
+        if not serials:
+            raise ValidationError({'serial_number': ['Укажите заводские номера через запятую.']})
+        if len(serials) > settings.SERVICE_BOOK_BATCH_LIMIT:
+            raise ValidationError({'serial_number': [
+                f'Не больше {settings.SERVICE_BOOK_BATCH_LIMIT} заводских номеров в одном запросе.'
+            ]})
+        books = {book['serial_number']: book for book in get_service_books(
+            self.get_queryset().filter(serial_number__in=serials)
+        )}
+        return Response({
+            'results': [books[serial] for serial in serials if serial in books],
+            # Машины вне области видимости не отличаются от отсутствующих
+            'not_found': [serial for serial in serials if serial not in books],
+        })
+
+    @action(detail=True, url_path='usage-forecast')
+    def usage_forecast(self, request, pk=None):
+        """Темп наработки машины и прогноз наработки на ?date=ГГГГ-ММ-ДД (по умолчанию - сегодня)."""
+        day = self.get_forecast_date()
+        machine = get_object_or_404(
+            with_projected_hours(self.get_queryset(), day).select_related('usage_forecast'),
+            pk=validate_id(pk), usage_forecast__isnull=False,
+        )
+        forecast = machine.usage_forecast
+        return Response({
+            'machine': machine.pk,
+            'rate': round(forecast.rate, 2),
+            'readings': forecast.readings,
+            'last_reading_date': forecast.last_reading_date,
+            'last_reading_hours': forecast.last_reading_hours,
+            'date': day,
+            'projected_hours': machine.projected_hours,
+            'fitted_at': forecast.fitted_at,
+        })
+
+    def get_forecast_date(self):
+        value = self.request.query_params.get('date')
+        if not value:
+            return timezone.localdate()
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise ValidationError({'date': ['Укажите дату в формате ГГГГ-ММ-ДД.']})
+        return day
+
+    @action(detail=False)
+    def utilization(self, request):
+        """Перцентили темпа наработки (м/час в день) по моделям техники среди машин пользователя."""
+        forecasts = UsageForecast.objects.filter(machine__in=self.filter_queryset(self.get_queryset()))
+        return Response({'results': get_utilization_percentiles(forecasts)})
+
+    @action(detail=False, methods=['post'])
+    def reassign(self, request):
+        """
+        Передача машин новому клиенту и/или сервисной компании (только менеджерам): машины выбираются
+        по serial_numbers в теле или по фильтрам списка в строке запроса (?service_company=5).
+        """
+        if not get_role_scope(request.user).is_manager:
+            raise PermissionDenied('Передавать машины могут только менеджеры.')
+        serializer = MachineReassignSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        base = self.get_queryset()
+        queryset = self.filter_queryset(base)
+        not_found = []
+        if data.get('serial_numbers'):
+            machine_ids, not_found = find_machines_by_serial(queryset, data['serial_numbers'])
+        elif any(request.query_params.get(name) for name in filter_param_names(MachineFilter)) and is_narrowed(
+            queryset, base
+        ):
+            machine_ids = list(queryset.values_list('pk', flat=True))
+        else:
+            # Без условий передался бы весь парк
+            raise ValidationError({'serial_numbers': ['Укажите заводские номера или фильтр машин.']})
+        operation, moved, batches = reassign_machines(
+            machine_ids, client=data.get('client'), service_company=data.get('service_company'),
+            user=request.user, source=MachineReassignment.API,
+        )
+        return Response({
+            'operation': operation,
+            'machines': moved,
+            'batches': batches,
+            'not_found': not_found,
+        })
+
+
+class MaintenanceViewSet(
+    ConditionalGetViewSetMixin, ConstraintErrorViewSetMixin, ArchiveTierViewSetMixin, viewsets.ModelViewSet
+):
     queryset = Maintenance.objects.all()
     serializer_class = MaintenanceSerializer
     permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = MaintenanceFilter
+    filtered_queryset = staticmethod(get_filtered_maintenances)
+    version_labels = (versioning.MAINTENANCE, versioning.MACHINE, versioning.CATALOG, versioning.USER)
 
+    def get_queryset(self):
+        return get_maintenances_in_scope(self.request.user)
 
-class ComplaintViewSet(viewsets.ModelViewSet):
+
+class ComplaintViewSet(
+    ConditionalGetViewSetMixin, ConstraintErrorViewSetMixin, ArchiveTierViewSetMixin, viewsets.ModelViewSet
+):
     queryset = Complaint.objects.all()
     serializer_class = ComplaintSerializer
     permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = ComplaintFilter
+    filtered_queryset = staticmethod(get_filtered_complaints)
+    version_labels = (versioning.COMPLAINT, versioning.MACHINE, versioning.CATALOG, versioning.USER)
+
+    def get_queryset(self):
+        return get_complaints_in_scope(self.request.user)
+
+    def perform_create(self, serializer):
+        if not get_role_scope(self.request.user).can_create_complaints:
+            raise PermissionDenied('У вас нет прав для создания рекламаций.')
+        super().perform_create(serializer)
+
+
+class SparePartDemandViewSet(viewsets.ViewSet):
+    """
+    Расход запчастей по готовым месячным строкам SparePartDemand.
+
+    ?group_by=period,part,failure_node,technique_model,service_company (по умолчанию period,part),
+    ?period=month|quarter|year, ?date_after/?date_before=ГГГГ-ММ-ДД и фильтры по id
+    ?part=, ?failure_node=, ?technique_model=, ?service_company= (через запятую).
+    Сервисной компании доступен только свой расход.
+    """
+    permission_classes = [IsAuthenticated]
+    version_labels = (versioning.SPARE_PARTS, versioning.CATALOG, versioning.USER)
+
+    def list(self, request):
+        return conditional_get(request, self.version_labels, self.get_demand)
+
+    def get_demand(self):
+        params = self.request.query_params
+        scope = get_role_scope(self.request.user)
+        if scope.kind not in (scope.ALL, scope.SERVICE):
+            raise PermissionDenied('Расход запчастей доступен менеджерам и сервисным компаниям.')
+        group_by = [item.strip() for item in params.get('group_by', 'period,part').split(',') if item.strip()]
+        unknown = set(group_by) - {'period', *spareparts.DEMAND_DIMENSIONS}
+        if unknown:
+            raise ValidationError({'group_by': [f'Неизвестные измерения: {", ".join(sorted(unknown))}.']})
+        period = params.get('period', 'month')
+        if period not in spareparts.PERIODS:
+            raise ValidationError({'period': ['Допустимые значения: month, quarter, year.']})
+
+        rows = SparePartDemand.objects.all()
+        if scope.kind == scope.SERVICE:
+            rows = rows.filter(scope.owner_condition('service_company'))
+        for name, lookup in (('date_after', 'month__gte'), ('date_before', 'month__lte')):
+            if params.get(name):
+                try:
+                    day = parse_date(params[name])
+                except ValueError:
+                    day = None
+                if day is None:
+                    raise ValidationError({name: ['Укажите дату в формате ГГГГ-ММ-ДД.']})
+                # Строки хранятся по первому числу месяца
+                rows = rows.filter(**{lookup: day.replace(day=1)})
+        for dimension in spareparts.DEMAND_DIMENSIONS:
+            if params.get(dimension):
+                rows = rows.filter(**{f'{dimension}__in': parse_id_list(params[dimension])})
+        return Response({'results': spareparts.get_demand(rows, group_by, period)})
+
+
+class DataPackView(APIView):
+    """
+    Пакет данных для работы без связи (datapack.py): gzip-файл SQLite с машинами, ТО и рекламациями
+    (включая архив) области видимости пользователя и справочниками.
+
+    Пакет собирается в фоне: пока первого нет - 202 с Retry-After; устаревший отдается сразу
+    с заголовком X-Data-Pack-Stale, пересборка ставится в очередь. Если область видимости сузилась
+    (машины переданы, организация перенесена), до пересборки - тоже 202. If-None-Match - 304,
+    Range (один диапазон) с If-Range - докачка прерванной загрузки.
+    """
+    permission_classes = [IsAuthenticated]
+    retry_after = 30
+    download_name = 'silant-datapack.sqlite3.gz'
+
+    def get(self, request):
+        scope = get_role_scope(request.user)
+        if scope.kind in (scope.NONE, scope.ANONYMOUS):
+            raise PermissionDenied('Пакет данных доступен клиентам, сервисным компаниям и менеджерам.')
+        pack = datapack.request_pack(request.user)
+        ready = datapack.is_ready(pack)
+        stale = datapack.is_stale(pack)
+        if stale or not ready:
+            datapack.enqueue_build(pack.scope_key)
+        if not ready or datapack.is_shrunk(pack):
+            # После сужения области в прежнем файле есть данные, которые пользователю больше не видны
+            return self.get_pending_response()
+
+        etag = datapack.get_etag(pack)
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = HttpResponse(status=304)
+        else:
+            try:
+                file = open(datapack.get_path(pack.file_name), 'rb')
+            except FileNotFoundError:
+                # Пересборка успела заменить файл после чтения записи о пакете
+                return self.get_pending_response()
+            response = self.get_file_response(request, file, etag)
+        response['ETag'] = etag
+        response['Accept-Ranges'] = 'bytes'
+        response['Cache-Control'] = 'private, no-cache'
+        if stale:
+            response['X-Data-Pack-Stale'] = '1'
+        return response
+
+    def get_pending_response(self):
+        response = Response({'detail': 'Пакет данных собирается, повторите запрос позже.'}, status=202)
+        response['Retry-After'] = str(self.retry_after)
+        return response
+
+    def get_file_response(self, request, file, etag):
+        size = os.fstat(file.fileno()).st_size
+        # Диапазон из прерванной загрузки другой версии пакета не подходит: Range не учитывается, отдается весь файл
+        if_range = request.META.get('HTTP_IF_RANGE')
+        try:
+            byte_range = None if if_range is not None and if_range != etag else datapack.parse_range(
+                request.META.get('HTTP_RANGE'), size
+            )
+        except ValueError:
+            file.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range is None:
+            return FileResponse(file, content_type='application/gzip', as_attachment=True, filename=self.download_name)
+        start, end = byte_range
+        response = StreamingHttpResponse(datapack.read_range(file, start, end - start + 1),
+                                         status=206, content_type='application/gzip')
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Disposition'] = f'attachment; filename="{self.download_name}"'
+        return response
+
+
+class AutocompleteView(LoginRequiredMixin, View):
+    """Постраничный JSON для виджета AutocompleteSelect: {"results": [{"id", "text"}], "more"}."""
+    raise_exception = True
+    page_size = 20
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def filter_by_term(self, queryset, term):
+        return queryset
+
+    def get_text(self, obj):
+        return str(obj)
+
+    def get(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        term = request.GET.get('q', '').strip()
+        if term:
+            queryset = self.filter_by_term(queryset, term)
+        items, more = paginate_autocomplete(queryset, request.GET.get('page'), self.page_size)
+        return JsonResponse({
+            'results': [{'id': obj.pk, 'text': self.get_text(obj)} for obj in items],
+            'more': more,
+        })
 
 
-class IndexView(ListView):
+class MachineAutocompleteView(AutocompleteView):
+    def get_queryset(self):
+        return get_machines_for_form(self.request.user).only('id', 'serial_number').order_by('serial_number')
+
+    def filter_by_term(self, queryset, term):
+        return filter_serial_prefix(queryset, term)
+
+
+class UserAutocompleteView(AutocompleteView):
+    def get_queryset(self):
+        scope = USER_SCOPES.get(self.kwargs['scope'])
+        if scope is None:
+            raise Http404
+        return scope(self.request.user).only('id', 'username', 'name').order_by('name', 'username')
+
+    def filter_by_term(self, queryset, term):
+        return queryset.filter(Q(name__icontains=term) | Q(username__istartswith=term))
+
+    def get_text(self, obj):
+        # Для клиента, проводящего ТО своими силами, сохраняется подпись из MaintenanceForm
+        user = self.request.user
+        if self.kwargs['scope'] == 'service_or_self' and get_role_scope(user).is_client and obj.pk == user.pk:
+            return "Самостоятельно"
+        return str(obj)
+
+
+class CatalogAutocompleteView(AutocompleteView):
+    def get_queryset(self):
+        model = CATALOG_MODELS.get(self.kwargs['catalog'])
+        if model is None:
+            raise Http404
+        return model.objects.only('id', 'name').order_by('name')
+
+    def filter_by_term(self, queryset, term):
+        return queryset.filter(name__icontains=term)
+
+
+class IndexView(ConditionalGetMixin, ListView):
     model = Machine
     template_name = 'index.html'
     context_object_name = 'machines'
     paginate_by = 5
+    version_labels = versioning.LABELS
 
     def get_queryset(self):
         return get_filtered_machines(self.request.user, self.request.GET)
@@ -97,36 +489,136 @@ class IndexView(ListView):
             context['failure_nodes'] = FailureNode.objects.all()
             context['recovery_methods'] = RecoveryMethod.objects.all()
             context['service_companies'] = CustomUser.objects.filter(role='service')
+            # Счетчики нужны только при построении панели фильтров, которая обычно берется из кэша фрагментов
+            context['facets'] = SimpleLazyObject(lambda: get_facet_counts(self.request.user, self.request.GET))
+            context['filter_query'] = get_filter_query(self.request.GET)
+
+        return context
+
 
+class FacetCountsView(LoginRequiredMixin, View):
+    """Счетчики фильтров главной страницы для текущего набора фильтров (JSON)."""
+    raise_exception = True
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(get_facet_counts(request.user, request.GET))
+
+
+class MetricsView(LoginRequiredMixin, View):
+    """Счетчики текущего процесса (какая база обслужила запросы и т.п.), только для менеджеров."""
+    raise_exception = True
+
+    def get(self, request, *args, **kwargs):
+        if not get_role_scope(request.user).is_manager:
+            return HttpResponseForbidden('Доступ запрещен')
+        prefix = request.GET.get('prefix', '')
+        return JsonResponse({**metrics.snapshot(prefix), **metrics.hit_rates(prefix)})
+
+
+class LiveEventsView(View):
+    """
+    Поток server-sent events об изменениях ТО и рекламаций, видимых пользователю.
+
+    Асинхронное представление: ожидающее соединение не занимает поток. Под WSGI
+    поток держал бы воркер целиком, поэтому там отвечает 204 (EventSource не переподключается).
+    """
+
+    async def get(self, request, *args, **kwargs):
+        # request.user загружается из базы, это нельзя делать в цикле событий
+        scope = await sync_to_async(get_role_scope)(request.user)
+        if not scope.is_authenticated:
+            return HttpResponseForbidden('Доступ запрещен')
+        if not isinstance(request, ASGIRequest):
+            return HttpResponse(status=204)
+        # Учетные записи организации читаются до цикла событий, в котором фильтруются события
+        await sync_to_async(lambda: scope.account_ids)()
+        try:
+            subscriber = await live.subscribe(scope, request.headers.get('Last-Event-ID'))
+        except live.TooManyConnections:
+            metrics.incr('live.rejected')
+            return HttpResponse('Слишком много открытых подключений', status=429)
+        response = StreamingHttpResponse(live.stream(subscriber), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # nginx не должен буферизовать поток
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class SlaLeaderboardView(LoginRequiredMixin, ConditionalGetMixin, TemplateView):
+    """Рейтинг сервисных компаний за скользящее окно по готовым недельным корзинам, только для менеджеров."""
+    template_name = 'service/sla_leaderboard.html'
+    version_labels = (versioning.SLA, versioning.USER)
+    raise_exception = True
+    orderings = ('complaints', *sla.METRICS)
+
+    def get(self, request, *args, **kwargs):
+        if not get_role_scope(request.user).is_manager:
+            return HttpResponseForbidden('Доступ запрещен')
+        return super().get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        order = self.request.GET.get('order')
+        if order not in self.orderings:
+            order = 'avg_downtime'
+        open_alerts = set(SlaAlert.objects.filter(resolved_at__isnull=True).values_list('service_company_id', 'metric'))
+        rows = list(sla.get_company_stats().items())
+        # Худшие значения сверху, компании без данных по показателю - в конце
+        rows.sort(key=lambda item: (item[1][order] is None, -(item[1][order] or 0), str(item[1]['company'])))
+        context.update({
+            'rows': [
+                {
+                    **stats,
+                    'cells': [
+                        (stats[metric], metric.endswith('_rate'), (company_id, metric) in open_alerts)
+                        for metric in sla.METRICS
+                    ],
+                }
+                for company_id, stats in rows
+            ],
+            'order': order,
+            'metrics': sla.METRICS,
+            'thresholds': [(sla.METRICS[metric], threshold) for metric, threshold in settings.SLA_THRESHOLDS.items()],
+            'window_start': sla.get_window_start(),
+        })
         return context
 
 
-class MachineDetailView(RoleBasedAccessMixin, DetailView):
+class MachineDetailView(ConditionalGetMixin, RoleBasedAccessMixin, DetailView):
     model = Machine
     template_name = 'service/details/machine_detail.html'
     context_object_name = 'machine'
+    version_labels = (versioning.MACHINE, versioning.CATALOG, versioning.USER)
 
 
-class MaintenanceDetailView(RoleBasedAccessMixin, DetailView):
+class MaintenanceDetailView(ConditionalGetMixin, ArchiveFallbackMixin, RoleBasedAccessMixin, DetailView):
     model = Maintenance
     template_name = 'service/details/maintenance_detail.html'
     context_object_name = 'maintenance'
+    archive_queryset = staticmethod(get_archived_maintenances_in_scope)
+    version_labels = (
+        versioning.MAINTENANCE, versioning.ATTACHMENT, versioning.MACHINE, versioning.CATALOG, versioning.USER
+    )
 
 
-class ComplaintDetailView(RoleBasedAccessMixin, DetailView):
+class ComplaintDetailView(ConditionalGetMixin, ArchiveFallbackMixin, RoleBasedAccessMixin, DetailView):
     model = Complaint
     template_name = 'service/details/complaint_detail.html'
     context_object_name = 'complaint'
+    archive_queryset = staticmethod(get_archived_complaints_in_scope)
+    version_labels = (
+        versioning.COMPLAINT, versioning.ATTACHMENT, versioning.MACHINE, versioning.CATALOG, versioning.USER
+    )
 
 
-class MachineCreateView(LoginRequiredMixin, CreateView):
+class MachineCreateView(LoginRequiredMixin, ConstraintErrorMixin, CreateView):
     model = Machine
     form_class = MachineForm
     template_name = 'service/forms/machine_form.html'
     success_url = reverse_lazy('index')
 
     def dispatch(self, request, *args, **kwargs):
-        if not getattr(request.user, 'is_manager', False) and not request.user.is_superuser:
+        if not get_role_scope(request.user).is_manager:
             return HttpResponseForbidden("У вас нет прав для добавления машин.")
         return super().dispatch(request, *args, **kwargs)
 
@@ -136,7 +628,7 @@ class MachineCreateView(LoginRequiredMixin, CreateView):
         return context
 
 
-class MaintenanceCreateView(LoginRequiredMixin, CreateView):
+class MaintenanceCreateView(LoginRequiredMixin, ConstraintErrorMixin, CreateView):
     model = Maintenance
     form_class = MaintenanceForm
     template_name = 'service/forms/maintenance_form.html'
@@ -158,7 +650,7 @@ class MaintenanceCreateView(LoginRequiredMixin, CreateView):
         return reverse_lazy('index') + '?tab=maintenance'
 
 
-class MaintenanceUpdateView(LoginRequiredMixin, RoleBasedAccessMixin, UpdateView):
+class MaintenanceUpdateView(LoginRequiredMixin, RoleBasedAccessMixin, ConstraintErrorMixin, UpdateView):
     model = Maintenance
     form_class = MaintenanceForm
     template_name = 'service/forms/maintenance_form.html'
@@ -185,7 +677,7 @@ class MaintenanceDeleteView(LoginRequiredMixin, RoleBasedAccessMixin, DeleteView
         return reverse_lazy('index') + '?tab=maintenance'
 
 
-class ComplaintCreateView(LoginRequiredMixin, CreateView):
+class ComplaintCreateView(LoginRequiredMixin, ConstraintErrorMixin, CreateView):
     model = Complaint
     form_class = ComplaintForm
     template_name = 'service/forms/complaint_form.html'
@@ -194,8 +686,7 @@ class ComplaintCreateView(LoginRequiredMixin, CreateView):
         return reverse_lazy('index') + '?tab=complaints'
 
     def dispatch(self, request, *args, **kwargs):
-        user = request.user
-        if not (getattr(user, 'is_service', False) or getattr(user, 'is_manager', False) or user.is_superuser):
+        if not get_role_scope(request.user).can_create_complaints:
             return render(request, 'service/permissions/complaint_denied.html', {
                 'message': "У вас нет прав для создания рекламаций.\nОбратитесь в сервисную компанию или к продавцу."
             })
@@ -212,7 +703,7 @@ class ComplaintCreateView(LoginRequiredMixin, CreateView):
         return kwargs
 
 
-class ComplaintUpdateView(LoginRequiredMixin, RoleBasedAccessMixin, UpdateView):
+class ComplaintUpdateView(LoginRequiredMixin, RoleBasedAccessMixin, ConstraintErrorMixin, UpdateView):
     model = Complaint
     form_class = ComplaintForm
     template_name = 'service/forms/complaint_form.html'
@@ -237,3 +728,83 @@ class ComplaintDeleteView(LoginRequiredMixin, RoleBasedAccessMixin, DeleteView):
 
     def get_success_url(self):
         return reverse_lazy('index') + '?tab=complaints'
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AttachmentUploadView(LoginRequiredMixin, View):
+    """
+    Загрузка вложений к рекламации или ТО (multipart, поле files).
+
+    Обработчик загрузки подменяется до чтения тела запроса, поэтому CSRF
+    проверяется внутри post, а не middleware (которое прочитало бы тело раньше).
+    """
+    raise_exception = True
+    owner = None  # 'complaint' или 'maintenance'
+
+    def post(self, request, pk):
+        handler = Sha256FileUploadHandler(request)
+        request.upload_handlers = [handler]
+        return self.upload(request, pk, handler)
+
+    @method_decorator(csrf_protect)
+    def upload(self, request, pk, handler):
+        get_queryset = get_complaints_in_scope if self.owner == 'complaint' else get_maintenances_in_scope
+        obj = get_object_or_404(get_queryset(request.user), pk=pk)
+        if not get_role_scope(request.user).can_attach(self.owner):
+            return HttpResponseForbidden('У вас нет прав для загрузки вложений.')
+        files = request.FILES.getlist('files')
+        with transaction.atomic():
+            for uploaded in files:
+                store_attachment(uploaded, request.user, **{self.owner: obj})
+
+        url = reverse(f'{self.owner}_detail', args=[obj.pk])
+        if handler.rejected:
+            url += '?' + urlencode({'attachment_error': handler.rejected[0][1]})
+        elif not files:
+            url += '?' + urlencode({'attachment_error': 'empty'})
+        return HttpResponseRedirect(url + '#attachments')
+
+
+class AttachmentFileView(LoginRequiredMixin, View):
+    """
+    Файл вложения, превью или миниатюра. Содержимое вложения не меняется,
+    поэтому браузер кэширует ответ без повторных запросов.
+    """
+    raise_exception = True
+    variants = ('original', 'preview', 'thumb')
+
+    def get(self, request, pk, variant):
+        attachment = get_object_or_404(get_attachments_in_scope(request.user), pk=pk)
+        if variant not in self.variants:
+            raise Http404
+        if variant == 'original':
+            name, content_type = attachment.file.name, attachment.content_type
+        elif attachment.is_image:
+            name, content_type = attachment.variant_path(variant), 'image/jpeg'
+        else:
+            raise Http404
+        if not default_storage.exists(name):
+            raise Http404
+
+        inline = content_type in INLINE_CONTENT_TYPES
+        response = FileResponse(
+            default_storage.open(name),
+            content_type=content_type if inline else 'application/octet-stream',
+            as_attachment=not inline,
+            filename=os.path.splitext(attachment.original_name)[0] + '.jpg' if variant != 'original' else attachment.original_name,
+        )
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+        return response
+
+
+class AttachmentDeleteView(LoginRequiredMixin, View):
+    raise_exception = True
+
+    def post(self, request, pk):
+        attachment = get_object_or_404(get_attachments_in_scope(request.user), pk=pk)
+        if not get_role_scope(request.user).can_delete_attachment(attachment):
+            return HttpResponseForbidden('Удалить вложение может только загрузивший его пользователь или менеджер.')
+        owner = 'complaint' if attachment.complaint_id else 'maintenance'
+        owner_id = attachment.complaint_id or attachment.maintenance_id
+        attachment.delete()
+        return HttpResponseRedirect(reverse(f'{owner}_detail', args=[owner_id]) + '#attachments')
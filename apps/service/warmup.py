@@ -0,0 +1,94 @@
+import logging
+import time
+from pathlib import Path
+
+from django.db import connections
+from django.template import engines
+from django.urls import URLResolver, get_resolver
+
+from . import spareparts, versioning
+from .services import CATALOG_MODELS
+
+logger = logging.getLogger(__name__)
+
+
+def compile_templates():
+    """
+    Компилирует все шаблоны из каталогов TEMPLATES['DIRS'] в кэш загрузчика (cached.Loader):
+    первый запрос к странице не разбирает шаблоны. Возвращает число шаблонов.
+    """
+    engine = engines['django'].engine
+    count = 0
+    for directory in engine.dirs:
+        directory = Path(directory)
+        for path in sorted(directory.rglob('*')):
+            if path.is_file() and path.suffix in ('.html', '.txt'):
+                engine.get_template(path.relative_to(directory).as_posix())
+                count += 1
+    return count
+
+
+def _walk_resolver(resolver):
+    # reverse_dict и регулярные выражения строятся лениво: первый reverse() или resolve() платит за них
+    resolver.reverse_dict
+    count = 0
+    for pattern in resolver.url_patterns:
+        pattern.pattern.regex
+        if isinstance(pattern, URLResolver):
+            count += _walk_resolver(pattern)
+        else:
+            count += 1
+    return count
+
+
+def resolve_urls():
+    """Заполняет таблицы распознавания и обратного построения адресов для всех шаблонов URL."""
+    resolver = get_resolver()
+    count = _walk_resolver(resolver)
+    for namespace in resolver.namespace_dict:
+        resolver.namespace_dict[namespace][1].reverse_dict
+    return count
+
+
+def open_connections():
+    """Открывает соединения со всеми базами (основной и репликами): PRAGMA и mmap применяются до запросов."""
+    for alias in connections:
+        connections[alias].ensure_connection()
+    return len(connections.all())
+
+
+def prime_catalog_cache():
+    """Версии данных, словарь справочника запчастей процесса и страницы справочников в кэше СУБД."""
+    versioning.get_data_versions(*versioning.LABELS)
+    spareparts.get_dictionary()
+    return sum(len(model.objects.values_list('pk', 'name')) for model in CATALOG_MODELS.values())
+
+
+STEPS = (
+    ('templates', compile_templates),
+    ('urls', resolve_urls),
+    ('connections', open_connections),
+    ('catalog', prime_catalog_cache),
+)
+
+
+def warm_up(keep_connections=True):
+    """
+    Прогрев воркера до первого запроса (config/gunicorn.conf.py). Ошибка шага не мешает
+    воркеру запуститься. keep_connections=False - перед fork (preload_app): соединения
+    с базой закрываются, каждый воркер откроет свои.
+
+    Возвращает {шаг: (результат или None при ошибке, секунды)}.
+    """
+    result = {}
+    for name, step in STEPS:
+        started = time.perf_counter()
+        try:
+            value = step()
+        except Exception:
+            logger.warning('Прогрев воркера: шаг %s завершился ошибкой', name, exc_info=True)
+            value = None
+        result[name] = (value, time.perf_counter() - started)
+    if not keep_connections:
+        connections.close_all()
+    return result
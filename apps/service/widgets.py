@@ -0,0 +1,43 @@
+from django import forms
+from django.urls import reverse
+
+
+class AutocompleteSelect(forms.Select):
+    """
+    Выпадающий список с подгрузкой вариантов по мере ввода.
+
+    В HTML выводится только выбранное значение, остальные варианты
+    запрашиваются у JSON-эндпоинта автодополнения (static/js/autocomplete.js),
+    поэтому размер страницы не зависит от количества записей в таблице.
+    """
+
+    def __init__(self, url_name, url_kwargs=None, attrs=None):
+        super().__init__(attrs)
+        self.url_name = url_name
+        self.url_kwargs = url_kwargs or {}
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        attrs['data-autocomplete-url'] = reverse(self.url_name, kwargs=self.url_kwargs)
+        attrs['data-placeholder'] = 'Начните вводить для поиска'
+        return attrs
+
+    def optgroups(self, name, value, attrs=None):
+        field = self.choices.field
+        selected = [v for v in value if v not in field.empty_values]
+        options = []
+        if not self.is_required or not selected:
+            options.append(self.create_option(name, '', field.empty_label or '', not selected, 0))
+        if selected:
+            try:
+                objects = list(field.queryset.filter(pk__in=selected))
+            except (ValueError, TypeError):
+                objects = []
+            for index, obj in enumerate(objects, start=len(options)):
+                options.append(self.create_option(
+                    name, str(obj.pk), field.label_from_instance(obj), True, index
+                ))
+        return [(None, options, 0)]
+
+    class Media:
+        js = ('js/autocomplete.js',)
@@ -1,19 +1,46 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser
+from django.urls import reverse
+from .models import CustomUser, Organization
+
+# Поля внешних ключей на пользователя -> роль, которой ограничивается автодополнение в админке
+AUTOCOMPLETE_FIELD_ROLES = {
+    'client': CustomUser.CLIENT,
+    'service_company': CustomUser.SERVICE,
+}
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
     model = CustomUser
     
-    list_display = ['username', 'email', 'role', 'name', 'is_staff']
+    list_display = ['username', 'email', 'role', 'name', 'organization', 'is_staff']
+    list_select_related = ['organization']
     
     fieldsets = UserAdmin.fieldsets + (
-        ('Дополнительная информация', {'fields': ('role', 'name')}),
+        ('Дополнительная информация', {'fields': ('role', 'name', 'organization')}),
     )
     
     add_fieldsets = UserAdmin.add_fieldsets + (
-        ('Дополнительная информация', {'fields': ('role', 'name')}),
+        ('Дополнительная информация', {'fields': ('role', 'name', 'organization')}),
     )
     
     list_filter = ('role', 'is_staff', 'is_active')
+    autocomplete_fields = ['organization']
+    search_fields = UserAdmin.search_fields + ('name',)
+
+    def get_search_results(self, request, queryset, search_term):
+        queryset, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if request.path == reverse('admin:autocomplete'):
+            role = AUTOCOMPLETE_FIELD_ROLES.get(request.GET.get('field_name'))
+            if role:
+                queryset = queryset.filter(role=role)
+        return queryset, may_have_duplicates
+
+
+@admin.register(Organization)
+class OrganizationAdmin(admin.ModelAdmin):
+    list_display = ['name', 'kind', 'parent']
+    list_select_related = ['parent']
+    list_filter = ['kind']
+    search_fields = ['name']
+    autocomplete_fields = ['parent']
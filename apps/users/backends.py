@@ -0,0 +1,42 @@
+from allauth.account.auth_backends import AuthenticationBackend
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from apps.service.versioning import USER, get_data_versions
+
+
+def user_cache_key(user_id):
+    return f'user:{user_id}'
+
+
+class CachedUserMixin:
+    """
+    Пользователь сессии берется из кэша, а не запросом к базе на каждый запрос.
+
+    Кэш у каждого процесса свой, поэтому запись хранится вместе с версией данных пользователей
+    (versioning.USER) и проверяется по ней при каждом попадании: сохранение пользователя или
+    перенос организации в любом воркере увеличивает версию, и строка читается заново.
+    Изменения в обход save() (QuerySet.update) видны не позже USER_CACHE_TIMEOUT.
+    """
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        # Версия читается до строки: запись, зафиксированная между ними, сбросит кэш при следующем запросе
+        version = get_data_versions(USER)[USER]
+        cached = cache.get(key)
+        if cached is None or cached[0] != version:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, (version, user), settings.USER_CACHE_TIMEOUT)
+            return user
+        user = cached[1]
+        return user if self.user_can_authenticate(user) else None
+
+
+class CachedModelBackend(CachedUserMixin, ModelBackend):
+    pass
+
+
+class CachedAuthenticationBackend(CachedUserMixin, AuthenticationBackend):
+    pass
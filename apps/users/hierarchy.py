@@ -0,0 +1,65 @@
+from django.db import connections, transaction
+
+from .models import Organization, OrganizationClosure
+
+
+def insert_organization(organization, using='default'):
+    """Строки замыкания новой организации: она сама и все предки головной организации."""
+    links = [OrganizationClosure(ancestor_id=organization.pk, descendant_id=organization.pk, depth=0)]
+    if organization.parent_id is not None:
+        links += [
+            OrganizationClosure(ancestor_id=ancestor, descendant_id=organization.pk, depth=depth + 1)
+            for ancestor, depth in OrganizationClosure.objects.using(using).filter(
+                descendant_id=organization.parent_id
+            ).values_list('ancestor_id', 'depth')
+        ]
+    OrganizationClosure.objects.using(using).bulk_create(links)
+
+
+def move_organization(organization, using='default'):
+    """
+    Переносит поддерево организации под ее новую головную организацию (уже сохраненную в parent_id):
+    связи поддерева со старыми предками удаляются, с новыми - добавляются одной пачкой.
+    """
+    links = OrganizationClosure.objects.using(using)
+    with transaction.atomic(using=using):
+        subtree = list(links.filter(ancestor_id=organization.pk).values_list('descendant_id', 'depth'))
+        subtree_ids = [descendant for descendant, _ in subtree]
+        if organization.parent_id in subtree_ids:
+            raise ValueError('Организация не может входить в собственное подразделение')
+        links.filter(descendant_id__in=subtree_ids).exclude(ancestor_id__in=subtree_ids).delete()
+        if organization.parent_id is None:
+            return
+        ancestors = list(links.filter(descendant_id=organization.parent_id).values_list('ancestor_id', 'depth'))
+        links.bulk_create([
+            OrganizationClosure(ancestor_id=ancestor, descendant_id=descendant, depth=above + below + 1)
+            for ancestor, above in ancestors
+            for descendant, below in subtree
+        ])
+
+
+def build_closure(parents):
+    """{id: id головной организации} -> строки замыкания; циклы в parents не допускаются."""
+    links = []
+    for organization in parents:
+        node, depth, seen = organization, 0, set()
+        while node is not None:
+            if node in seen:
+                raise ValueError(f'Цикл в иерархии организаций: {organization}')
+            seen.add(node)
+            links.append(OrganizationClosure(ancestor_id=node, descendant_id=organization, depth=depth))
+            node, depth = parents.get(node), depth + 1
+    return links
+
+
+def rebuild_closure(using='default'):
+    """Заполняет таблицу замыкания заново по полю parent; возвращает число строк."""
+    parents = dict(Organization.objects.using(using).values_list('pk', 'parent_id'))
+    links = build_closure(parents)
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        # QuerySet.delete() загрузил бы все строки ради сигналов post_delete
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(OrganizationClosure._meta.db_table)}')
+        OrganizationClosure.objects.using(using).bulk_create(links, batch_size=1000)
+    return len(links)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from apps.users.hierarchy import rebuild_closure
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет таблицу замыкания иерархии организаций заново по головным организациям '
+        '(после loaddata или правки parent в обход сигналов)'
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Строк замыкания: {rebuild_closure()}')
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.27 on 2026-10-19 13:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Organization',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Название')),
+                ('kind', models.CharField(choices=[('client', 'Клиент'), ('service', 'Сервисная организация')], max_length=15, verbose_name='Тип')),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='children', to='users.organization', verbose_name='Головная организация')),
+            ],
+            options={
+                'verbose_name': 'Организация',
+                'verbose_name_plural': 'Организации',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='OrganizationClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='users.organization')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='users.organization')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='organization',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='members', to='users.organization', verbose_name='Организация'),
+        ),
+        migrations.AddConstraint(
+            model_name='organizationclosure',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_organization_closure'),
+        ),
+    ]
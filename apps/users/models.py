@@ -1,3 +1,4 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 
@@ -20,10 +21,19 @@ class CustomUser(AbstractUser):
         verbose_name='Роль'
     )
     name = models.CharField(max_length=255, blank=True, verbose_name='Имя / Название организации')
+    organization = models.ForeignKey(
+        'Organization', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='members', verbose_name='Организация'
+    )
 
     def __str__(self):
         return self.name if self.name else self.username
 
+    def clean(self):
+        super().clean()
+        if self.organization_id and self.organization.kind != self.role:
+            raise ValidationError({'organization': 'Тип организации не совпадает с ролью пользователя.'})
+
     @property
     def is_manager(self):
         return self.role == self.MANAGER
@@ -35,3 +45,55 @@ class CustomUser(AbstractUser):
     @property
     def is_client(self):
         return self.role == self.CLIENT
+
+
+class Organization(models.Model):
+    """
+    Организация клиента или сервисной компании: холдинг, дочерние общества, региональные филиалы.
+
+    Пользователь, прикрепленный к организации, видит технику всех учетных записей
+    этой организации и ее подразделений (см. OrganizationClosure).
+    """
+    KIND_CHOICES = (
+        (CustomUser.CLIENT, 'Клиент'),
+        (CustomUser.SERVICE, 'Сервисная организация'),
+    )
+
+    name = models.CharField(max_length=255, verbose_name='Название')
+    kind = models.CharField(max_length=15, choices=KIND_CHOICES, verbose_name='Тип')
+    parent = models.ForeignKey(
+        'self', on_delete=models.PROTECT, null=True, blank=True,
+        related_name='children', verbose_name='Головная организация'
+    )
+
+    class Meta:
+        verbose_name = 'Организация'
+        verbose_name_plural = 'Организации'
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+    def clean(self):
+        if self.parent_id is None:
+            return
+        if self.parent.kind != self.kind:
+            raise ValidationError({'parent': 'Головная организация должна быть того же типа.'})
+        if self.pk and OrganizationClosure.objects.filter(ancestor_id=self.pk, descendant_id=self.parent_id).exists():
+            raise ValidationError({'parent': 'Организация не может входить в собственное подразделение.'})
+
+
+class OrganizationClosure(models.Model):
+    """
+    Таблица замыкания иерархии: строка на каждую пару (предок, потомок), включая саму
+    организацию с depth=0. "Все под холдингом" - одно соединение по индексу (ancestor, descendant)
+    вместо рекурсивного обхода. Заполняется сигналами при сохранении Organization.
+    """
+    ancestor = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='unique_organization_closure'),
+        ]
@@ -0,0 +1,36 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .backends import user_cache_key
+from .hierarchy import insert_organization, move_organization
+from .models import CustomUser, Organization
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_cached_user(sender, instance, using, **kwargs):
+    # После коммита, чтобы параллельный запрос не положил в кэш старую строку
+    key = user_cache_key(instance.pk)
+    transaction.on_commit(lambda: cache.delete(key), using=using)
+
+
+@receiver(pre_save, sender=Organization)
+def remember_organization_parent(sender, instance, raw, using, **kwargs):
+    if raw or instance._state.adding:
+        return
+    instance._previous_parent_id = Organization.objects.using(using).filter(pk=instance.pk).values_list(
+        'parent_id', flat=True
+    ).first()
+
+
+@receiver(post_save, sender=Organization)
+def update_organization_closure(sender, instance, created, raw, using, **kwargs):
+    # Фикстуры (raw) восстанавливаются командой rebuild_organization_closure
+    if raw:
+        return
+    if created:
+        insert_organization(instance, using=using)
+    elif instance.parent_id != getattr(instance, '_previous_parent_id', instance.parent_id):
+        move_organization(instance, using=using)
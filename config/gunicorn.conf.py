@@ -0,0 +1,27 @@
+"""
+Настройки gunicorn: gunicorn -c config/gunicorn.conf.py
+
+Воркер прогревается до первого запроса (apps.service.warmup): шаблоны, таблицы URL,
+соединения с базой и кэш справочников. С preload_app (GUNICORN_PRELOAD=1) шаблоны и URL
+прогреваются один раз в мастере до fork, воркеры получают их готовыми.
+"""
+import os
+
+wsgi_app = 'config.wsgi:application'
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
+preload_app = os.environ.get('GUNICORN_PRELOAD') == '1'
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        from apps.service.warmup import warm_up
+
+        # Соединения, открытые до fork, воркеры делили бы между собой
+        warm_up(keep_connections=False)
+
+
+def post_worker_init(worker):
+    from apps.service.warmup import warm_up
+
+    warm_up()
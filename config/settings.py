@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -49,6 +50,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'apps.service.middleware.GZipMiddleware',
+    'apps.service.middleware.ReplicaRoutingMiddleware',
+    'apps.service.middleware.RateLimitMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -71,6 +75,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'apps.service.context_processors.role_scope',
                 'django.template.context_processors.request',
             ],
         },
@@ -85,21 +90,73 @@ WSGI_APPLICATION = 'config.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # SQLite с BEGIN IMMEDIATE для atomic(): записи из форм и API выстраиваются в очередь
+        'ENGINE': 'config.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+        'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Применяются к каждому новому соединению SQLite (apps.service.signals.configure_sqlite_connection)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',  # читатели не блокируют писателя и наоборот
+    'synchronous': 'NORMAL',  # в режиме WAL безопасно, fsync только при checkpoint
+    'busy_timeout': 5000,  # мс ожидания блокировки вместо немедленной ошибки
+    'cache_size': -65536,  # 64 МБ кэша страниц на соединение
+    'mmap_size': 268435456,  # 256 МБ файла читаются через mmap
+    'temp_store': 'MEMORY',
+}
+
+# Реплики только для чтения: DATABASE_REPLICAS="replica1=/srv/silant/replica1.sqlite3,replica2=..."
+# Каждая реплика наследует настройки default, меняется только NAME (для PostgreSQL - имя@хост).
+DATABASE_REPLICAS = []
+for entry in filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')):
+    alias, _, name = entry.strip().partition('=')
+    name, _, host = name.partition('@')
+    replica = {**DATABASES['default'], 'NAME': name, 'TEST': {'MIRROR': 'default'}}
+    if host:
+        replica['HOST'] = host
+    DATABASES[alias] = replica
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['apps.service.routers.ReplicaRouter']
+
+# Допустимое отставание реплики (сек.); при большем чтение переключается на основную базу
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 5))
+REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get('REPLICA_LAG_CHECK_INTERVAL', 10))
+# Сколько секунд после изменяющего запроса пользователь читает с основной базы
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 15))
+
 AUTH_USER_MODEL = 'users.CustomUser'
 
 # Django-allauth настройки
 SITE_ID = 1
 
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
-    'allauth.account.auth_backends.AuthenticationBackend',
+    'apps.users.backends.CachedModelBackend',
+    'apps.users.backends.CachedAuthenticationBackend',
 ]
 
+# Кэши: default - в памяти процесса (записи в нем сверяются с версиями данных); sessions - в файлах
+# на локальном диске, общий для всех воркеров сервера: выход в одном воркере виден остальным
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('SESSION_CACHE_DIR', str(BASE_DIR / 'cache' / 'sessions')),
+    },
+}
+
+# Сессии читаются из общего кэша sessions, база - только при промахе и при записи
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'sessions'
+# Сколько секунд строка пользователя живет в кэше (сбрасывается при сохранении пользователя)
+USER_CACHE_TIMEOUT = 300
+
 ACCOUNT_ADAPTER = 'apps.users.adapters.CustomAccountAdapter'
 
 
@@ -153,6 +210,107 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# collectstatic: имена с хэшем содержимого, оптимизация картинок и шрифтов, варианты .gz/.br.
+# Хэшированные имена берутся из staticfiles.json, поэтому без collectstatic (разработка, тесты)
+# используется обычное хранилище, иначе каждый шаблон со {% static %} падал бы на отсутствии манифеста
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'config.staticfiles.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
+# Наибольшая сторона картинок из static/ после сборки, px (логотип выводится высотой 2.5rem)
+STATIC_IMAGE_MAX_SIZE = 480
+
+# Вложения к рекламациям и ТО хранятся по хэшу содержимого и отдаются только через
+# представление с проверкой доступа, поэтому MEDIA_ROOT не публикуется веб-сервером
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+ATTACHMENT_MAX_SIZE = 25 * 1024 * 1024
+ATTACHMENT_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.heic', '.pdf')
+# Наибольшая сторона превью и миниатюр, которые строит воркер, px
+ATTACHMENT_PREVIEW_SIZE = 1600
+ATTACHMENT_THUMBNAIL_SIZE = 240
+
+# Фоновые задачи (manage.py run_worker): через сколько секунд задача упавшего воркера возвращается
+# в очередь и сколько дней хранятся выполненные
+TASK_LOCK_TIMEOUT = 600
+TASK_RETENTION_DAYS = 7
+
+# Уведомления отправляет воркер; без настроенного SMTP письма выводятся в консоль
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'noreply@silant.local')
+
+# Сколько машин можно запросить одним вызовом /api/machines/service-book/?serial_number=...
+SERVICE_BOOK_BATCH_LIMIT = 50
+
+# Массовая передача машин (админка, manage.py reassign_machines, POST /api/machines/reassign/):
+# машин в одном UPDATE и одной записи журнала MachineReassignment
+REASSIGN_BATCH_SIZE = 500
+
+# Архивация (manage.py archive_records): ТО и рекламации раньше 1 января года, отстоящего на
+# ARCHIVE_KEEP_YEARS от текущего, переносятся пачками в архивные таблицы
+ARCHIVE_KEEP_YEARS = 3
+ARCHIVE_BATCH_SIZE = 1000
+
+# Поток изменений ТО и рекламаций /live/ (server-sent events, только под ASGI): период опроса журнала
+# и пульса, срок жизни соединения, ограничения подключений на пользователя и на процесс, секунды
+LIVE_EVENTS_POLL_INTERVAL = 1.0
+LIVE_EVENTS_HEARTBEAT = 15
+LIVE_EVENTS_MAX_AGE = 300
+LIVE_EVENTS_RETRY_MS = 3000
+LIVE_EVENTS_MAX_CONNECTIONS_PER_USER = 5
+LIVE_EVENTS_MAX_CONNECTIONS = 10000
+# Очередь одного подписчика и сколько пропущенных событий досылается при переподключении
+LIVE_EVENTS_QUEUE_SIZE = 100
+LIVE_EVENTS_BACKLOG = 200
+# Сколько секунд перечитываются недавние события (PostgreSQL) и хранится журнал
+LIVE_EVENTS_GRACE = 5
+LIVE_EVENTS_RETENTION = 3600
+
+# Показатели сервисных компаний (/sla/): скользящее окно, дни; отказ того же узла машины
+# раньше чем через SLA_REPEAT_FAILURE_DAYS дней - повторный; ТО позже заказ-наряда больше чем
+# на SLA_MAINTENANCE_MAX_DELAY_DAYS дней - с опозданием
+SLA_WINDOW_DAYS = 90
+SLA_REPEAT_FAILURE_DAYS = 30
+SLA_MAINTENANCE_MAX_DELAY_DAYS = 3
+# Пороги показателей за окно (sla.METRICS) и наименьшее число записей, по которому показатель оценивается
+SLA_THRESHOLDS = {'avg_downtime': 7, 'repeat_rate': 0.2, 'late_rate': 0.25}
+SLA_MIN_SAMPLE = 5
+# Пороги проверяются не чаще раза в столько секунд, одной задачей на все записи за это время
+SLA_EVALUATION_DELAY = 300
+
+REST_FRAMEWORK = {
+    'DEFAULT_THROTTLE_CLASSES': ['apps.service.throttling.TokenBucketThrottle'],
+}
+
+# Ограничение частоты запросов API: корзина токенов на пользователя (или токен, или IP анонима)
+# отдельно для списков, карточек и изменений - емкость и пополнение, токенов в секунду.
+# Запрос стоит 1 токен, список - еще по токену за каждые API_THROTTLE_ROWS_PER_TOKEN строк ответа
+API_THROTTLE_BUDGETS = {
+    'list': {'capacity': 60, 'rate': 1.0},
+    'detail': {'capacity': 120, 'rate': 2.0},
+    'write': {'capacity': 30, 'rate': 0.5},
+}
+API_THROTTLE_ROWS_PER_TOKEN = 100
+# Корзины хранятся в отдельном файле SQLite на локальном диске, общем для всех воркеров сервера
+API_THROTTLE_DB = os.environ.get('API_THROTTLE_DB', str(BASE_DIR / 'cache' / 'throttle.sqlite3'))
+
+# Пакеты данных для работы без связи (/api/datapack/): каталог файлов; пакеты, которые
+# не запрашивали дольше DATA_PACK_KEEP_DAYS дней, не пересобираются и удаляются
+DATA_PACK_ROOT = os.environ.get('DATA_PACK_ROOT', str(BASE_DIR / 'cache' / 'datapacks'))
+DATA_PACK_KEEP_DAYS = 14
+
+# Бюджет готовности воркера, секунды: запуск интерпретатора, django.setup() и прогрев
+# (manage.py startup_profile --check в проверках перед выкладкой)
+STARTUP_READY_BUDGET = 2.0
+
+# Версия выкладки для ETag страниц (apps.service.conditional); по умолчанию - по времени изменения файлов проекта
+RELEASE = os.environ.get('RELEASE', '')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,27 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite с выбором режима начала транзакции (аналог OPTIONS["transaction_mode"] из Django 5.1).
+
+    При transaction_mode="IMMEDIATE" блок atomic() сразу берет блокировку записи:
+    параллельные записи ждут своей очереди (busy_timeout), а не падают с
+    "database is locked" при попытке повысить блокировку чтения до записи.
+    """
+    transaction_modes = frozenset(['DEFERRED', 'IMMEDIATE', 'EXCLUSIVE'])
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('transaction_mode', None)
+        return params
+
+    @property
+    def transaction_mode(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode', 'DEFERRED').upper()
+        if mode not in self.transaction_modes:
+            raise ValueError(f'Неизвестный transaction_mode SQLite: {mode}')
+        return mode
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
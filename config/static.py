@@ -0,0 +1,87 @@
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+from pathlib import Path
+from wsgiref.util import FileWrapper
+
+from django.utils.http import parse_etags
+
+# Имя с хэшем содержимого от ManifestStaticFilesStorage: style.1a2b3c4d5e6f.css
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=60'
+
+
+class StaticFile:
+    def __init__(self, path):
+        self.path = path
+        self.content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type.endswith(('javascript', 'json', 'xml')):
+            self.content_type += '; charset=utf-8'
+        stat = path.stat()
+        self.etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.cache_control = IMMUTABLE if HASHED_NAME_RE.search(path.name) else REVALIDATE
+        self.variants = {}
+        for encoding, suffix in ENCODINGS:
+            variant = path.with_name(path.name + suffix)
+            if variant.exists():
+                self.variants[encoding] = variant
+
+    def choose(self, accept_encoding):
+        accepted = {item.split(';')[0].strip() for item in accept_encoding.split(',')}
+        for encoding, _ in ENCODINGS:
+            if encoding in accepted and encoding in self.variants:
+                return encoding, self.variants[encoding]
+        return None, self.path
+
+
+class PrecompressedStaticFiles:
+    """
+    WSGI-обертка, которая отдает собранную статику (STATIC_ROOT) без Django.
+
+    Список файлов читается один раз при старте. Если клиент принимает br/gzip
+    и collectstatic подготовил сжатый вариант, отдается он; файлы с хэшем в имени
+    кэшируются браузером навсегда (immutable), остальные перепроверяются по ETag.
+    """
+
+    def __init__(self, application, root, prefix):
+        self.application = application
+        self.prefix = '/' + prefix.strip('/') + '/'
+        self.files = {}
+        root = Path(root)
+        if root.is_dir():
+            for path in root.rglob('*'):
+                if path.is_file() and not path.name.endswith(('.gz', '.br')):
+                    self.files[self.prefix + path.relative_to(root).as_posix()] = StaticFile(path)
+
+    def __call__(self, environ, start_response):
+        static_file = self.files.get(environ.get('PATH_INFO', ''))
+        if static_file is None or environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return self.application(environ, start_response)
+
+        encoding, path = static_file.choose(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        etag = static_file.etag if encoding is None else f'{static_file.etag[:-1]}-{encoding}"'
+        headers = [
+            ('Content-Type', static_file.content_type),
+            ('Cache-Control', static_file.cache_control),
+            ('ETag', etag),
+            ('Last-Modified', static_file.last_modified),
+            ('Vary', 'Accept-Encoding'),
+        ]
+        if encoding is not None:
+            headers.append(('Content-Encoding', encoding))
+        if_none_match = parse_etags(environ.get('HTTP_IF_NONE_MATCH', ''))
+        # If-None-Match сравнивается слабо: W/"x" совпадает с "x"
+        if '*' in if_none_match or etag in {tag.removeprefix('W/') for tag in if_none_match}:
+            start_response('304 Not Modified', headers)
+            return []
+
+        headers.append(('Content-Length', str(os.path.getsize(path))))
+        start_response('200 OK', headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        file_wrapper = environ.get('wsgi.file_wrapper', FileWrapper)
+        return file_wrapper(open(path, 'rb'), 65536)
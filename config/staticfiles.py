@@ -0,0 +1,116 @@
+import gzip
+import io
+import logging
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from PIL import Image
+
+try:
+    import brotli
+except ImportError:  # brotli не обязателен: без него собираются только .gz
+    brotli = None
+
+try:
+    from fontTools import subset as font_subset
+except ImportError:  # fonttools не обязателен: без него шрифты только сжимаются
+    font_subset = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.ttf', '.otf', '.json', '.txt', '.map', '.xml', '.html')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+FONT_EXTENSIONS = ('.ttf', '.otf')
+# Латиница, кириллица, типографские знаки и символ рубля
+FONT_UNICODES = 'U+0000-024F,U+0400-04FF,U+2000-206F,U+20BD,U+2116'
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    collectstatic: оптимизация картинок и шрифтов, имена с хэшем уже итогового
+    содержимого + staticfiles.json, затем для файлов с хэшем - заранее сжатые
+    варианты .gz/.br, которые отдает config.static.PrecompressedStaticFiles.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            paths = self.optimize(paths)
+        hashed = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed.add(hashed_name)
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for name in sorted(hashed):
+            if name.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+                self.compress(name)
+
+    def optimize(self, paths):
+        """
+        Оптимизирует картинки и шрифты до хэширования: хэш в имени считается по отдаваемым байтам,
+        и смена STATIC_IMAGE_MAX_SIZE или FONT_UNICODES дает новое имя. Исходником всегда служит
+        файл из источника, а не уже обработанная копия в STATIC_ROOT.
+        """
+        paths = dict(paths)
+        for name in sorted(paths):
+            lowered = name.lower()
+            if lowered.endswith(IMAGE_EXTENSIONS):
+                optimizer = self.optimize_image
+            elif lowered.endswith(FONT_EXTENSIONS):
+                optimizer = self.subset_font
+            else:
+                continue
+            storage, path = paths[name]
+            with storage.open(path) as source:
+                original = source.read()
+            content = optimizer(original)
+            if content is not None and len(content) < len(original):
+                self.replace(name, content)
+                # Хэш и копия с хэшем в имени строятся из оптимизированного файла
+                paths[name] = (self, name)
+        return paths
+
+    def replace(self, name, content):
+        self.delete(name)
+        self._save(name, ContentFile(content))
+
+    def optimize_image(self, original):
+        image = Image.open(io.BytesIO(original))
+        image_format = image.format
+        max_size = settings.STATIC_IMAGE_MAX_SIZE
+        if max(image.size) > max_size:
+            image.thumbnail((max_size, max_size), Image.LANCZOS)
+        output = io.BytesIO()
+        if image_format == 'JPEG':
+            image.save(output, 'JPEG', quality=85, optimize=True, progressive=True)
+        else:
+            image.save(output, image_format, optimize=True)
+        return output.getvalue()
+
+    def subset_font(self, original):
+        if font_subset is None:
+            return None
+        options = font_subset.Options()
+        options.layout_features = ['*']
+        font = font_subset.load_font(io.BytesIO(original), options)
+        subsetter = font_subset.Subsetter(options)
+        subsetter.populate(unicodes=font_subset.parse_unicodes(FONT_UNICODES))
+        subsetter.subset(font)
+        output = io.BytesIO()
+        font_subset.save_font(font, output, options)
+        return output.getvalue()
+
+    def compress(self, name):
+        with self.open(name) as source:
+            content = source.read()
+        variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['.br'] = brotli.compress(content, quality=11)
+        for suffix, compressed in variants.items():
+            # Сжатый вариант имеет смысл, только если он заметно меньше оригинала
+            if len(compressed) < len(content) * 0.95:
+                self.replace(name + suffix, compressed)
+            elif self.exists(name + suffix):
+                self.delete(name + suffix)
@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+if not settings.DEBUG:
+    # Статика из STATIC_ROOT (после collectstatic) отдается до Django, со сжатыми вариантами
+    from config.static import PrecompressedStaticFiles
+
+    application = PrecompressedStaticFiles(application, settings.STATIC_ROOT, settings.STATIC_URL)
@@ -0,0 +1,107 @@
+// Автодополнение для <select data-autocomplete-url="...">.
+// Варианты подгружаются постранично с JSON-эндпоинта: {"results": [{"id", "text"}], "more": bool}.
+(function () {
+    const DEBOUNCE_MS = 250;
+
+    function initAutocomplete(select) {
+        const wrapper = document.createElement('div');
+        wrapper.className = 'autocomplete';
+        wrapper.style.position = 'relative';
+
+        const input = document.createElement('input');
+        input.type = 'text';
+        input.className = select.className;
+        input.placeholder = select.dataset.placeholder || '';
+        input.autocomplete = 'off';
+        const current = select.options[select.selectedIndex];
+        if (current && current.value) {
+            input.value = current.text;
+        }
+
+        const list = document.createElement('ul');
+        list.className = 'autocomplete-list';
+        list.style.cssText = 'position:absolute;left:0;right:0;z-index:10;max-height:240px;overflow-y:auto;' +
+            'margin:0;padding:0;list-style:none;background:#fff;border:1px solid #ddd;display:none;';
+
+        select.style.display = 'none';
+        select.parentNode.insertBefore(wrapper, select);
+        wrapper.appendChild(select);
+        wrapper.appendChild(input);
+        wrapper.appendChild(list);
+
+        let term = '';
+        let page = 1;
+        let more = false;
+        let loading = false;
+        let timer = null;
+
+        function choose(id, text) {
+            select.innerHTML = '';
+            const option = new Option(text, id, true, true);
+            select.appendChild(option);
+            input.value = id ? text : '';
+            list.style.display = 'none';
+            select.dispatchEvent(new Event('change', { bubbles: true }));
+        }
+
+        function load(reset) {
+            if (loading) return;
+            if (reset) {
+                page = 1;
+                list.innerHTML = '';
+            }
+            loading = true;
+            const url = new URL(select.dataset.autocompleteUrl, window.location.origin);
+            url.searchParams.set('q', term);
+            url.searchParams.set('page', page);
+            fetch(url, { credentials: 'same-origin', headers: { 'Accept': 'application/json' } })
+                .then(response => response.ok ? response.json() : { results: [], more: false })
+                .then(data => {
+                    data.results.forEach(item => {
+                        const li = document.createElement('li');
+                        li.textContent = item.text;
+                        li.style.cssText = 'padding:8px 10px;cursor:pointer;';
+                        li.addEventListener('mousedown', event => {
+                            event.preventDefault();
+                            choose(item.id, item.text);
+                        });
+                        list.appendChild(li);
+                    });
+                    if (!list.children.length) {
+                        const li = document.createElement('li');
+                        li.textContent = 'Ничего не найдено';
+                        li.style.cssText = 'padding:8px 10px;color:#999;';
+                        list.appendChild(li);
+                    }
+                    more = data.more;
+                    page += 1;
+                    list.style.display = 'block';
+                })
+                .finally(() => { loading = false; });
+        }
+
+        input.addEventListener('input', () => {
+            clearTimeout(timer);
+            term = input.value.trim();
+            if (!term && !select.required) {
+                choose('', '');
+            }
+            timer = setTimeout(() => load(true), DEBOUNCE_MS);
+        });
+        input.addEventListener('focus', () => load(true));
+        input.addEventListener('blur', () => {
+            list.style.display = 'none';
+            const selected = select.options[select.selectedIndex];
+            input.value = selected && selected.value ? selected.text : '';
+        });
+        list.addEventListener('scroll', () => {
+            if (more && list.scrollTop + list.clientHeight >= list.scrollHeight - 20) {
+                load(false);
+            }
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('select[data-autocomplete-url]').forEach(initAutocomplete);
+    });
+})();